@@ -1,12 +1,51 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 from jose import JWTError, jwt
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from .config import settings
 
+
+class Argon2Profile(NamedTuple):
+    memory_cost: int  # KiB
+    time_cost: int  # iterations
+    parallelism: int  # lanes
+
+
+# Named Argon2id cost profiles, weakest first
+ARGON2_PROFILES = {
+    # OWASP minimum recommendation
+    "owasp-minimum": Argon2Profile(memory_cost=19456, time_cost=2, parallelism=1),
+    # RFC 9106 low-memory profile, the argon2-cffi default
+    "rfc9106-low-memory": Argon2Profile(memory_cost=65536, time_cost=3, parallelism=4),
+    "moderate": Argon2Profile(memory_cost=131072, time_cost=3, parallelism=4),
+    "sensitive": Argon2Profile(memory_cost=262144, time_cost=4, parallelism=4),
+}
+
+
+def build_password_hasher(profile_name: str) -> PasswordHasher:
+    """Create an Argon2id hasher for a named cost profile"""
+    try:
+        profile = ARGON2_PROFILES[profile_name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown Argon2 profile {profile_name!r}, expected one of {', '.join(ARGON2_PROFILES)}"
+        )
+    return PasswordHasher(
+        time_cost=profile.time_cost,
+        memory_cost=profile.memory_cost,
+        parallelism=profile.parallelism,
+    )
+
+
 # Password hashing using Argon2
-ph = PasswordHasher()
+ph = build_password_hasher(settings.argon2_profile)
+
+
+def configure_password_hasher(profile_name: str):
+    """Switch the module-level hasher to another cost profile"""
+    global ph
+    ph = build_password_hasher(profile_name)
 
 
 def hash_password(password: str) -> str:
@@ -23,6 +62,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Check whether a hash was made with parameters other than the current profile"""
+    return ph.check_needs_rehash(hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     Create a JWT access token
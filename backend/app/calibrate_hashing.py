@@ -0,0 +1,72 @@
+"""Argon2 calibration script
+
+Measures password hashing latency for every cost profile on this host and
+recommends the strongest profile whose p95 stays under a target.
+
+Usage:
+    # Pick the strongest profile with p95 under 250 ms
+    uv run python -m app.calibrate_hashing
+
+    # Custom target and sample count
+    uv run python -m app.calibrate_hashing --target-p95-ms 100 --samples 50
+"""
+
+import argparse
+import os
+import time
+from typing import List
+from .auth import ARGON2_PROFILES, build_password_hasher
+
+
+def measure_profile(profile_name: str, samples: int) -> List[float]:
+    """Hash a password `samples` times with the profile and return latencies in ms"""
+    hasher = build_password_hasher(profile_name)
+    hasher.hash("calibration-warmup")
+
+    latencies = []
+    for i in range(samples):
+        started = time.perf_counter()
+        hasher.hash(f"calibration-password-{i}")
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def p95(latencies: List[float]) -> float:
+    ordered = sorted(latencies)
+    return ordered[max(0, round(0.95 * len(ordered)) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the Argon2 cost profile for this host")
+    parser.add_argument("--target-p95-ms", type=float, default=250.0, help="Latency budget for one hash")
+    parser.add_argument("--samples", type=int, default=20, help="Hashes to time per profile")
+    args = parser.parse_args()
+
+    print(f"Measuring {args.samples} hashes per profile on {os.cpu_count()} CPUs...")
+    print(f"{'profile':<20} {'memory':>9} {'time':>5} {'lanes':>5} {'p95':>10} {'hashes/s/core':>14}")
+
+    chosen = None
+    for name, profile in ARGON2_PROFILES.items():
+        latencies = measure_profile(name, args.samples)
+        profile_p95 = p95(latencies)
+        mean = sum(latencies) / len(latencies)
+        print(
+            f"{name:<20} {profile.memory_cost // 1024:>6} MiB {profile.time_cost:>5} "
+            f"{profile.parallelism:>5} {profile_p95:>7.1f} ms {1000 / mean:>14.1f}"
+        )
+        if profile_p95 <= args.target_p95_ms:
+            chosen = name
+        else:
+            # Profiles are ordered weakest first, so nothing stronger will fit
+            break
+
+    if chosen is None:
+        print(f"✗ No profile hashes under {args.target_p95_ms:.0f} ms p95 on this host")
+        raise SystemExit(1)
+
+    print(f"✓ Strongest profile under {args.target_p95_ms:.0f} ms p95: {chosen}")
+    print(f"  Set ARGON2_PROFILE={chosen} to use it")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import ConfigDict
 
@@ -12,6 +13,68 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_days: int = 7
     
+    # Authenticated principal cache
+    principal_cache_max_size: int = 10000
+    principal_cache_ttl_seconds: float = 60.0
+    
+    # Leaderboard
+    leaderboard_cache_size: int = 100  # entries kept per mode, at least 100
+    leaderboard_stream_buffer_size: int = 1000  # rank events kept for Last-Event-ID resume
+    # Reject submissions without a replay to verify. The web client sends
+    # none yet, so its players cannot submit while this is on
+    leaderboard_require_replay: bool = False
+    
+    # Replay verification: pending entries are played back in batches in a
+    # worker pool and accepted or rejected
+    replay_verifier_executor: str = "process"  # "process" or "thread"
+    replay_verifier_workers: Optional[int] = None  # defaults to the CPU count
+    replay_verifier_batch_size: int = 4096  # pending entries claimed at once
+    replay_verifier_batch_moves: int = 20_000_000  # and moves in all, bounding a batch's memory
+    replay_verifier_chunk_size: int = 1024  # replays simulated together in a worker
+    replay_verifier_interval_seconds: float = 1.0
+    replay_verifier_lease_seconds: float = 300.0  # before entries claimed by a dead verifier are claimed again
+    # Accepted replays, encoded, in append-only segment files
+    replay_archive_dir: str = "./replays"
+    replay_archive_segment_bytes: int = 64 * 1024 * 1024
+    replay_archive_refresh_seconds: float = 1.0  # least time between index reads on a miss
+    
+    # Leaderboard write-behind: acknowledge submissions once spilled to disk
+    # and write them in batches (off: each submission commits on its own)
+    leaderboard_write_behind: bool = False
+    leaderboard_write_behind_flush_ms: int = 50
+    leaderboard_write_behind_batch_size: int = 500
+    leaderboard_write_behind_max_pending: int = 100_000  # submissions refused with 503 beyond this
+    leaderboard_write_behind_spill_dir: str = "./write_behind"
+    
+    # Live game sessions: seconds between checkpoints of live scores
+    live_session_checkpoint_seconds: float = 5.0
+    # Active sessions without a score update for this long are ended
+    session_idle_timeout_seconds: float = 300.0
+    session_reaper_interval_seconds: float = 60.0
+    # Milliseconds between applying the scores coalesced on a binary ingest channel
+    session_ingest_flush_ms: int = 50
+    # Ticks between keyframes of a game relayed to spectators, and the most
+    # moves a player may send in one message
+    session_relay_keyframe_ticks: int = 100
+    # Bot opponents: games at once, and milliseconds their decisions are
+    # gathered for before being computed in one batch
+    bot_opponent_max_games: int = 1024
+    bot_opponent_batch_ms: float = 10.0
+    
+    # Event bus between workers: "memory" (one worker), "unix" (several
+    # workers on one host) or "postgres" (LISTEN/NOTIFY on the database)
+    event_bus: str = "memory"
+    event_bus_socket_dir: str = "/tmp/snake-arena-events"
+    event_bus_channel: str = "snake_arena_events"
+    
+    # Password hashing (profiles are defined in app/auth.py)
+    argon2_profile: str = "rfc9106-low-memory"
+    
+    # Password hashing worker pool
+    password_hash_executor: str = "process"  # "process" or "thread"
+    password_hash_workers: Optional[int] = None  # defaults to the CPU count
+    password_hash_max_pending: int = 64  # queued + running jobs before 503
+    
     model_config = ConfigDict(
         env_file=".env",
         case_sensitive=False
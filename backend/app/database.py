@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
 
@@ -15,6 +17,34 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def get_async_database_url(database_url: str) -> str:
+    """
+    Translate a sync database URL into its asyncio driver equivalent.
+
+    postgresql:// (and postgresql+psycopg2://) becomes postgresql+asyncpg://,
+    sqlite:// becomes sqlite+aiosqlite://. Other URLs are returned unchanged.
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    elif backend == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
+
+# Create async engine used by the API routers
+async_engine = create_async_engine(get_async_database_url(settings.database_url))
+
+# Create AsyncSessionLocal class
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
 def get_db():
     """
     Dependency to get database session.
@@ -27,6 +57,15 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Dependency to get an async database session.
+    Usage in FastAPI endpoints: db: AsyncSession = Depends(get_async_db)
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Initialize database - create all tables"""
     Base.metadata.create_all(bind=engine)
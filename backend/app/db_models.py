@@ -1,9 +1,9 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Enum as SQLEnum, Index
+from sqlalchemy import BigInteger, Column, String, Integer, Boolean, DateTime, ForeignKey, Enum as SQLEnum, Index, Text, desc
 from sqlalchemy.sql import func
 from datetime import datetime
 import uuid
 from .database import Base
-from .models import GameMode
+from .models import EntryStatus, GameMode, LeaderboardWindow
 
 
 def generate_uuid():
@@ -39,11 +39,18 @@ class DBLeaderboardEntry(Base):
     score = Column(Integer, nullable=False)
     mode = Column(SQLEnum(GameMode), nullable=False)
     timestamp = Column(DateTime, default=func.now(), nullable=False)
+    status = Column(SQLEnum(EntryStatus), default=EntryStatus.ACCEPTED, nullable=False)
+    claimed_at = Column(DateTime, nullable=True)  # when a verifier claimed it, if verifying
     
-    # Indexes for common queries
+    # Indexes for common queries; the rank indexes match the leaderboard
+    # order (score DESC, timestamp, id) and back keyset pagination. Reads
+    # only see accepted entries, so every index but the per-user one leads
+    # with status; (status, timestamp) also finds the oldest pending ones.
     __table_args__ = (
-        Index('idx_leaderboard_mode_score', 'mode', 'score'),
-        Index('idx_leaderboard_timestamp', 'timestamp'),
+        Index('idx_leaderboard_status_mode_rank', 'status', 'mode', desc('score'), 'timestamp', 'id'),
+        Index('idx_leaderboard_status_rank', 'status', desc('score'), 'timestamp', 'id'),
+        Index('idx_leaderboard_status_timestamp', 'status', 'timestamp'),
+        Index('idx_leaderboard_user_mode_score', 'user_id', 'mode', 'score'),
     )
     
     def to_dict(self):
@@ -56,6 +63,79 @@ class DBLeaderboardEntry(Base):
         }
 
 
+class DBLeaderboardReplay(Base):
+    """Seed and move log a leaderboard entry was submitted with"""
+    __tablename__ = "leaderboard_replays"
+    
+    entry_id = Column(String, ForeignKey("leaderboard_entries.id", ondelete="CASCADE"), primary_key=True)
+    seed = Column(BigInteger, nullable=False)  # unsigned 32-bit
+    moves = Column(Text, nullable=False)
+
+
+class DBUserBestScore(Base):
+    """Best leaderboard entry per user and mode, maintained by submit_score"""
+    __tablename__ = "user_best_scores"
+    
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    mode = Column(SQLEnum(GameMode), primary_key=True)
+    score = Column(Integer, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    entry_id = Column(String, nullable=False)
+    username = Column(String, nullable=False)  # Denormalized for performance
+    
+    # Same leaderboard order as leaderboard_entries, with the entry id as tiebreak
+    __table_args__ = (
+        Index('idx_user_best_mode_rank', 'mode', desc('score'), 'timestamp', 'entry_id'),
+        Index('idx_user_best_rank', desc('score'), 'timestamp', 'entry_id'),
+    )
+    
+    def to_dict(self):
+        return {
+            "id": self.entry_id,
+            "username": self.username,
+            "score": self.score,
+            "mode": self.mode.value,
+            "timestamp": self.timestamp.isoformat()
+        }
+
+
+class DBLeaderboardWindowSummary(Base):
+    """Top entries of a finished day/week/month window, kept after it rolls over"""
+    __tablename__ = "leaderboard_window_summaries"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    time_window = Column(SQLEnum(LeaderboardWindow), nullable=False)
+    period_start = Column(DateTime, nullable=False)
+    mode = Column(SQLEnum(GameMode), nullable=True)  # NULL for the board across all modes
+    rank = Column(Integer, nullable=False)
+    entry_id = Column(String, nullable=False)
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    username = Column(String, nullable=False)
+    score = Column(Integer, nullable=False)
+    entry_mode = Column(SQLEnum(GameMode), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    
+    # One row per rank of each board, so a period compacted twice at once
+    # keeps one copy; NULLs never conflict, hence the partial index for the
+    # board across all modes
+    __table_args__ = (
+        Index('uq_window_summary_rank', 'time_window', 'period_start', 'mode', 'rank', unique=True),
+        Index(
+            'uq_window_summary_all_modes_rank', 'time_window', 'period_start', 'rank', unique=True,
+            postgresql_where=mode.is_(None), sqlite_where=mode.is_(None)
+        ),
+    )
+    
+    def to_dict(self):
+        return {
+            "id": self.entry_id,
+            "username": self.username,
+            "score": self.score,
+            "mode": self.entry_mode.value,
+            "timestamp": self.timestamp.isoformat()
+        }
+
+
 class DBGameSession(Base):
     __tablename__ = "game_sessions"
     
@@ -64,10 +144,20 @@ class DBGameSession(Base):
     username = Column(String, nullable=False)  # Denormalized for performance
     score = Column(Integer, default=0, nullable=False)
     mode = Column(SQLEnum(GameMode), nullable=False)
-    is_active = Column(Boolean, default=True, nullable=False, index=True)
+    is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
     
+    __table_args__ = (
+        # Active session listing: by mode, best score first
+        Index('idx_game_sessions_active_mode_score', 'is_active', 'mode', desc('score'), 'id'),
+        # Partial: only active sessions are candidates for the idle reaper
+        Index(
+            'idx_game_sessions_active_updated', updated_at,
+            postgresql_where=(is_active == True), sqlite_where=(is_active == True)
+        ),
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
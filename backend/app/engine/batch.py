@@ -0,0 +1,241 @@
+"""Many replays at once, vectorised with NumPy
+
+BatchGame holds N games as arrays and steps any subset of them a tick at
+a time. simulate_batch() plays N replays on one in lockstep: each tick is
+a fixed number of array operations over the replays still running, so
+the interpreter cost of a tick is shared by all of them. The rules, and
+the results, are exactly those of simulator.simulate; the tests hold the
+two together.
+
+Lockstep pays for the longest replay in a batch, so verify_replays()
+sorts by length and runs chunks of similar length, and plays chunks too
+small to amortise the array overhead one by one instead.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from ..models import GameMode
+from .rng import MASK
+from .simulator import (
+    CELLS, GRID_SIZE, INITIAL_BODY, MOVE_KEYS, NO_MOVE, POINTS_PER_FOOD, RIGHT,
+    InvalidReplay, SimulationResult, _STEPS, simulate, validate_moves
+)
+
+# Batches smaller than this run through the scalar simulator, which is
+# faster than a tick of array operations over fewer replays than this
+MIN_VECTOR_BATCH = 128
+
+# Move codes: directions 0-3, then
+_NONE = 4
+_END = 5  # past the end of a shorter log
+
+_CODES = np.full(256, 255, dtype=np.uint8)
+for _key, _direction in MOVE_KEYS.items():
+    _CODES[ord(_key)] = _direction
+_CODES[ord(NO_MOVE)] = _NONE
+
+# [mode, direction, cell] -> next cell, -1 for a wall
+_MODES = (GameMode.WALLS, GameMode.PASS_THROUGH)
+_STEP_TABLE = np.array([_STEPS[mode] for mode in _MODES], dtype=np.int16)
+
+# (seed, moves, mode)
+Replay = Tuple[int, str, GameMode]
+
+
+def _next_u32(state: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mulberry32 over arrays of uint32 states: (new states, outputs)"""
+    a = state + np.uint32(0x6D2B79F5)
+    t = (a ^ (a >> 15)) * (a | 1)
+    t = (t + (t ^ (t >> 7)) * (t | 61)) ^ t
+    return a, t ^ (t >> 14)
+
+
+def _draw_cells(rng: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """One (x, y) draw per row, as a cell index, advancing those rows' generators"""
+    rng[rows], x = _next_u32(rng[rows])
+    rng[rows], y = _next_u32(rng[rows])
+    x = (x.astype(np.uint64) * GRID_SIZE) >> 32
+    y = (y.astype(np.uint64) * GRID_SIZE) >> 32
+    return (y * GRID_SIZE + x).astype(np.int16)
+
+
+def _place_food(rng: np.ndarray, occupied: np.ndarray, food: np.ndarray, rows: np.ndarray):
+    """Rejection-sample new food for `rows` until each lands on a free cell"""
+    while rows.size:
+        cells = _draw_cells(rng, rows)
+        free = ~occupied[rows, cells]
+        food[rows[free]] = cells[free]
+        rows = rows[~free]
+
+
+class BatchGame:
+    """
+    Games advanced in lockstep, one tick per step() over any subset of them.
+
+    Board state is kept in arrays with one row per game: the body as a
+    ring buffer of cells, an occupancy grid, and the head, direction,
+    food, score and generator state, so each step is a fixed number of
+    array operations however many games it moves.
+    """
+
+    def __init__(self, seeds: Sequence[int], modes: Sequence[GameMode]):
+        n = len(seeds)
+        self.size = n
+        self.mode = np.zeros(n, dtype=np.int64)
+        self.rng = np.zeros(n, dtype=np.uint32)
+        self.body = np.zeros((n, CELLS), dtype=np.int16)
+        self.tail = np.zeros(n, dtype=np.int64)
+        self.head = np.zeros(n, dtype=np.int64)
+        self.length = np.zeros(n, dtype=np.int64)
+        self.head_cell = np.zeros(n, dtype=np.int64)
+        self.occupied = np.zeros((n, CELLS), dtype=bool)
+        self.direction = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.food = np.zeros(n, dtype=np.int16)
+        self.restart(np.arange(n), seeds, modes)
+
+    def restart(self, rows: np.ndarray, seeds: Sequence[int], modes: Sequence[GameMode]):
+        """Start new games in `rows`, one per seed and mode"""
+        self.mode[rows] = [_MODES.index(GameMode(mode)) for mode in modes]
+        self.rng[rows] = [seed & MASK for seed in seeds]
+        self.body[rows, :3] = INITIAL_BODY
+        self.tail[rows] = 0
+        self.head[rows] = 2
+        self.length[rows] = 3
+        self.head_cell[rows] = INITIAL_BODY[-1]
+        self.occupied[rows] = False
+        self.occupied[np.ix_(rows, list(INITIAL_BODY))] = True
+        self.direction[rows] = RIGHT
+        self.score[rows] = 0
+        self.ticks[rows] = 0
+        self.game_over[rows] = False
+
+        # The first food only avoids the head
+        pending = np.asarray(rows)
+        while pending.size:
+            cells = _draw_cells(self.rng, pending)
+            free = cells != self.head_cell[pending]
+            self.food[pending[free]] = cells[free]
+            pending = pending[~free]
+
+    def next_cells(self, rows: np.ndarray) -> np.ndarray:
+        """(rows, 4): the cell each direction leads the head of those games to, -1 for a wall"""
+        return _STEP_TABLE[self.mode[rows], :, self.head_cell[rows]].astype(np.int64)
+
+    def step(self, rows: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Play one tick of the games `rows`, none of them over, with move
+        codes (a direction, or 4 for none); returns which of them ended.
+        """
+        stepped = rows
+        self.ticks[rows] += 1
+        direction_now = self.direction[rows]
+        turn = (codes < _NONE) & (codes != (direction_now + 2) % 4)
+        if turn.any():
+            direction_now[turn] = codes[turn]
+            self.direction[rows] = direction_now
+
+        ended = np.zeros(rows.size, dtype=bool)
+        step = _STEP_TABLE[self.mode[rows], direction_now, self.head_cell[rows]].astype(np.int64)
+        crashed = (step < 0) | self.occupied[rows, step]  # -1 reads the last cell; masked by step < 0
+        if crashed.any():
+            ended[crashed] = True
+            self.game_over[rows[crashed]] = True
+            rows, step = rows[~crashed], step[~crashed]
+
+        head_now = self.head[rows] + 1
+        head_now[head_now == CELLS] = 0
+        self.head[rows] = head_now
+        self.body[rows, head_now] = step
+        self.head_cell[rows] = step
+        self.occupied[rows, step] = True
+
+        ate = step == self.food[rows]
+        if ate.any():
+            grow, move = rows[ate], rows[~ate]
+            self.score[grow] += POINTS_PER_FOOD
+            self.length[grow] += 1
+        else:
+            grow, move = rows[:0], rows
+        tail_now = self.tail[move]
+        self.occupied[move, self.body[move, tail_now]] = False
+        tail_now += 1
+        tail_now[tail_now == CELLS] = 0
+        self.tail[move] = tail_now
+
+        if grow.size:
+            full = self.length[grow] == CELLS
+            if full.any():
+                # Nowhere left for food: the board is won
+                self.game_over[grow[full]] = True
+                ended[np.isin(stepped, grow[full])] = True
+            _place_food(self.rng, self.occupied, self.food, grow[~full])
+        return ended
+
+
+def simulate_batch(replays: Sequence[Replay]) -> List[Optional[SimulationResult]]:
+    """Play replays together; None for each that simulate() would reject"""
+    n = len(replays)
+    results: List[Optional[SimulationResult]] = [None] * n
+    valid = []
+    for i, (_, moves, _) in enumerate(replays):
+        try:
+            validate_moves(moves)
+            valid.append(i)
+        except InvalidReplay:
+            pass
+    if not valid:
+        return results
+
+    n = len(valid)
+    lengths = np.array([len(replays[i][1]) for i in valid], dtype=np.int64)
+    width = int(lengths.max())
+    moves = np.full((n, width), _END, dtype=np.uint8)
+    for row, i in enumerate(valid):
+        log = replays[i][1]
+        if log:
+            moves[row, :len(log)] = _CODES[np.frombuffer(log.encode("ascii"), dtype=np.uint8)]
+    game = BatchGame([replays[i][0] for i in valid], [replays[i][2] for i in valid])
+    rejected = np.zeros(n, dtype=bool)
+
+    # Only the games still running are stepped; the running set is
+    # narrowed when some of them stop
+    running = np.arange(n)[lengths > 0]
+    for tick in range(width):
+        if not running.size:
+            break
+        code = moves[running, tick]
+        stopped = code == _END
+        if stopped.any():
+            running, code = running[~stopped], code[~stopped]
+        ended = game.step(running, code)
+        if ended.any():
+            finished = running[ended]
+            # A log must stop when its game does
+            rejected[finished[lengths[finished] != tick + 1]] = True
+            running = running[~ended]
+
+    for row, i in enumerate(valid):
+        if not rejected[row]:
+            results[i] = SimulationResult(int(game.score[row]), int(game.ticks[row]), bool(game.game_over[row]))
+    return results
+
+
+def verify_replays(replays: Sequence[Replay], chunk_size: int = 1024) -> List[Optional[SimulationResult]]:
+    """simulate_batch over chunks of replays of similar length"""
+    order = sorted(range(len(replays)), key=lambda i: len(replays[i][1]))
+    results: List[Optional[SimulationResult]] = [None] * len(replays)
+    for start in range(0, len(order), chunk_size):
+        chunk = order[start:start + chunk_size]
+        if len(chunk) < MIN_VECTOR_BATCH:
+            for i in chunk:
+                try:
+                    results[i] = simulate(*replays[i])
+                except InvalidReplay:
+                    pass
+        else:
+            for i, result in zip(chunk, simulate_batch([replays[i] for i in chunk])):
+                results[i] = result
+    return results
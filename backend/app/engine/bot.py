@@ -0,0 +1,133 @@
+"""A bot player for many games at once, on bitboards
+
+choose_moves() decides the next move of any number of BatchGame games in
+one call. Each board is a bitboard of GRID_SIZE rows of GRID_SIZE bits,
+one uint32 per row, so the boards of a batch are a single (games, rows)
+array. A flood fill step is then a handful of shifts and ORs over that
+array: shifting each row left and right, and the rows up and down.
+Boards in pass-through mode wrap around the edges, and boards in walls
+mode don't. The cost of a step is shared by every board in the batch.
+
+For each move that does not crash straight away, the bot finds:
+- the room it leads to: how many cells a flood fill from there reaches
+- its distance to the food: the BFS layer, grown from the food, that
+  reaches it
+
+The bot prefers moves into room enough for the whole snake. Among those
+it takes the one closest to the food. When it cannot reach the food, it
+takes the one with the most room. The body is counted as fixed for the
+search, although its tail will have moved by then, so the bot plays
+safe.
+"""
+
+import numpy as np
+from .batch import BatchGame, _MODES
+from .simulator import CELLS, GRID_SIZE
+from ..models import GameMode
+
+_FULL = np.uint32((1 << GRID_SIZE) - 1)
+# Bit x of a row is the cell in column x
+_WEIGHTS = (1 << np.arange(GRID_SIZE)).astype(np.uint32)
+_PASS_THROUGH = _MODES.index(GameMode.PASS_THROUGH)
+
+
+def _bitboards(cells: np.ndarray) -> np.ndarray:
+    """(boards, CELLS) booleans to (boards, GRID_SIZE) bitboards"""
+    return cells.reshape(-1, GRID_SIZE, GRID_SIZE).astype(np.uint32) @ _WEIGHTS
+
+
+def _spread(boards: np.ndarray, wrap: np.ndarray) -> np.ndarray:
+    """
+    The cells of `boards` and their neighbours. `wrap` is _FULL for the
+    boards whose edges wrap around, 0 for the others, shaped (boards, 1).
+    """
+    spread = boards | ((boards << 1) & _FULL) | (boards >> 1)
+    spread |= ((boards >> (GRID_SIZE - 1)) | (boards << (GRID_SIZE - 1))) & wrap
+    spread[:, 1:] |= boards[:, :-1]
+    spread[:, :-1] |= boards[:, 1:]
+    spread[:, 0] |= boards[:, -1] & wrap[:, 0]
+    spread[:, -1] |= boards[:, 0] & wrap[:, 0]
+    return spread
+
+
+def _has(boards: np.ndarray, cells: np.ndarray) -> np.ndarray:
+    """Whether each board has each of its cells; `cells` is (boards, k)"""
+    rows = np.arange(boards.shape[0])[:, None]
+    return (boards[rows, cells // GRID_SIZE] >> (cells % GRID_SIZE).astype(np.uint32)) & 1 == 1
+
+
+def flood(seeds: np.ndarray, free: np.ndarray, wrap: np.ndarray) -> np.ndarray:
+    """The cells of `free` connected to the cells of `seeds`, per board"""
+    reached = seeds & free
+    # Only boards still growing are spread again
+    active = np.arange(reached.shape[0])
+    while active.size:
+        grown = _spread(reached[active], wrap[active]) & free[active]
+        growing = (grown != reached[active]).any(axis=1)
+        reached[active] = grown
+        active = active[growing]
+    return reached
+
+
+def food_distances(game: BatchGame, rows: np.ndarray, cells: np.ndarray, todo: np.ndarray,
+                   free: np.ndarray, wrap: np.ndarray) -> np.ndarray:
+    """
+    Moves from the food to each of `cells` over free cells, for the `todo`
+    ones, by BFS layers grown from the food; CELLS where it cannot reach.
+    """
+    n = rows.size
+    food = np.zeros((n, GRID_SIZE), dtype=np.uint32)
+    food_cells = game.food[rows].astype(np.int64)
+    food[np.arange(n), food_cells // GRID_SIZE] = _WEIGHTS[food_cells % GRID_SIZE]
+    distances = np.full(cells.shape, CELLS, dtype=np.int64)
+    todo = todo.copy()
+    reached = food
+    active = np.arange(n)
+    layer = 0
+    while active.size:
+        hit = todo[active] & _has(reached[active], cells[active])
+        distances[active] = np.where(hit, layer, distances[active])
+        todo[active] &= ~hit
+        grown = _spread(reached[active], wrap[active]) & free[active]
+        # Boards stop once every cell is found, or the food's region is
+        keep = todo[active].any(axis=1) & (grown != reached[active]).any(axis=1)
+        reached[active] = grown
+        active = active[keep]
+        layer += 1
+    return distances
+
+
+def choose_moves(game: BatchGame, rows: np.ndarray) -> np.ndarray:
+    """The bot's next move in each of the games `rows`, as direction codes"""
+    n = rows.size
+    index = np.arange(n)
+    occupied = game.occupied[rows]
+    free = ~_bitboards(occupied) & _FULL
+    wrap = np.where(game.mode[rows] == _PASS_THROUGH, _FULL, np.uint32(0))[:, None]
+
+    targets = game.next_cells(rows)
+    cells = np.maximum(targets, 0)
+    safe = (targets >= 0) & ~occupied[index[:, None], cells]
+    # Pressing the reverse direction is ignored, so it is not a move of its own
+    direction = game.direction[rows]
+    safe[index, (direction + 2) % 4] = False
+
+    # A flood fill from every safe move, the four of each board stacked
+    room = np.zeros((n, 4), dtype=np.int64)
+    board, move = np.nonzero(safe)
+    if board.size:
+        seeds = np.zeros((board.size, GRID_SIZE), dtype=np.uint32)
+        target = cells[board, move]
+        seeds[np.arange(board.size), target // GRID_SIZE] = _WEIGHTS[target % GRID_SIZE]
+        reached = flood(seeds, free[board], wrap[board])
+        room[board, move] = np.bitwise_count(reached).sum(axis=1)
+    roomy = safe & (room >= game.length[rows][:, None])
+
+    distances = food_distances(game, rows, cells, safe, free, wrap)
+    reachable = distances < CELLS
+    straight = np.arange(4) == direction[:, None]
+
+    # Lexicographic: safe, roomy, food reachable, nearer food, more room, straight on
+    key = (safe.astype(np.int64) << 22) | (roomy.astype(np.int64) << 21) | (reachable.astype(np.int64) << 20)
+    key |= (CELLS - distances) << 10 | room << 1 | straight
+    return np.argmax(key, axis=1)
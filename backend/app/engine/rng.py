@@ -0,0 +1,31 @@
+"""Seeded random numbers shared with the game client
+
+Mulberry32: 32 bits of state, and small enough to port exactly to
+JavaScript, where it reads
+
+    a = (a + 0x6D2B79F5) | 0
+    t = Math.imul(a ^ (a >>> 15), 1 | a)
+    t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t
+    return (t ^ (t >>> 14)) >>> 0
+
+Every operation is done modulo 2**32 here to give the same sequence.
+"""
+
+MASK = 0xFFFFFFFF
+
+
+class Mulberry32:
+    __slots__ = ("state",)
+
+    def __init__(self, seed: int):
+        self.state = seed & MASK
+
+    def next_u32(self) -> int:
+        self.state = a = (self.state + 0x6D2B79F5) & MASK
+        t = ((a ^ (a >> 15)) * (a | 1)) & MASK
+        t = ((t + (((t ^ (t >> 7)) * (t | 61)) & MASK)) & MASK) ^ t
+        return t ^ (t >> 14)
+
+    def below(self, n: int) -> int:
+        """Math.floor(random() * n) in the client, where random() = next_u32() / 2**32"""
+        return (self.next_u32() * n) >> 32
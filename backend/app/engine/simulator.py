@@ -0,0 +1,220 @@
+"""Authoritative replay of a game, by the server's rules
+
+The rules follow moveSnake() in frontend/src/lib/gameLogic.ts, but a game
+must be reproducible from its seed and its moves. A replay is the seed of
+the food generator plus a move log with one character per tick: "U", "R",
+"D" or "L" for the direction the head moves in on that tick if it turned,
+"." if it kept its direction. So the log holds the direction resolved for
+each tick, however many keys were pressed since the previous one. The
+reverse of the direction the head last moved in is ignored. Each tick the
+head moves one cell; in walls mode leaving the grid ends the game, in
+pass-through mode the head wraps around. Running into any part of the
+snake, tail included, ends the game. Eating food scores 10, grows the
+snake by keeping its tail, and places new food at the first free cell
+drawn as (x, y) = (below(20), below(20)) from the seeded generator. The
+first food only avoids the head, as in the client.
+
+The web client does not play by these rules yet. It applies every key
+pressed within a tick, each checked against the one before rather than
+against the direction last moved in, so two quick keys can reverse the
+snake into itself. generateFood() draws from the unseeded Math.random,
+and submitScore() sends no move log. Its scores cannot be verified, so
+LEADERBOARD_REQUIRE_REPLAY must stay off until the client resolves one
+direction per tick, places food with Mulberry32 (app/engine/rng.py) and
+sends the log with the score.
+
+The board is a bit-packed occupancy grid (one int, one bit per cell) and
+the body a ring buffer of cell indexes, so a tick is a table lookup, a bit
+test and a few index updates, with nothing allocated per move.
+"""
+
+from collections import deque
+from typing import List, NamedTuple, Tuple
+from ..models import GameMode
+from .rng import Mulberry32
+
+GRID_SIZE = 20
+CELLS = GRID_SIZE * GRID_SIZE
+POINTS_PER_FOOD = 10
+
+# Directions, clockwise so that the reverse of d is (d + 2) % 4
+UP, RIGHT, DOWN, LEFT = range(4)
+MOVE_KEYS = {"U": UP, "R": RIGHT, "D": DOWN, "L": LEFT}
+NO_MOVE = "."
+
+# A log longer than this is rejected without being simulated
+MAX_MOVES = 100_000
+
+
+class InvalidReplay(ValueError):
+    """A move log that cannot come from a game played by the rules"""
+
+
+class SimulationResult(NamedTuple):
+    score: int
+    ticks: int
+    game_over: bool
+
+
+def cell(x: int, y: int) -> int:
+    return y * GRID_SIZE + x
+
+
+def _step_tables(wrap: bool) -> Tuple[List[int], ...]:
+    """Per direction, the cell each cell leads to, or -1 for a wall"""
+    offsets = {UP: (0, -1), RIGHT: (1, 0), DOWN: (0, 1), LEFT: (-1, 0)}
+    tables = []
+    for direction in range(4):
+        dx, dy = offsets[direction]
+        table = []
+        for index in range(CELLS):
+            x, y = index % GRID_SIZE + dx, index // GRID_SIZE + dy
+            if wrap:
+                table.append(cell(x % GRID_SIZE, y % GRID_SIZE))
+            elif 0 <= x < GRID_SIZE and 0 <= y < GRID_SIZE:
+                table.append(cell(x, y))
+            else:
+                table.append(-1)
+        tables.append(table)
+    return tuple(tables)
+
+
+_STEPS = {GameMode.WALLS: _step_tables(wrap=False), GameMode.PASS_THROUGH: _step_tables(wrap=True)}
+
+_CENTER = GRID_SIZE // 2
+# Tail first, as stored in the ring buffer
+INITIAL_BODY = (cell(_CENTER - 2, _CENTER), cell(_CENTER - 1, _CENTER), cell(_CENTER, _CENTER))
+
+
+def _place_food(rng: Mulberry32, occupied: int) -> int:
+    while True:
+        x = rng.below(GRID_SIZE)
+        food = cell(x, rng.below(GRID_SIZE))
+        if not occupied >> food & 1:
+            return food
+
+
+_VALID_KEYS = frozenset(MOVE_KEYS) | {NO_MOVE}
+
+
+def validate_moves(moves: str):
+    """Raise InvalidReplay unless a log is short enough and only has known moves"""
+    if len(moves) > MAX_MOVES:
+        raise InvalidReplay(f"More than {MAX_MOVES} moves")
+    unknown = set(moves) - _VALID_KEYS
+    if unknown:
+        raise InvalidReplay(f"Unknown moves {''.join(sorted(unknown))!r}")
+
+
+def simulate(seed: int, moves: str, mode: GameMode) -> SimulationResult:
+    """
+    Play a move log through; raises InvalidReplay if it has unknown moves,
+    is longer than MAX_MOVES or continues after the game ended.
+    """
+    validate_moves(moves)
+    steps = _STEPS[mode]
+    rng = Mulberry32(seed)
+
+    body = [0] * CELLS
+    body[:3] = INITIAL_BODY
+    tail, head, length = 0, 2, 3
+    head_cell = INITIAL_BODY[-1]
+    occupied = 0
+    for index in INITIAL_BODY:
+        occupied |= 1 << index
+    food = _place_food(rng, 1 << head_cell)
+    direction = RIGHT
+    score = 0
+
+    last = len(moves) - 1
+    for tick, key in enumerate(moves):
+        if key != NO_MOVE:
+            pressed = MOVE_KEYS[key]
+            if pressed != (direction + 2) % 4:
+                direction = pressed
+
+        head_cell = steps[direction][head_cell]
+        if head_cell < 0 or occupied >> head_cell & 1:
+            if tick != last:
+                raise InvalidReplay(f"Moves after the game ended at tick {tick}")
+            return SimulationResult(score, tick + 1, True)
+
+        head = head + 1 if head + 1 < CELLS else 0
+        body[head] = head_cell
+        occupied |= 1 << head_cell
+        if head_cell == food:
+            score += POINTS_PER_FOOD
+            length += 1
+            if length == CELLS:
+                # Nowhere left for food: the board is won
+                if tick != last:
+                    raise InvalidReplay(f"Moves after the game ended at tick {tick}")
+                return SimulationResult(score, tick + 1, True)
+            food = _place_food(rng, occupied)
+        else:
+            occupied ^= 1 << body[tail]
+            tail = tail + 1 if tail + 1 < CELLS else 0
+
+    return SimulationResult(score, len(moves), False)
+
+
+class Game:
+    """
+    A game advanced one tick at a time, by the same rules as simulate(),
+    for following a live game. state() is everything needed to carry on
+    from the current tick: the body (tail first), direction, food, score
+    and the generator's state.
+    """
+
+    def __init__(self, seed: int, mode: GameMode):
+        self.mode = GameMode(mode)
+        self._steps = _STEPS[self.mode]
+        self.rng = Mulberry32(seed)
+        self.body = deque(INITIAL_BODY)
+        self.occupied = 0
+        for index in INITIAL_BODY:
+            self.occupied |= 1 << index
+        self.food = _place_food(self.rng, 1 << INITIAL_BODY[-1])
+        self.direction = RIGHT
+        self.score = 0
+        self.tick = 0
+        self.game_over = False
+
+    def step(self, key: str):
+        """Play one tick; raises InvalidReplay for an unknown move or once the game is over"""
+        if self.game_over:
+            raise InvalidReplay(f"Moves after the game ended at tick {self.tick - 1}")
+        if key != NO_MOVE:
+            if key not in MOVE_KEYS:
+                raise InvalidReplay(f"Unknown move {key!r}")
+            pressed = MOVE_KEYS[key]
+            if pressed != (self.direction + 2) % 4:
+                self.direction = pressed
+        self.tick += 1
+
+        head = self._steps[self.direction][self.body[-1]]
+        if head < 0 or self.occupied >> head & 1:
+            self.game_over = True
+            return
+        self.body.append(head)
+        self.occupied |= 1 << head
+        if head == self.food:
+            self.score += POINTS_PER_FOOD
+            if len(self.body) == CELLS:
+                self.game_over = True
+                return
+            self.food = _place_food(self.rng, self.occupied)
+        else:
+            self.occupied ^= 1 << self.body.popleft()
+
+    def state(self) -> dict:
+        return {
+            "tick": self.tick,
+            "mode": self.mode.value,
+            "body": list(self.body),
+            "direction": self.direction,
+            "food": self.food,
+            "score": self.score,
+            "rng": self.rng.state,
+            "gameOver": self.game_over,
+        }
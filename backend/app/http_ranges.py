@@ -0,0 +1,44 @@
+"""HTTP Range requests (RFC 9110, section 14) over a body of known length
+
+Only single ranges of bytes are served: "bytes=first-last", "bytes=first-"
+or "bytes=-suffix". A header asking for several ranges, or for another
+unit, is ignored and the whole body sent, as the RFC allows.
+"""
+
+from typing import Optional, Tuple
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a range starts past the end of the body"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """The [start, end) slice a Range header asks for, or None for the whole body"""
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - suffix), size
+        start = int(first)
+        end = int(last) + 1 if last else max(size, start + 1)
+    except ValueError:
+        return None
+    if start < 0 or end <= start:
+        # Invalid, so ignored
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size)
+
+
+def content_range(start: int, end: int, size: int) -> str:
+    return f"bytes {start}-{end - 1}/{size}"
@@ -13,10 +13,13 @@ Usage:
 import argparse
 from datetime import datetime, timedelta
 import random
-from .database import init_db, SessionLocal
-from .db_models import DBUser, DBLeaderboardEntry, DBGameSession
+from sqlalchemy import inspect, text
+from .database import engine, init_db, SessionLocal
+from .db_models import DBUser, DBLeaderboardEntry, DBGameSession, DBLeaderboardWindowSummary
 from .models import GameMode
 from .auth import hash_password
+from .services.best_scores import upsert_best_score
+from .services.leaderboard_cache import is_accepted, leaderboard_order
 
 
 def seed_database():
@@ -130,6 +133,110 @@ def seed_database():
         db.close()
 
 
+def add_entry_status():
+    """Add leaderboard_entries.status to a table created before it existed"""
+    table = DBLeaderboardEntry.__table__
+    columns = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    if "status" in columns:
+        return
+    with engine.begin() as conn:
+        status = table.c.status
+        status.type.create(conn, checkfirst=True)
+        column_type = status.type.compile(dialect=conn.dialect)
+        # Everything written so far was accepted when it was submitted
+        conn.execute(text(
+            f"ALTER TABLE {table.name} ADD COLUMN status {column_type} NOT NULL DEFAULT 'ACCEPTED'"
+        ))
+        # The rank indexes now lead with status
+        for name in ("idx_leaderboard_mode_rank", "idx_leaderboard_rank", "idx_leaderboard_timestamp"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    print("✓ Added status to leaderboard entries")
+
+
+def add_entry_claims():
+    """Add the verifying status and leaderboard_entries.claimed_at to a table created before them"""
+    table = DBLeaderboardEntry.__table__
+    columns = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    if "claimed_at" in columns:
+        return
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # A native enum there; elsewhere status is a plain string
+            conn.execute(text(f"ALTER TYPE {table.c.status.type.name} ADD VALUE IF NOT EXISTS 'VERIFYING'"))
+        column_type = table.c.claimed_at.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN claimed_at {column_type}"))
+    print("✓ Added claims to leaderboard entries")
+
+
+def update_leaderboard_indexes():
+    """Replace the mode/score index of leaderboard_entries with the rank indexes"""
+    table = DBLeaderboardEntry.__table__
+    existing = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+    if "idx_leaderboard_mode_score" not in existing and {index.name for index in table.indexes} <= existing:
+        return
+    with engine.begin() as conn:
+        # Superseded by idx_leaderboard_status_mode_rank
+        conn.execute(text("DROP INDEX IF EXISTS idx_leaderboard_mode_score"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    print("✓ Updated leaderboard indexes")
+
+
+def add_session_indexes():
+    """Add the game_sessions indexes to a table created before they existed"""
+    table = DBGameSession.__table__
+    existing = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+    if {index.name for index in table.indexes} <= existing:
+        return
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    print("✓ Added game session indexes")
+
+
+def add_window_summary_constraints():
+    """Make the window summary ranks unique in a table created before they were"""
+    table = DBLeaderboardWindowSummary.__table__
+    existing = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+    if {index.name for index in table.indexes} <= existing:
+        return
+    with engine.begin() as conn:
+        # Periods compacted by two workers at once hold every rank twice
+        conn.execute(text(
+            f"DELETE FROM {table.name} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table.name} GROUP BY time_window, period_start, mode, rank)"
+        ))
+        conn.execute(text("DROP INDEX IF EXISTS idx_window_summary_period"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    print("✓ Made window summary ranks unique")
+
+
+def backfill_user_best_scores():
+    """Fill user_best_scores from leaderboard_entries written before it existed"""
+    db = SessionLocal()
+    
+    try:
+        dialect_name = db.get_bind().dialect.name
+        seen = set()
+        # Best first, so the first entry per user and mode is the one to keep
+        entries = db.query(DBLeaderboardEntry).filter(is_accepted()).order_by(*leaderboard_order())
+        for entry in entries.yield_per(1000):
+            if (entry.user_id, entry.mode) not in seen:
+                seen.add((entry.user_id, entry.mode))
+                db.execute(upsert_best_score(dialect_name, entry.user_id, entry))
+        db.commit()
+        print(f"✓ Best scores up to date for {len(seen)} user/mode pairs")
+    except Exception as e:
+        print(f"✗ Error backfilling best scores: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
 def main():
     parser = argparse.ArgumentParser(description="Initialize the Snake Arena database")
     parser.add_argument("--seed", action="store_true", help="Seed the database with sample data")
@@ -138,11 +245,17 @@ def main():
     print("Initializing database...")
     init_db()
     print("✓ Database tables created successfully")
+    add_entry_status()
+    add_entry_claims()
+    update_leaderboard_indexes()
+    add_session_indexes()
+    add_window_summary_constraints()
     
     if args.seed:
         print("Seeding database with sample data...")
         seed_database()
     
+    backfill_user_best_scores()
     print("✓ Database initialization complete!")
 
 
@@ -1,11 +1,66 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, leaderboard, sessions
+from sqlalchemy.exc import SQLAlchemyError
+from .database import AsyncSessionLocal
+from .metrics import metrics
+from .routers import auth, leaderboard, sessions, spectators
+from .models import LeaderboardWindow
+from .services.async_database import async_db_service
+from .services.event_bus import event_bus
+from .services.hashing import hashing_pool
+from .services.leaderboard_cache import leaderboard_cache
+from .services.live_sessions import live_sessions
+from .services.rank_index import rank_index
+from .services.replay_verification import replay_verifier
+from .services.session_reaper import session_reaper
+from .services.write_behind import score_write_behind
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Listen for other workers' changes before building anything from the
+    # database, so none made meanwhile are missed
+    await event_bus.start()
+    
+    # Replay scores a crashed worker accepted but never wrote, before the
+    # read models are built from the database
+    if score_write_behind.enabled:
+        await score_write_behind.start()
+    
+    # Warm in-memory read models and live sessions, and compact the window
+    # periods that ended while no worker was running; if the schema is not
+    # there yet they warm lazily on first use instead
+    try:
+        async with AsyncSessionLocal() as db:
+            for window in LeaderboardWindow:
+                await leaderboard_cache.load(db, window)
+                await async_db_service.compact_leaderboard_windows(db, window)
+            await rank_index.load(db)
+            await live_sessions.load(db)
+    except SQLAlchemyError as exc:
+        logger.warning("Read models not warmed at startup: %s", exc)
+    live_sessions.start()
+    session_reaper.start()
+    replay_verifier.start()
+    yield
+    await replay_verifier.stop()
+    await session_reaper.stop()
+    await live_sessions.stop()
+    if score_write_behind.enabled:
+        await score_write_behind.stop()
+    await event_bus.stop()
+    hashing_pool.shutdown()
+
 
 app = FastAPI(
     title="Snake Arena API",
     description="API for the Snake Arena game",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -15,17 +70,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers with /api prefix
 app.include_router(auth.router, prefix="/api")
 app.include_router(leaderboard.router, prefix="/api")
 app.include_router(sessions.router, prefix="/api")
+app.include_router(spectators.router, prefix="/api")
 
 @app.get("/api")
 async def root():
     return {"message": "Welcome to Snake Arena API"}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """In-process metrics for this worker"""
+    return metrics.snapshot()
+
 # Serve static files (SPA) if static directory exists (Unified Deployment)
 import os
 from fastapi.staticfiles import StaticFiles
@@ -0,0 +1,106 @@
+"""In-process metrics
+
+A deliberately small registry of counters, gauges and duration summaries,
+exposed as JSON by GET /api/metrics. Each uvicorn worker keeps its own.
+"""
+
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> int:
+        return self.value
+
+
+class Gauge:
+    """Value that can go up and down"""
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Summary:
+    """Count, total and max of observed values, plus percentiles over a recent window"""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self._recent.append(value)
+
+    def percentile(self, pct: float) -> float:
+        with self._lock:
+            ordered = sorted(self._recent)
+        if not ordered:
+            return 0.0
+        index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """Named metrics, created on first use"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = Lock()
+
+    def _get(self, name: str, kind):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind()
+            return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get(name, Counter)
+
+    def gauge(self, name: str) -> Gauge:
+        return self._get(name, Gauge)
+
+    def summary(self, name: str) -> Summary:
+        return self._get(name, Summary)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+
+# Singleton instance
+metrics = MetricsRegistry()
@@ -7,6 +7,21 @@ class GameMode(str, Enum):
     PASS_THROUGH = "pass-through"
     WALLS = "walls"
 
+class LeaderboardWindow(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    ALL = "all"
+
+class LeaderboardDistinct(str, Enum):
+    USERS = "users"
+
+class EntryStatus(str, Enum):
+    PENDING = "pending"      # replay waiting for verification
+    VERIFYING = "verifying"  # claimed by a verifier, until its lease expires
+    ACCEPTED = "accepted"    # replay verified, or submitted without one
+    REJECTED = "rejected"    # replay invalid or not matching the score
+
 class User(BaseModel):
     id: str
     username: str
@@ -20,6 +35,16 @@ class LeaderboardEntry(BaseModel):
     mode: GameMode
     timestamp: datetime
 
+class ScoreRank(BaseModel):
+    mode: Optional[GameMode]
+    score: int
+    rank: int
+    total: int
+
+class SessionCount(BaseModel):
+    mode: Optional[GameMode]
+    count: int
+
 class GameSession(BaseModel):
     id: str
     userId: str
@@ -44,9 +69,14 @@ class LoginRequest(BaseModel):
     email: EmailStr
     password: str
 
+class Replay(BaseModel):
+    seed: int = Field(ge=0, le=0xFFFFFFFF)
+    moves: str  # one of "U", "R", "D", "L" or "." per tick; see app/engine/simulator.py
+
 class SubmitScoreRequest(BaseModel):
     score: int
     mode: GameMode
+    replay: Optional[Replay] = None
 
 class CreateSessionRequest(BaseModel):
     mode: GameMode
@@ -0,0 +1,31 @@
+"""Opaque cursors for keyset pagination
+
+A cursor is the sort key of the last item on a page, JSON-encoded and
+base64url-wrapped so clients treat it as an opaque token.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, List
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded"""
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, length: int) -> List[Any]:
+    """Decode a cursor holding a list of `length` values"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError) as exc:
+        raise InvalidCursor(str(exc))
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor("Unexpected cursor shape")
+    return values
@@ -0,0 +1,40 @@
+"""JSON responses written by precompiled pydantic-core serializers
+
+When a route returns models under a response_model, FastAPI validates
+them against that model again, turns the result into plain data with
+jsonable_encoder, then encodes it with json.dumps. The leaderboard and
+session routes return a ModelResponse instead. Its TypeAdapter, built
+once per response type, writes the models straight to JSON bytes. Those
+routes keep their response_model for the OpenAPI schema.
+
+FastAPI only adds the headers of an injected Response to responses it
+builds itself, so headers such as X-Next-Cursor are passed to the
+ModelResponse.
+"""
+
+from typing import Any, List
+from fastapi import Response
+from pydantic import TypeAdapter
+from .models import GameSession, LeaderboardEntry
+
+
+class ModelResponse(Response):
+    """A JSON response whose content is serialized by the class's `adapter`"""
+
+    media_type = "application/json"
+    adapter: TypeAdapter
+
+    def render(self, content: Any) -> bytes:
+        return self.adapter.dump_json(content)
+
+
+class LeaderboardEntriesResponse(ModelResponse):
+    adapter = TypeAdapter(List[LeaderboardEntry])
+
+
+class GameSessionsResponse(ModelResponse):
+    adapter = TypeAdapter(List[GameSession])
+
+
+class GameSessionResponse(ModelResponse):
+    adapter = TypeAdapter(GameSession)
@@ -1,45 +1,66 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models import AuthResponse, LoginRequest, SignupRequest, User, ErrorResponse
-from ..services.database import db_service
-from ..database import get_db
+from ..services.async_database import async_db_service
+from ..services.hashing import HashingPoolBusy
+from ..services.principal_cache import principal_cache
+from ..database import get_async_db
 from ..auth import create_access_token, decode_access_token
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer()
 
 
-def get_current_user(
+def raise_server_busy():
+    """Reject a request because the password hashing pool is saturated"""
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """
     Dependency to get the current authenticated user from JWT token.
     Raises HTTPException if token is invalid or user not found.
     """
-    token = credentials.credentials
-    
-    # Decode the JWT token
-    payload = decode_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    # Extract user ID from token
-    user_id: str = payload.get("sub")
+    return await authenticate(credentials.credentials, db)
+
+
+async def authenticate(token: str, db: AsyncSession) -> User:
+    """Resolve a JWT to its user; raises HTTPException (401) if it cannot"""
+    # Decode the JWT token, unless it was validated recently
+    user_id = principal_cache.get_token_subject(token)
     if user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        payload = decode_access_token(token)
+        if payload is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        # Extract user ID from token
+        user_id = payload.get("sub")
+        if user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        principal_cache.put_token(token, user_id, payload.get("exp"))
+    
+    user = principal_cache.get_user(user_id)
+    if user is not None:
+        return user
     
     # Get user from database
-    db_user = db_service.get_user_by_id(db, user_id)
+    db_user = await async_db_service.get_user_by_id(db, user_id)
     if db_user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -47,21 +68,30 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return User(**db_user.to_dict())
+    user = User(**db_user.to_dict())
+    principal_cache.put_user(user)
+    return user
 
 
-@router.post("/signup", response_model=AuthResponse, responses={400: {"model": ErrorResponse}})
-async def signup(request: SignupRequest, db: Session = Depends(get_db)):
+@router.post(
+    "/signup",
+    response_model=AuthResponse,
+    responses={400: {"model": ErrorResponse}, 503: {"model": ErrorResponse}}
+)
+async def signup(request: SignupRequest, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     # Check if user already exists
-    if db_service.get_user_by_email(db, request.email):
+    if await async_db_service.get_user_by_email(db, request.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    if db_service.get_user_by_username(db, request.username):
+    if await async_db_service.get_user_by_username(db, request.username):
         raise HTTPException(status_code=400, detail="Username already taken")
     
     # Create user with hashed password
-    user = db_service.create_user(db, request.username, request.email, request.password)
+    try:
+        user = await async_db_service.create_user(db, request.username, request.email, request.password)
+    except HashingPoolBusy:
+        raise_server_busy()
     
     # Generate JWT token
     access_token = create_access_token(data={"sub": user.id})
@@ -69,11 +99,18 @@ async def signup(request: SignupRequest, db: Session = Depends(get_db)):
     return AuthResponse(user=user, token=access_token)
 
 
-@router.post("/login", response_model=AuthResponse, responses={401: {"model": ErrorResponse}})
-async def login(request: LoginRequest, db: Session = Depends(get_db)):
+@router.post(
+    "/login",
+    response_model=AuthResponse,
+    responses={401: {"model": ErrorResponse}, 503: {"model": ErrorResponse}}
+)
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """Login a user"""
     # Verify credentials
-    db_user = db_service.verify_user_password(db, request.email, request.password)
+    try:
+        db_user = await async_db_service.verify_user_password(db, request.email, request.password)
+    except HashingPoolBusy:
+        raise_server_busy()
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -1,31 +1,234 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session
+import asyncio
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from ..models import LeaderboardEntry, SubmitScoreRequest, GameMode, User
-from ..services.database import db_service
-from ..database import get_db
+from ..config import settings
+from ..engine.simulator import InvalidReplay, validate_moves
+from ..metrics import metrics
+from ..models import (
+    LeaderboardEntry, SubmitScoreRequest, GameMode, User, ScoreRank, LeaderboardWindow, LeaderboardDistinct, EntryStatus
+)
+from ..services.async_database import async_db_service
+from ..services.leaderboard_events import format_event, leaderboard_events
+from ..services.replay_archive import replay_archive
+from ..services.replay_verification import replay_verifier
+from ..services.write_behind import WriteBehindFull, score_write_behind
+from ..services.leaderboard_cache import LEADERBOARD_MAX_LIMIT, LeaderboardCursor, window_bounds
+from ..http_ranges import RangeNotSatisfiable, content_range, parse_range
+from ..responses import LeaderboardEntriesResponse
+from ..pagination import InvalidCursor
+from ..database import get_async_db
 from .auth import get_current_user
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 
+# Seconds between SSE comments that keep idle connections open through proxies
+SSE_KEEPALIVE_SECONDS = 15.0
+# Bytes per chunk when sending a replay
+REPLAY_CHUNK_BYTES = 64 * 1024
 
-@router.get("/", response_model=List[LeaderboardEntry])
+
+@router.get("/", response_model=List[LeaderboardEntry], response_class=LeaderboardEntriesResponse)
 async def get_leaderboard(
     mode: Optional[GameMode] = None,
-    limit: int = Query(default=10, ge=1, le=100),
-    db: Session = Depends(get_db)
+    limit: int = Query(default=10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    window: LeaderboardWindow = LeaderboardWindow.ALL,
+    period: Optional[datetime] = None,
+    distinct: Optional[LeaderboardDistinct] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get leaderboard entries, optionally filtered by game mode.
+    
+    `window` restricts the board to scores from the current UTC day, week
+    (from Monday) or month; with `period`, a time in a finished day, week
+    or month, to the top entries of that one as they were compacted when
+    it ended. `distinct=users` keeps only each player's best
+    all-time entry. A full page carries an X-Next-Cursor header; pass it back as `cursor`
+    to fetch the following page.
+    """
+    try:
+        after = LeaderboardCursor.decode(cursor) if cursor else None
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    if period is not None:
+        if window == LeaderboardWindow.ALL or distinct is not None:
+            raise HTTPException(status_code=400, detail="period needs window=day, week or month")
+        try:
+            if period.tzinfo is not None:
+                period = period.astimezone(timezone.utc).replace(tzinfo=None)
+            start, _ = window_bounds(window, period)
+        except OverflowError:
+            # A period at the edge of the calendar, ending past year 9999
+            raise HTTPException(status_code=400, detail="period out of range")
+        if start == window_bounds(window, datetime.utcnow())[0]:
+            period = None
+    if period is not None:
+        entries = await async_db_service.get_window_summary(db, window, period, mode, limit, after)
+    elif distinct == LeaderboardDistinct.USERS:
+        if window != LeaderboardWindow.ALL:
+            raise HTTPException(status_code=400, detail="distinct=users is only available for window=all")
+        entries = await async_db_service.get_best_scores(db, mode, limit, after)
+    else:
+        entries = await async_db_service.get_leaderboard(db, mode, limit, after, window)
+    headers = {}
+    if len(entries) == limit:
+        headers["X-Next-Cursor"] = LeaderboardCursor.from_entry(entries[-1]).encode()
+    return LeaderboardEntriesResponse(entries, headers=headers)
+
+
+@router.get("/stream")
+async def stream_leaderboard(
+    mode: Optional[GameMode] = None,
+    limit: int = Query(default=10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    last_event_id: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get leaderboard entries, optionally filtered by game mode"""
-    return db_service.get_leaderboard(db, mode, limit)
+    """
+    Server-Sent Events feed of the all-time leaderboard.
+    
+    Starts with a `snapshot` event holding the top `limit` entries, then
+    sends a `rank` event ({"mode", "rank", "entry"}) whenever a submission
+    enters the top `limit`. A client reconnecting with Last-Event-ID gets
+    the events it missed, or a new snapshot if they are no longer buffered.
+    """
+    missed = leaderboard_events.since(last_event_id, mode, limit) if last_event_id else None
+    if missed is None:
+        entries = await async_db_service.get_leaderboard(db, mode, limit)
+        # Nothing has been awaited since the entries were read, so the
+        # snapshot and the subscription below see the same board
+        missed = [format_event(
+            leaderboard_events.last_event_id,
+            "snapshot",
+            [entry.model_dump(mode="json") for entry in entries]
+        )]
+    subscriber = leaderboard_events.subscribe(mode, limit)
+    await db.close()
+    
+    async def events():
+        try:
+            for text in missed:
+                yield text
+            while True:
+                try:
+                    text = await asyncio.wait_for(subscriber.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if text is None:
+                    # Fell too far behind; the client reconnects with Last-Event-ID
+                    return
+                yield text
+        finally:
+            leaderboard_events.unsubscribe(subscriber, mode)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def check_replay(request: SubmitScoreRequest):
+    """
+    Reject a submission's move log early if it cannot be valid; raises
+    HTTPException (400). Playing it back is left to the replay verifier.
+    """
+    if request.replay is None:
+        if settings.leaderboard_require_replay:
+            raise HTTPException(status_code=400, detail="A replay is required")
+        return
+    try:
+        validate_moves(request.replay.moves)
+    except InvalidReplay as exc:
+        metrics.counter("leaderboard.replays_rejected").inc()
+        raise HTTPException(status_code=400, detail=f"Invalid replay: {exc}")
 
 
 @router.post("/")
 async def submit_score(
     request: SubmitScoreRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Submit a score to the leaderboard (requires authentication)"""
-    db_service.submit_score(db, current_user.id, current_user.username, request.score, request.mode)
+    """
+    Submit a score to the leaderboard (requires authentication).
+    
+    With a `replay` (food seed and move log) the entry is pending: it
+    only appears on the leaderboard once the replay verifier has played
+    the moves back and they score exactly that, and is rejected otherwise.
+    """
+    check_replay(request)
+    if request.replay is not None:
+        entry = await async_db_service.submit_replay(
+            db, current_user.id, current_user.username, request.score, request.mode, request.replay
+        )
+        replay_verifier.notify()
+        return {"message": "Score submitted for verification", "status": EntryStatus.PENDING, "id": entry.id}
+    if score_write_behind.enabled:
+        try:
+            score_write_behind.submit(current_user.id, current_user.username, request.score, request.mode)
+        except WriteBehindFull:
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    else:
+        await async_db_service.submit_score(db, current_user.id, current_user.username, request.score, request.mode)
     return {"message": "Score submitted successfully"}
 
+
+@router.get("/{entry_id}/replay")
+async def get_replay(entry_id: str, range_header: Optional[str] = Header(default=None, alias="Range")):
+    """
+    The encoded replay of an accepted entry (see app/engine/replay_format.py),
+    sent as is from the replay archive. Supports single-range Range requests.
+    """
+    replay = replay_archive.get(entry_id)
+    if replay is None:
+        raise HTTPException(status_code=404, detail="No replay for this entry")
+    size = len(replay)
+    try:
+        requested = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    start, end = requested or (0, size)
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start)}
+    if requested:
+        headers["Content-Range"] = content_range(start, end, size)
+    
+    async def chunks():
+        # Slices of the memory map; copied only by the socket write
+        for offset in range(start, end, REPLAY_CHUNK_BYTES):
+            yield replay[offset:min(offset + REPLAY_CHUNK_BYTES, end)]
+    
+    return StreamingResponse(
+        chunks(),
+        status_code=206 if requested else 200,
+        media_type="application/octet-stream",
+        headers=headers
+    )
+
+
+@router.get("/rank", response_model=ScoreRank)
+async def get_score_rank(
+    score: int,
+    mode: Optional[GameMode] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the place a score would take on the leaderboard"""
+    return await async_db_service.get_score_rank(db, score, mode)
+
+
+@router.get("/me/rank", response_model=ScoreRank)
+async def get_my_rank(
+    mode: Optional[GameMode] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the place of the current user's best score (requires authentication)"""
+    best_score = await async_db_service.get_user_best_score(db, current_user.id, mode)
+    if best_score is None:
+        raise HTTPException(status_code=404, detail="No scores submitted")
+    return await async_db_service.get_score_rank(db, best_score, mode)
@@ -1,37 +1,81 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
-from ..models import GameSession, CreateSessionRequest, UpdateSessionRequest, User
-from ..services.database import db_service
-from ..database import get_db
-from .auth import get_current_user
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from ..config import settings
+from ..engine.simulator import MOVE_KEYS, NO_MOVE, InvalidReplay
+from ..models import GameMode, GameSession, CreateSessionRequest, SessionCount, UpdateSessionRequest, User
+from ..pagination import InvalidCursor
+from ..responses import GameSessionResponse, GameSessionsResponse
+from ..services.async_database import async_db_service
+from ..services.bot_opponents import BotOpponentsBusy, bot_opponents
+from ..services.input_relay import input_relay
+from ..services.live_sessions import LiveSession, SessionCursor, live_sessions
+from ..services.session_ingest import InvalidFrame, ScoreIngest
+from ..database import get_async_db
+from .auth import authenticate, get_current_user
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
 
+# Seconds a new ingest channel has to authenticate
+INGEST_HANDSHAKE_SECONDS = 10
 
-@router.get("/", response_model=List[GameSession])
-async def get_active_sessions(db: Session = Depends(get_db)):
-    """Get all active game sessions"""
-    return db_service.get_active_sessions(db)
+SESSIONS_MAX_LIMIT = 200
+
+# Ticks a bot opponent may be asked to play in one message
+BOT_MAX_TICKS = 100
+_KEYS = {direction: key for key, direction in MOVE_KEYS.items()}
+
+
+@router.get("/", response_model=List[GameSession], response_class=GameSessionsResponse)
+async def get_active_sessions(
+    mode: Optional[GameMode] = None,
+    min_score: Optional[int] = None,
+    limit: int = Query(default=50, ge=1, le=SESSIONS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get active game sessions, best score first.
+    
+    A full page carries an X-Next-Cursor header; pass it back as `cursor`
+    to fetch the following page.
+    """
+    try:
+        after = SessionCursor.decode(cursor) if cursor else None
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    sessions = await async_db_service.list_active_sessions(db, mode, min_score, limit, after)
+    headers = {}
+    if len(sessions) == limit:
+        headers["X-Next-Cursor"] = SessionCursor.from_session(sessions[-1]).encode()
+    return GameSessionsResponse(sessions, headers=headers)
+
+
+@router.get("/count", response_model=SessionCount)
+async def count_active_sessions(mode: Optional[GameMode] = None, db: AsyncSession = Depends(get_async_db)):
+    """Number of active game sessions, for lobby counters"""
+    return SessionCount(mode=mode, count=await async_db_service.count_active_sessions(db, mode))
 
 
 @router.post("/", response_model=GameSession)
 async def create_session(
     request: CreateSessionRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new game session (requires authentication)"""
-    return db_service.create_session(db, current_user.id, current_user.username, request.mode)
+    return await async_db_service.create_session(db, current_user.id, current_user.username, request.mode)
 
 
-@router.get("/{session_id}", response_model=GameSession)
-async def get_session(session_id: str, db: Session = Depends(get_db)):
+@router.get("/{session_id}", response_model=GameSession, response_class=GameSessionResponse)
+async def get_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get a game session by ID"""
-    session = db_service.get_session(db, session_id)
+    session = await async_db_service.get_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return GameSessionResponse(session)
 
 
 @router.put("/{session_id}")
@@ -39,10 +83,10 @@ async def update_session(
     session_id: str,
     request: UpdateSessionRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update session score (requires authentication)"""
-    if not db_service.update_session_score(db, session_id, request.score):
+    if not await async_db_service.update_session_score(db, session_id, request.score):
         raise HTTPException(status_code=404, detail="Session not found")
     return {"message": "Session updated successfully"}
 
@@ -51,10 +95,218 @@ async def update_session(
 async def end_session(
     session_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """End a game session (requires authentication)"""
-    if not db_service.end_session(db, session_id):
+    if not await async_db_service.end_session(db, session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     return {"message": "Session ended successfully"}
 
+
+async def open_player_channel(
+    websocket: WebSocket, session_id: str, db: AsyncSession
+) -> Optional[Tuple[dict, LiveSession]]:
+    """
+    Authenticate a player's channel to their own active session: the
+    handshake message and the session, or None once the channel is closed
+    (4401, 4403 or 4404).
+    """
+    try:
+        handshake = await asyncio.wait_for(websocket.receive_json(), INGEST_HANDSHAKE_SECONDS)
+        user = await authenticate(str(handshake["token"]), db)
+    except WebSocketDisconnect:
+        return None
+    except (asyncio.TimeoutError, ValueError, KeyError, TypeError, HTTPException):
+        await websocket.close(code=4401, reason="Authentication failed")
+        return None
+    live = await async_db_service.get_live_session(db, session_id)
+    await db.close()
+    if live is None:
+        await websocket.close(code=4404, reason="Session not active")
+        return None
+    if live.user_id != user.id:
+        await websocket.close(code=4403, reason="Not your session")
+        return None
+    return handshake, live
+
+
+@router.websocket("/{session_id}/ingest")
+async def ingest_scores(websocket: WebSocket, session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Binary score updates for a session, instead of a PUT per food pickup.
+
+    The client authenticates once by sending {"token": "<JWT>"} as text and
+    is answered {"type": "ready", "slot": n}. After that it sends binary
+    frames packed as SCORE_FRAME (slot, sequence number, score; network
+    byte order). The latest score is applied every SESSION_INGEST_FLUSH_MS
+    and acknowledged with an ACK_FRAME (slot, last sequence applied).
+
+    Closes normally when the session ends; with 4401 if authentication
+    fails, 4403 if the session belongs to another user, 4404 if it is not
+    active, and 1003 on a malformed frame.
+    """
+    await websocket.accept()
+    opened = await open_player_channel(websocket, session_id, db)
+    if opened is None:
+        return
+
+    ingest = ScoreIngest(session_id)
+    await websocket.send_json({"type": "ready", "slot": ingest.slot})
+
+    async def flush():
+        while True:
+            await asyncio.sleep(settings.session_ingest_flush_ms / 1000)
+            score = ingest.take()
+            if score is not None and async_db_service.set_live_score(session_id, score):
+                await websocket.send_bytes(ingest.ack())
+            elif live_sessions.get(session_id) is None:
+                await websocket.close()
+                return
+
+    async def receive():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            try:
+                if message.get("bytes") is None:
+                    raise InvalidFrame("Expected a binary frame")
+                ingest.accept(message["bytes"])
+            except InvalidFrame as exc:
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason=str(exc))
+                return
+
+    tasks = [asyncio.create_task(flush()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Keep the last score sent before the client left
+        score = ingest.take()
+        if score is not None:
+            async_db_service.set_live_score(session_id, score)
+
+
+@router.websocket("/{session_id}/inputs")
+async def relay_inputs(websocket: WebSocket, session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    The player's moves, relayed to spectators of the session.
+
+    The client authenticates with {"token": "<JWT>", "seed": n}, where
+    seed is the food generator's seed of the game it is starting, and is
+    answered {"type": "ready"}. It then sends text messages of moves, one
+    character per tick as in a replay ("U", "R", "D", "L" or "."). The
+    server plays them as they come, so the session's live score is the
+    one they score, and relays them with periodic keyframes (see
+    app/services/input_relay.py). A message holds at most as many moves
+    as there are ticks between keyframes.
+
+    Closes normally when the game or the session ends; with 4401, 4403 or
+    4404 as the ingest channel, 1003 on moves that are not valid, and
+    1009 on a message of too many moves.
+    """
+    await websocket.accept()
+    opened = await open_player_channel(websocket, session_id, db)
+    if opened is None:
+        return
+    handshake, live = opened
+    seed = handshake.get("seed")
+    if not isinstance(seed, int) or not 0 <= seed <= 0xFFFFFFFF:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="Expected a 32-bit seed")
+        return
+
+    relayed = input_relay.start_game(session_id, seed, live.mode)
+    await websocket.send_json({"type": "ready"})
+    while True:
+        try:
+            moves = await websocket.receive_text()
+        except WebSocketDisconnect:
+            return
+        except KeyError:
+            # A binary frame
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="Expected moves as text")
+            return
+        if len(moves) > input_relay.keyframe_ticks:
+            # Each frame is published as one event, which must stay small
+            await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG, reason="Too many moves at once")
+            return
+        try:
+            relayed.play(moves)
+        except InvalidReplay as exc:
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason=str(exc))
+            return
+        finally:
+            if relayed.game.score != live.score:
+                async_db_service.set_live_score(session_id, relayed.game.score)
+        if relayed.game.game_over or live_sessions.get(session_id) is None:
+            await websocket.close()
+            return
+
+
+@router.websocket("/{session_id}/bot")
+async def play_bot(websocket: WebSocket, session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    A bot opponent playing the same game as the player, tick for tick.
+
+    The client authenticates with {"token": "<JWT>", "seed": n}, the seed
+    of its own game, and is answered {"type": "ready"}. The bot plays the
+    session's mode from that seed. Each time the player's game advances,
+    the client sends the number of ticks it advanced by, as text, and is
+    answered {"type": "moves", "tick", "moves"}: the bot's moves for
+    those ticks, in the replay alphabet, to play on the client's copy of
+    the bot's game. When the bot's game ends, the client is sent
+    {"type": "ended", "score", "ticks"} and the channel closes.
+
+    Closes normally when the session ends; with 4401, 4403 or 4404 as the
+    ingest channel, 1013 when no bot is free, and 1003 on a message that
+    is not a tick count from 1 to BOT_MAX_TICKS.
+    """
+    await websocket.accept()
+    opened = await open_player_channel(websocket, session_id, db)
+    if opened is None:
+        return
+    handshake, live = opened
+    seed = handshake.get("seed")
+    if not isinstance(seed, int) or not 0 <= seed <= 0xFFFFFFFF:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="Expected a 32-bit seed")
+        return
+    try:
+        slot = bot_opponents.start_game(seed, live.mode)
+    except BotOpponentsBusy:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="No bot free")
+        return
+
+    game = bot_opponents.game
+    try:
+        await websocket.send_json({"type": "ready"})
+        while True:
+            try:
+                ticks = int(await websocket.receive_text())
+            except WebSocketDisconnect:
+                return
+            except (KeyError, ValueError):
+                ticks = 0
+            if not 1 <= ticks <= BOT_MAX_TICKS:
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="Expected a tick count")
+                return
+            first = int(game.ticks[slot])
+            moves = []
+            for _ in range(ticks):
+                direction = int(game.direction[slot])
+                pressed = await bot_opponents.step(slot)
+                moves.append(NO_MOVE if pressed == direction else _KEYS[pressed])
+                if game.game_over[slot]:
+                    break
+            await websocket.send_json({"type": "moves", "tick": first, "moves": "".join(moves)})
+            if game.game_over[slot]:
+                await websocket.send_json({
+                    "type": "ended", "score": int(game.score[slot]), "ticks": int(game.ticks[slot])
+                })
+                await websocket.close()
+                return
+            if live_sessions.get(session_id) is None:
+                await websocket.close()
+                return
+    finally:
+        bot_opponents.end_game(slot)
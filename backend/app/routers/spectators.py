@@ -0,0 +1,112 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..services.async_database import async_db_service
+from ..services.input_relay import input_relay
+from ..services.session_broadcast import Subscriber, session_broadcaster
+from ..database import get_async_db
+
+router = APIRouter(prefix="/ws", tags=["spectators"])
+
+
+async def stream(websocket: WebSocket, subscriber: Subscriber):
+    """Send queued messages until the stream is closed or the client leaves"""
+    async def send():
+        while True:
+            text = await subscriber.queue.get()
+            if text is None:
+                # Session ended, or the spectator fell too far behind
+                code = status.WS_1013_TRY_AGAIN_LATER if subscriber.dropped else status.WS_1000_NORMAL_CLOSURE
+                await websocket.close(code=code)
+                return
+            await websocket.send_text(text)
+
+    async def receive():
+        # Spectators do not send anything; this only notices disconnects
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@router.websocket("/sessions")
+async def watch_sessions(websocket: WebSocket, db: AsyncSession = Depends(get_async_db)):
+    """
+    Stream active game sessions.
+
+    Sends a snapshot of every active session, then one message per change:
+    {"type": "created", "session": {...}}, {"type": "updated", "id", "score"}
+    or {"type": "ended", "id", "score"}.
+    """
+    await websocket.accept()
+    subscriber = session_broadcaster.subscribe()
+    try:
+        sessions = await async_db_service.get_active_sessions(db)
+        await db.close()
+        await websocket.send_text(json.dumps({
+            "type": "snapshot",
+            "sessions": [session.model_dump(mode="json") for session in sessions],
+        }))
+        await stream(websocket, subscriber)
+    finally:
+        session_broadcaster.unsubscribe(subscriber)
+
+
+@router.websocket("/sessions/{session_id}")
+async def watch_session(websocket: WebSocket, session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Stream one game session: a snapshot, then its updates until it ends.
+
+    Closes with code 4404 if the session does not exist.
+    """
+    await websocket.accept()
+    subscriber = session_broadcaster.subscribe(session_id)
+    try:
+        session = await async_db_service.get_session(db, session_id)
+        await db.close()
+        if session is None:
+            await websocket.close(code=4404, reason="Session not found")
+            return
+        await websocket.send_text(json.dumps({"type": "snapshot", "session": session.model_dump(mode="json")}))
+        if not session.isActive:
+            await websocket.close()
+            return
+        await stream(websocket, subscriber)
+    finally:
+        session_broadcaster.unsubscribe(subscriber, session_id)
+
+
+@router.websocket("/sessions/{session_id}/inputs")
+async def watch_session_inputs(websocket: WebSocket, session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Follow a relayed game move by move (see app/services/input_relay.py).
+
+    Starts with {"type": "catchup", "keyframe", "moves"}: the latest
+    keyframe and the moves played since, if the game has one yet. Then
+    {"type": "inputs", "tick", "moves"} as the player moves,
+    {"type": "keyframe", "keyframe"} every so many ticks, and
+    {"type": "ended", "score"} when the session ends.
+
+    Closes with code 4404 if the session is not active.
+    """
+    await websocket.accept()
+    live = await async_db_service.get_live_session(db, session_id)
+    await db.close()
+    if live is None:
+        await websocket.close(code=4404, reason="Session not active")
+        return
+    subscriber = input_relay.subscribe(session_id)
+    try:
+        await stream(websocket, subscriber)
+    finally:
+        input_relay.unsubscribe(subscriber, session_id)
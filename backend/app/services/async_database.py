@@ -0,0 +1,419 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db_models import (
+    DBUser, DBLeaderboardEntry, DBLeaderboardReplay, DBGameSession, DBLeaderboardWindowSummary, DBUserBestScore
+)
+from ..models import User, LeaderboardEntry, GameSession, GameMode, ScoreRank, LeaderboardWindow, EntryStatus, Replay
+from .live_sessions import LiveSession, SessionCursor, live_sessions
+from .leaderboard_cache import (
+    ENTRY_COLUMNS, LeaderboardCursor, after_cursor, entry_from_row, is_accepted, leaderboard_cache,
+    leaderboard_order, window_bounds
+)
+from .best_scores import best_scores_query, dialect_insert, raise_high_score, upsert_best_score
+from .event_bus import SCORE_SUBMITTED, SESSION_CREATED, SESSION_ENDED, SESSION_UPDATED, USER_CHANGED, event_bus
+from .rank_index import rank_index
+# The read models and push fan-out subscribe to the events published here
+from . import leaderboard_events, principal_cache, session_broadcast  # noqa: F401
+from ..auth import password_needs_rehash
+from .hashing import hashing_pool, HashingPoolBusy
+
+
+class AsyncDatabaseService:
+    """Async twin of DatabaseService, used by the API routers"""
+
+    # User operations
+    @staticmethod
+    async def create_user(db: AsyncSession, username: str, email: str, password: str) -> User:
+        """Create a new user with hashed password"""
+        hashed_pw = await hashing_pool.hash(password)
+        db_user = DBUser(
+            username=username,
+            email=email,
+            hashed_password=hashed_pw,
+            high_score=0
+        )
+        db.add(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        event_bus.publish(USER_CHANGED, {"user_id": db_user.id})
+        return User(**db_user.to_dict())
+
+    @staticmethod
+    async def get_user_by_email(db: AsyncSession, email: str) -> Optional[DBUser]:
+        """Get user by email"""
+        result = await db.execute(select(DBUser).where(DBUser.email == email))
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_user_by_username(db: AsyncSession, username: str) -> Optional[DBUser]:
+        """Get user by username"""
+        result = await db.execute(select(DBUser).where(DBUser.username == username))
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_user_by_id(db: AsyncSession, user_id: str) -> Optional[DBUser]:
+        """Get user by ID"""
+        result = await db.execute(select(DBUser).where(DBUser.id == user_id))
+        return result.scalars().first()
+
+    @staticmethod
+    async def verify_user_password(db: AsyncSession, email: str, password: str) -> Optional[DBUser]:
+        """Verify user password and return user if valid"""
+        user = await AsyncDatabaseService.get_user_by_email(db, email)
+        if user and await hashing_pool.verify(password, user.hashed_password):
+            # Upgrade hashes made under an older cost profile
+            if password_needs_rehash(user.hashed_password):
+                try:
+                    user.hashed_password = await hashing_pool.hash(password)
+                    await db.commit()
+                except HashingPoolBusy:
+                    pass  # The login already succeeded; upgrade on a later one
+            return user
+        return None
+
+    @staticmethod
+    async def update_user_high_score(db: AsyncSession, user_id: str, new_score: int) -> bool:
+        """Update user's high score if new score is higher"""
+        raised = (await db.execute(raise_high_score(user_id, new_score))).rowcount > 0
+        await db.commit()
+        if raised:
+            event_bus.publish(USER_CHANGED, {"user_id": user_id})
+        return raised
+
+    # Leaderboard operations
+    @staticmethod
+    async def get_leaderboard(
+        db: AsyncSession,
+        mode: Optional[GameMode] = None,
+        limit: int = 10,
+        cursor: Optional[LeaderboardCursor] = None,
+        window: LeaderboardWindow = LeaderboardWindow.ALL
+    ) -> List[LeaderboardEntry]:
+        """
+        Get leaderboard entries, optionally filtered by mode, for a time window.
+
+        Pages are served from the top-k cache; pages past it use a keyset
+        query on (score, timestamp, id) after the cursor.
+        """
+        if not leaderboard_cache.is_current(window):
+            if await leaderboard_cache.load(db, window) is not None:
+                await AsyncDatabaseService.compact_leaderboard_windows(db, window)
+        if cursor is None:
+            return leaderboard_cache.top(mode, limit, window)
+
+        page = leaderboard_cache.page_after(cursor, mode, limit, window)
+        if page is not None:
+            return page
+
+        query = select(*ENTRY_COLUMNS).where(is_accepted(), after_cursor(cursor))
+        if mode:
+            query = query.where(DBLeaderboardEntry.mode == mode)
+        start, end = window_bounds(window, datetime.utcnow())
+        if start is not None:
+            query = query.where(DBLeaderboardEntry.timestamp >= start, DBLeaderboardEntry.timestamp < end)
+        result = await db.execute(query.order_by(*leaderboard_order()).limit(limit))
+        return [entry_from_row(row) for row in result]
+
+    @staticmethod
+    async def get_best_scores(
+        db: AsyncSession,
+        mode: Optional[GameMode] = None,
+        limit: int = 10,
+        cursor: Optional[LeaderboardCursor] = None
+    ) -> List[LeaderboardEntry]:
+        """Get each user's best entry, optionally filtered by mode"""
+        result = await db.execute(best_scores_query(mode, limit, cursor))
+        return [entry_from_row(row) for row in result]
+
+    @staticmethod
+    async def get_window_summary(
+        db: AsyncSession,
+        window: LeaderboardWindow,
+        period: datetime,
+        mode: Optional[GameMode] = None,
+        limit: int = 10,
+        cursor: Optional[LeaderboardCursor] = None
+    ) -> List[LeaderboardEntry]:
+        """
+        Top entries of the finished window period containing `period`, from
+        leaderboard_window_summaries; empty if it was never compacted.
+        """
+        summaries = DBLeaderboardWindowSummary
+        start, _ = window_bounds(window, period)
+        query = select(summaries).where(
+            summaries.time_window == window,
+            summaries.period_start == start,
+            summaries.mode.is_(None) if mode is None else summaries.mode == mode
+        )
+        if cursor:
+            query = query.where(after_cursor(cursor, summaries.score, summaries.timestamp, summaries.entry_id))
+        result = await db.execute(query.order_by(summaries.rank).limit(limit))
+        return [LeaderboardEntry(**summary.to_dict()) for summary in result.scalars()]
+
+    @staticmethod
+    async def compact_leaderboard_window(
+        db: AsyncSession,
+        window: LeaderboardWindow,
+        period_start: datetime
+    ) -> int:
+        """
+        Store the top entries of a finished window period in
+        leaderboard_window_summaries; periods already compacted are skipped,
+        and so are rows another worker compacting the same period wrote.
+        Returns the number of summary rows written.
+        """
+        already = await db.scalar(
+            select(DBLeaderboardWindowSummary.id)
+            .where(
+                DBLeaderboardWindowSummary.time_window == window,
+                DBLeaderboardWindowSummary.period_start == period_start
+            )
+            .limit(1)
+        )
+        if already is not None:
+            return 0
+
+        start, end = window_bounds(window, period_start)
+        summaries = []
+        for mode in [None, *GameMode]:
+            query = select(DBLeaderboardEntry).where(
+                is_accepted(), DBLeaderboardEntry.timestamp >= start, DBLeaderboardEntry.timestamp < end
+            )
+            if mode:
+                query = query.where(DBLeaderboardEntry.mode == mode)
+            result = await db.execute(query.order_by(*leaderboard_order()).limit(leaderboard_cache.k))
+            for rank, entry in enumerate(result.scalars(), start=1):
+                summaries.append({
+                    "time_window": window,
+                    "period_start": start,
+                    "mode": mode,
+                    "rank": rank,
+                    "entry_id": entry.id,
+                    "user_id": entry.user_id,
+                    "username": entry.username,
+                    "score": entry.score,
+                    "entry_mode": entry.mode,
+                    "timestamp": entry.timestamp,
+                })
+        if not summaries:
+            return 0
+        insert_summaries = dialect_insert(db.get_bind().dialect.name)(DBLeaderboardWindowSummary)
+        result = await db.execute(
+            insert_summaries.on_conflict_do_nothing().returning(DBLeaderboardWindowSummary.id), summaries
+        )
+        written = len(result.all())
+        await db.commit()
+        return written
+
+    @staticmethod
+    async def compact_leaderboard_windows(
+        db: AsyncSession,
+        window: LeaderboardWindow,
+        now: Optional[datetime] = None
+    ) -> int:
+        """
+        Compact every finished period of a window since the last one
+        compacted (or the oldest entry), such as the periods that ended
+        while no worker was running. Returns the number of summary rows
+        written.
+        """
+        if window == LeaderboardWindow.ALL:
+            return 0
+        current, _ = window_bounds(window, now or datetime.utcnow())
+        since = await db.scalar(
+            select(func.max(DBLeaderboardWindowSummary.period_start))
+            .where(DBLeaderboardWindowSummary.time_window == window)
+        )
+        if since is None:
+            since = await db.scalar(select(func.min(DBLeaderboardEntry.timestamp)).where(is_accepted()))
+            if since is None:
+                return 0
+        written = 0
+        period, _ = window_bounds(window, since)
+        while period < current:
+            written += await AsyncDatabaseService.compact_leaderboard_window(db, window, period)
+            period = window_bounds(window, period)[1]
+        return written
+
+    @staticmethod
+    async def submit_score(
+        db: AsyncSession,
+        user_id: str,
+        username: str,
+        score: int,
+        mode: GameMode
+    ) -> LeaderboardEntry:
+        """
+        Submit a score to the leaderboard.
+
+        One transaction inserts the entry (RETURNING its id and timestamp)
+        and raises the user's best score for the mode and overall high
+        score with conditional updates.
+        """
+        row = (await db.execute(
+            insert(DBLeaderboardEntry)
+            .values(user_id=user_id, username=username, score=score, mode=mode)
+            .returning(DBLeaderboardEntry.id, DBLeaderboardEntry.timestamp)
+        )).one()
+        result = LeaderboardEntry(id=row.id, username=username, score=score, mode=mode, timestamp=row.timestamp)
+        await db.execute(upsert_best_score(db.get_bind().dialect.name, user_id, result))
+        raised = (await db.execute(raise_high_score(user_id, score))).rowcount > 0
+        await db.commit()
+
+        if raised:
+            event_bus.publish(USER_CHANGED, {"user_id": user_id})
+        event_bus.publish(SCORE_SUBMITTED, {"entry": result.model_dump(mode="json")})
+        return result
+
+    @staticmethod
+    async def submit_replay(
+        db: AsyncSession,
+        user_id: str,
+        username: str,
+        score: int,
+        mode: GameMode,
+        replay: Replay
+    ) -> LeaderboardEntry:
+        """
+        Submit a score with its replay, as a pending entry.
+
+        Pending entries are invisible to leaderboards and ranks, and touch
+        no best or high score, until the replay verifier accepts them; so
+        nothing is published here.
+        """
+        row = (await db.execute(
+            insert(DBLeaderboardEntry)
+            .values(user_id=user_id, username=username, score=score, mode=mode, status=EntryStatus.PENDING)
+            .returning(DBLeaderboardEntry.id, DBLeaderboardEntry.timestamp)
+        )).one()
+        await db.execute(insert(DBLeaderboardReplay).values(entry_id=row.id, seed=replay.seed, moves=replay.moves))
+        await db.commit()
+        return LeaderboardEntry(id=row.id, username=username, score=score, mode=mode, timestamp=row.timestamp)
+
+    @staticmethod
+    async def get_score_rank(db: AsyncSession, score: int, mode: Optional[GameMode] = None) -> ScoreRank:
+        """Get the place a score takes on the leaderboard, from the rank index"""
+        if not rank_index.is_warm:
+            await rank_index.load(db)
+        return ScoreRank(mode=mode, score=score, rank=rank_index.rank(score, mode), total=rank_index.total(mode))
+
+    @staticmethod
+    async def get_user_best_score(db: AsyncSession, user_id: str, mode: Optional[GameMode] = None) -> Optional[int]:
+        """Get a user's best leaderboard score, optionally for one mode"""
+        query = select(func.max(DBUserBestScore.score)).where(DBUserBestScore.user_id == user_id)
+        if mode:
+            query = query.where(DBUserBestScore.mode == mode)
+        return (await db.execute(query)).scalar()
+
+    # Session operations; active sessions live in the LiveSessionStore and
+    # changes are published on the event bus, which mirrors them into other
+    # workers' stores and pushes them to WebSocket spectators
+    @staticmethod
+    async def create_session(db: AsyncSession, user_id: str, username: str, mode: GameMode) -> GameSession:
+        """Create a new game session"""
+        session = DBGameSession(
+            user_id=user_id,
+            username=username,
+            score=0,
+            mode=mode,
+            is_active=True
+        )
+        db.add(session)
+        await db.commit()
+        live = LiveSession.from_db(session)
+        live_sessions.add(live)
+        event_bus.publish(SESSION_CREATED, {"session": live.to_model().model_dump(mode="json")})
+        return live.to_model()
+
+    @staticmethod
+    async def get_active_sessions(db: AsyncSession) -> List[GameSession]:
+        """Get all active game sessions"""
+        if not live_sessions.is_warm:
+            await live_sessions.load(db)
+        return live_sessions.active()
+
+    @staticmethod
+    async def list_active_sessions(
+        db: AsyncSession,
+        mode: Optional[GameMode] = None,
+        min_score: Optional[int] = None,
+        limit: int = 50,
+        cursor: Optional[SessionCursor] = None
+    ) -> List[GameSession]:
+        """A page of active sessions, best score first"""
+        if not live_sessions.is_warm:
+            await live_sessions.load(db)
+        return live_sessions.page(mode, limit, min_score, cursor)
+
+    @staticmethod
+    async def count_active_sessions(db: AsyncSession, mode: Optional[GameMode] = None) -> int:
+        """Number of active sessions, optionally in one mode"""
+        if not live_sessions.is_warm:
+            await live_sessions.load(db)
+        return live_sessions.count(mode)
+
+    @staticmethod
+    async def get_session(db: AsyncSession, session_id: str) -> Optional[GameSession]:
+        """Get a game session by ID"""
+        live = live_sessions.get(session_id)
+        if live:
+            return live.to_model()
+        session = await db.get(DBGameSession, session_id)
+        return GameSession(**session.to_dict()) if session else None
+
+    @staticmethod
+    async def get_live_session(db: AsyncSession, session_id: str) -> Optional[LiveSession]:
+        """An active session, adopted into the store if this worker does not hold it yet"""
+        live = live_sessions.get(session_id)
+        if live:
+            return live
+        session = await db.get(DBGameSession, session_id)
+        if not session or not session.is_active:
+            return None
+        # Started before a restart, or its creation was missed
+        live = LiveSession.from_db(session)
+        live_sessions.add(live)
+        event_bus.publish(SESSION_CREATED, {"session": live.to_model().model_dump(mode="json")})
+        return live
+
+    @staticmethod
+    def set_live_score(session_id: str, score: int) -> bool:
+        """Update a session this worker holds; False if it does not hold it"""
+        if not live_sessions.update_score(session_id, score):
+            return False
+        event_bus.publish(SESSION_UPDATED, {"id": session_id, "score": score})
+        return True
+
+    @staticmethod
+    async def update_session_score(db: AsyncSession, session_id: str, score: int) -> bool:
+        """Update session score; active sessions are updated in memory"""
+        if AsyncDatabaseService.set_live_score(session_id, score):
+            return True
+        if await AsyncDatabaseService.get_live_session(db, session_id):
+            return AsyncDatabaseService.set_live_score(session_id, score)
+        session = await db.get(DBGameSession, session_id)
+        if not session:
+            return False
+        session.score = score
+        await db.commit()
+        return True
+
+    @staticmethod
+    async def end_session(db: AsyncSession, session_id: str) -> bool:
+        """End a game session, writing its final score"""
+        live = live_sessions.pop(session_id)
+        session = await db.get(DBGameSession, session_id)
+        if session:
+            if live:
+                session.score = live.score
+            session.is_active = False
+            await db.commit()
+            event_bus.publish(SESSION_ENDED, {"id": session_id, "score": session.score})
+            return True
+        return False
+
+
+# Singleton instance
+async_db_service = AsyncDatabaseService()
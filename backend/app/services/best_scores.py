@@ -0,0 +1,143 @@
+"""Statements maintaining best scores: user_best_scores and users.high_score
+
+submit_score upserts user_best_scores in the same transaction as the
+entry, so a leaderboard with one row per player is an index walk rather
+than a GROUP BY over leaderboard_entries. Both updates are single
+conditional statements, so concurrent submissions cannot lose a score.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, bindparam, exists, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+from ..db_models import DBUser, DBUserBestScore
+from ..models import GameMode, LeaderboardEntry
+from .leaderboard_cache import LeaderboardCursor, after_cursor
+
+
+def best_score_order():
+    """ORDER BY clause matching leaderboard_order()"""
+    return (
+        DBUserBestScore.score.desc(),
+        DBUserBestScore.timestamp.asc(),
+        DBUserBestScore.entry_id.asc(),
+    )
+
+
+def raise_high_score(user_id: str, score: int):
+    """
+    UPDATE users SET high_score = :score WHERE high_score < :score.
+
+    Equivalent to GREATEST(high_score, :score), which SQLite lacks, and
+    the row count tells whether the user row changed.
+    """
+    return update(DBUser).where(DBUser.id == user_id, DBUser.high_score < score).values(high_score=score)
+
+
+def raise_high_scores():
+    """raise_high_score for executemany, with b_user_id and b_score parameters"""
+    users = DBUser.__table__
+    return (
+        users.update()
+        .where(users.c.id == bindparam("b_user_id"), users.c.high_score < bindparam("b_score"))
+        .values(high_score=bindparam("b_score"))
+    )
+
+
+def dialect_insert(dialect_name: str):
+    """The insert() construct with ON CONFLICT support for the dialect"""
+    return postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+
+
+def best_score_upsert(dialect_name: str):
+    """INSERT ... ON CONFLICT that keeps the higher of the stored and new score"""
+    statement = dialect_insert(dialect_name)(DBUserBestScore)
+    return statement.on_conflict_do_update(
+        index_elements=[DBUserBestScore.user_id, DBUserBestScore.mode],
+        set_={
+            "score": statement.excluded.score,
+            "timestamp": statement.excluded.timestamp,
+            "entry_id": statement.excluded.entry_id,
+            "username": statement.excluded.username,
+        },
+        where=statement.excluded.score > DBUserBestScore.score
+    )
+
+
+def best_score_row(user_id: str, entry: LeaderboardEntry) -> dict:
+    """Parameters of best_score_upsert for one entry"""
+    return {
+        "user_id": user_id,
+        "mode": entry.mode,
+        "score": entry.score,
+        "timestamp": entry.timestamp,
+        "entry_id": entry.id,
+        "username": entry.username,
+    }
+
+
+def best_of_batch(batch: Iterable[Tuple[str, LeaderboardEntry]]) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    For a batch of (user_id, entry): best_score_upsert rows for the best
+    entry per user and mode, and the highest score per user.
+    """
+    best: Dict[Tuple[str, GameMode], Tuple[str, LeaderboardEntry]] = {}
+    for user_id, entry in batch:
+        current = best.get((user_id, entry.mode))
+        if current is None or entry.score > current[1].score:
+            best[(user_id, entry.mode)] = (user_id, entry)
+    high: Dict[str, int] = {}
+    for user_id, entry in best.values():
+        high[user_id] = max(high.get(user_id, entry.score), entry.score)
+    return [best_score_row(user_id, entry) for user_id, entry in best.values()], high
+
+
+def upsert_best_score(dialect_name: str, user_id: str, entry: LeaderboardEntry):
+    """best_score_upsert for a single entry"""
+    return best_score_upsert(dialect_name).values(**best_score_row(user_id, entry))
+
+
+def best_scores_query(
+    mode: Optional[GameMode] = None,
+    limit: int = 10,
+    cursor: Optional[LeaderboardCursor] = None
+):
+    """
+    One (entry id, username, score, mode, timestamp) row per user, best
+    first; see entry_from_row.
+
+    For a single mode this reads the (mode, score DESC) index directly.
+    Across modes a row is kept only if the same user has no better row in
+    another mode, which is a primary key probe per row read.
+    """
+    query = select(
+        DBUserBestScore.entry_id,
+        DBUserBestScore.username,
+        DBUserBestScore.score,
+        DBUserBestScore.mode,
+        DBUserBestScore.timestamp,
+    )
+    if mode:
+        query = query.where(DBUserBestScore.mode == mode)
+    else:
+        other = aliased(DBUserBestScore)
+        query = query.where(~exists().where(
+            other.user_id == DBUserBestScore.user_id,
+            other.mode != DBUserBestScore.mode,
+            or_(
+                other.score > DBUserBestScore.score,
+                and_(
+                    other.score == DBUserBestScore.score,
+                    or_(
+                        other.timestamp < DBUserBestScore.timestamp,
+                        and_(other.timestamp == DBUserBestScore.timestamp, other.entry_id < DBUserBestScore.entry_id),
+                    ),
+                ),
+            ),
+        ))
+    if cursor:
+        query = query.where(after_cursor(
+            cursor, DBUserBestScore.score, DBUserBestScore.timestamp, DBUserBestScore.entry_id
+        ))
+    return query.order_by(*best_score_order()).limit(limit)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from ..config import settings
+from ..engine.batch import BatchGame
+from ..engine.bot import choose_moves
+from ..metrics import metrics
+from ..models import GameMode
+
+
+class BotOpponentsBusy(Exception):
+    """Raised when every bot game slot is taken"""
+
+
+class BotOpponents:
+    """
+    Bot games played alongside players' games, decided in batches.
+
+    The games live in the rows ("slots") of one BatchGame of `max_games`
+    rows, so they play by the server's rules. Each tick is the same
+    computation for every game, so the ticks the players ask for are not
+    played one by one. Each call to step() queues its game. The first one
+    queued schedules a batch `batch_ms` later. The batch decides the moves
+    of all the queued games in one choose_moves() call (BFS and flood fill
+    on bitboards, see app/engine/bot.py), then plays them in one
+    BatchGame.step(). A longer window means fuller batches, and so fewer
+    decisions computed one by one, at the cost of that much latency per
+    tick.
+    """
+
+    def __init__(self, max_games: int = 1024, batch_ms: float = 10.0):
+        self.max_games = max_games
+        self.batch_ms = batch_ms
+        self.game = BatchGame([0] * max_games, [GameMode.WALLS] * max_games)
+        self._free: List[int] = list(range(max_games - 1, -1, -1))
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._scheduled: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def playing(self) -> int:
+        return self.max_games - len(self._free)
+
+    def start_game(self, seed: int, mode: GameMode) -> int:
+        """Start a bot game and return its slot; raises BotOpponentsBusy when none is free"""
+        if not self._free:
+            metrics.counter("bot_opponents.rejected").inc()
+            raise BotOpponentsBusy()
+        slot = self._free.pop()
+        self.game.restart(np.array([slot]), [seed], [mode])
+        metrics.gauge("bot_opponents.games").set(self.playing)
+        return slot
+
+    def end_game(self, slot: int):
+        future = self._pending.pop(slot, None)
+        if future is not None:
+            future.cancel()
+        self._free.append(slot)
+        metrics.gauge("bot_opponents.games").set(self.playing)
+
+    async def step(self, slot: int) -> int:
+        """Play the next tick of a game, not over yet; returns the direction the bot pressed"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[slot] = future
+        if self._scheduled is None:
+            self._scheduled = loop.call_later(self.batch_ms / 1000, self._play_batch)
+        return await future
+
+    def _play_batch(self):
+        self._scheduled = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        started = time.perf_counter()
+        rows = np.fromiter(pending, dtype=np.int64, count=len(pending))
+        codes = choose_moves(self.game, rows)
+        self.game.step(rows, codes)
+        for future, code in zip(pending.values(), codes.tolist()):
+            if not future.done():
+                future.set_result(code)
+        metrics.counter("bot_opponents.decisions").inc(rows.size)
+        metrics.summary("bot_opponents.batch_size").observe(rows.size)
+        metrics.summary("bot_opponents.batch_seconds").observe(time.perf_counter() - started)
+
+    def clear(self):
+        """Forget every game"""
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        self._pending.clear()
+        self._free = list(range(self.max_games - 1, -1, -1))
+
+
+# Singleton instance
+bot_opponents = BotOpponents(
+    max_games=settings.bot_opponent_max_games,
+    batch_ms=settings.bot_opponent_batch_ms,
+)
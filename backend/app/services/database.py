@@ -1,9 +1,18 @@
+from datetime import datetime
 from typing import List, Optional
+from sqlalchemy import and_, func, insert, or_
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from ..db_models import DBUser, DBLeaderboardEntry, DBGameSession
-from ..models import User, LeaderboardEntry, GameSession, GameMode
-from ..auth import hash_password, verify_password
+from ..models import User, LeaderboardEntry, GameSession, GameMode, LeaderboardWindow
+from .leaderboard_cache import (
+    ENTRY_COLUMNS, LeaderboardCursor, after_cursor, entry_from_row, is_accepted, leaderboard_order, window_bounds
+)
+from .live_sessions import SessionCursor
+from .best_scores import best_scores_query, raise_high_score, upsert_best_score
+from .event_bus import SCORE_SUBMITTED, USER_CHANGED, event_bus
+# The read models subscribe to the events published here
+from . import leaderboard_events, principal_cache, rank_index  # noqa: F401
+from ..auth import hash_password, verify_password, password_needs_rehash
 
 
 class DatabaseService:
@@ -23,6 +32,7 @@ class DatabaseService:
         db.add(db_user)
         db.commit()
         db.refresh(db_user)
+        event_bus.publish(USER_CHANGED, {"user_id": db_user.id})
         return User(**db_user.to_dict())
     
     @staticmethod
@@ -45,34 +55,55 @@ class DatabaseService:
         """Verify user password and return user if valid"""
         user = DatabaseService.get_user_by_email(db, email)
         if user and verify_password(password, user.hashed_password):
+            # Upgrade hashes made under an older cost profile
+            if password_needs_rehash(user.hashed_password):
+                user.hashed_password = hash_password(password)
+                db.commit()
             return user
         return None
     
     @staticmethod
     def update_user_high_score(db: Session, user_id: str, new_score: int) -> bool:
         """Update user's high score if new score is higher"""
-        user = DatabaseService.get_user_by_id(db, user_id)
-        if user and new_score > user.high_score:
-            user.high_score = new_score
-            db.commit()
-            return True
-        return False
+        raised = db.execute(raise_high_score(user_id, new_score)).rowcount > 0
+        db.commit()
+        if raised:
+            event_bus.publish(USER_CHANGED, {"user_id": user_id})
+        return raised
     
     # Leaderboard operations
     @staticmethod
     def get_leaderboard(
         db: Session, 
         mode: Optional[GameMode] = None, 
-        limit: int = 10
+        limit: int = 10,
+        cursor: Optional[LeaderboardCursor] = None,
+        window: LeaderboardWindow = LeaderboardWindow.ALL
     ) -> List[LeaderboardEntry]:
-        """Get leaderboard entries, optionally filtered by mode"""
-        query = db.query(DBLeaderboardEntry)
+        """Get leaderboard entries, optionally filtered by mode and window, after an optional cursor"""
+        query = db.query(*ENTRY_COLUMNS).filter(is_accepted())
         
         if mode:
             query = query.filter(DBLeaderboardEntry.mode == mode)
         
-        entries = query.order_by(desc(DBLeaderboardEntry.score)).limit(limit).all()
-        return [LeaderboardEntry(**entry.to_dict()) for entry in entries]
+        start, end = window_bounds(window, datetime.utcnow())
+        if start is not None:
+            query = query.filter(DBLeaderboardEntry.timestamp >= start, DBLeaderboardEntry.timestamp < end)
+        
+        if cursor:
+            query = query.filter(after_cursor(cursor))
+        
+        return [entry_from_row(row) for row in query.order_by(*leaderboard_order()).limit(limit)]
+    
+    @staticmethod
+    def get_best_scores(
+        db: Session,
+        mode: Optional[GameMode] = None,
+        limit: int = 10,
+        cursor: Optional[LeaderboardCursor] = None
+    ) -> List[LeaderboardEntry]:
+        """Get each user's best entry, optionally filtered by mode"""
+        return [entry_from_row(row) for row in db.execute(best_scores_query(mode, limit, cursor))]
     
     @staticmethod
     def submit_score(
@@ -82,21 +113,21 @@ class DatabaseService:
         score: int, 
         mode: GameMode
     ) -> LeaderboardEntry:
-        """Submit a score to the leaderboard"""
-        entry = DBLeaderboardEntry(
-            user_id=user_id,
-            username=username,
-            score=score,
-            mode=mode
-        )
-        db.add(entry)
+        """Submit a score, raising the user's best and high scores in the same transaction"""
+        row = db.execute(
+            insert(DBLeaderboardEntry)
+            .values(user_id=user_id, username=username, score=score, mode=mode)
+            .returning(DBLeaderboardEntry.id, DBLeaderboardEntry.timestamp)
+        ).one()
+        result = LeaderboardEntry(id=row.id, username=username, score=score, mode=mode, timestamp=row.timestamp)
+        db.execute(upsert_best_score(db.get_bind().dialect.name, user_id, result))
+        raised = db.execute(raise_high_score(user_id, score)).rowcount > 0
         db.commit()
-        db.refresh(entry)
-        
-        # Update user's high score if needed
-        DatabaseService.update_user_high_score(db, user_id, score)
         
-        return LeaderboardEntry(**entry.to_dict())
+        if raised:
+            event_bus.publish(USER_CHANGED, {"user_id": user_id})
+        event_bus.publish(SCORE_SUBMITTED, {"entry": result.model_dump(mode="json")})
+        return result
     
     # Session operations
     @staticmethod
@@ -115,10 +146,36 @@ class DatabaseService:
         return GameSession(**session.to_dict())
     
     @staticmethod
-    def get_active_sessions(db: Session) -> List[GameSession]:
-        """Get all active game sessions"""
-        sessions = db.query(DBGameSession).filter(DBGameSession.is_active == True).all()
-        return [GameSession(**session.to_dict()) for session in sessions]
+    def get_active_sessions(
+        db: Session,
+        mode: Optional[GameMode] = None,
+        min_score: Optional[int] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[SessionCursor] = None
+    ) -> List[GameSession]:
+        """Get active game sessions, best score first, optionally a page at a time"""
+        query = db.query(DBGameSession).filter(DBGameSession.is_active == True)
+        if mode:
+            query = query.filter(DBGameSession.mode == mode)
+        if min_score is not None:
+            query = query.filter(DBGameSession.score >= min_score)
+        if cursor:
+            query = query.filter(or_(
+                DBGameSession.score < cursor.score,
+                and_(DBGameSession.score == cursor.score, DBGameSession.id > cursor.id)
+            ))
+        query = query.order_by(DBGameSession.score.desc(), DBGameSession.id.asc())
+        if limit is not None:
+            query = query.limit(limit)
+        return [GameSession(**session.to_dict()) for session in query]
+    
+    @staticmethod
+    def count_active_sessions(db: Session, mode: Optional[GameMode] = None) -> int:
+        """Number of active sessions, optionally in one mode"""
+        query = db.query(func.count()).select_from(DBGameSession).filter(DBGameSession.is_active == True)
+        if mode:
+            query = query.filter(DBGameSession.mode == mode)
+        return query.scalar()
     
     @staticmethod
     def get_session(db: Session, session_id: str) -> Optional[GameSession]:
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy.engine import make_url
+from ..config import settings
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Topics
+SESSION_CREATED = "session.created"    # {"session": GameSession}
+SESSION_UPDATED = "session.updated"    # {"id", "score"}
+SESSION_ENDED = "session.ended"        # {"id", "score"}
+SESSION_INPUTS = "session.inputs"      # {"id", "tick", "moves"}
+SESSION_KEYFRAME = "session.keyframe"  # {"id", "keyframe": Game.state()}
+SCORE_SUBMITTED = "score.submitted"    # {"entry": LeaderboardEntry}
+USER_CHANGED = "user.changed"          # {"user_id"}
+
+# NOTIFY payloads must be shorter than this, in bytes
+NOTIFY_PAYLOAD_LIMIT = 8000
+
+
+class Event(NamedTuple):
+    topic: str
+    data: dict
+    origin: str  # bus that published it, one per process
+
+    def encode(self) -> bytes:
+        return json.dumps({"topic": self.topic, "data": self.data, "origin": self.origin}).encode()
+
+    @classmethod
+    def decode(cls, payload) -> "Event":
+        message = json.loads(payload)
+        return cls(message["topic"], message["data"], message["origin"])
+
+
+Handler = Callable[[Event], None]
+
+
+class EventBus:
+    """
+    Publish/subscribe between the workers serving the API.
+
+    publish() runs this process's handlers synchronously, so the worker
+    that made a change sees it applied when publish() returns, and then
+    hands the event to the backend for the other workers. Events arriving
+    from other workers run the same handlers; handlers subscribed with
+    remote_only=True only run for those (the local change was already
+    made by whoever published it). Event data must be JSON-serializable.
+
+    Delivery to other workers is best-effort: an event is lost if a worker
+    is not listening when it is sent, so what handlers keep must still be
+    recoverable from the database.
+    """
+
+    def __init__(self):
+        self.origin = os.urandom(8).hex()
+        self._handlers: Dict[str, List[Tuple[Handler, bool]]] = defaultdict(list)
+
+    def subscribe(self, topic: str, handler: Handler, remote_only: bool = False):
+        self._handlers[topic].append((handler, remote_only))
+
+    def publish(self, topic: str, data: dict):
+        event = Event(topic, data, self.origin)
+        self._dispatch(event, local=True)
+        metrics.counter("event_bus.published").inc()
+        self._send(event)
+
+    def _receive(self, event: Event):
+        """Called by the backend with events from any worker, including this one"""
+        if event.origin == self.origin:
+            return
+        metrics.counter("event_bus.received").inc()
+        self._dispatch(event, local=False)
+
+    def _dispatch(self, event: Event, local: bool):
+        for handler, remote_only in self._handlers.get(event.topic, ()):
+            if local and remote_only:
+                continue
+            try:
+                handler(event)
+            except Exception:
+                # One broken subscriber must not fail the publisher or starve the rest
+                logger.exception("Event handler for %s failed", event.topic)
+
+    def _send(self, event: Event):
+        """Hand an event to the other workers; must not block"""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class InMemoryEventBus(EventBus):
+    """
+    Backend for a single process, and for tests.
+
+    Buses created with the same `hub` list deliver to each other, which
+    stands in for several workers; events are JSON round-tripped on the
+    way as they would be over a real transport.
+    """
+
+    def __init__(self, hub: Optional[List["InMemoryEventBus"]] = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+
+    def _send(self, event: Event):
+        if len(self.hub) == 1:
+            return
+        payload = event.encode()
+        for bus in list(self.hub):
+            if bus is not self:
+                bus._receive(Event.decode(payload))
+
+
+class UnixSocketEventBus(EventBus):
+    """
+    Backend for several workers on one host, without a broker.
+
+    Every worker binds a datagram socket named after its origin in
+    `directory` and sends each event to all the other sockets there. The
+    list of those is kept, and read again every `peer_refresh_seconds` or
+    after a send fails, so a worker that just started may miss the events
+    of that long. Sockets left behind by workers that died are removed
+    the first time a send to them is refused. A worker whose receive
+    buffer is full misses the event rather than blocking the sender.
+    """
+
+    def __init__(self, directory: str, peer_refresh_seconds: float = 1.0):
+        super().__init__()
+        self.directory = directory
+        self.peer_refresh_seconds = peer_refresh_seconds
+        self._path = os.path.join(directory, f"{self.origin}.sock")
+        self._socket: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._peers: Optional[List[str]] = None
+        self._peers_listed = 0.0
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self._path)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._socket.fileno(), self._on_readable)
+
+    async def stop(self):
+        if self._socket is None:
+            return
+        self._loop.remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = self._loop = None
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+    def _on_readable(self):
+        while self._socket is not None:
+            try:
+                payload = self._socket.recv(65536)
+            except BlockingIOError:
+                return
+            try:
+                event = Event.decode(payload)
+            except (ValueError, KeyError):
+                logger.warning("Ignoring malformed event bus datagram")
+                continue
+            self._receive(event)
+
+    def _peer_paths(self) -> List[str]:
+        """The other workers' sockets, as last listed"""
+        now = time.monotonic()
+        if self._peers is None or now - self._peers_listed >= self.peer_refresh_seconds:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            paths = (os.path.join(self.directory, name) for name in names if name.endswith(".sock"))
+            self._peers = [path for path in paths if path != self._path]
+            self._peers_listed = now
+        return self._peers
+
+    def _send(self, event: Event):
+        if self._socket is None:
+            return
+        payload = event.encode()
+        for path in self._peer_paths():
+            try:
+                self._socket.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody is bound to it any more
+                self._peers = None
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                metrics.counter("event_bus.dropped").inc()
+            except OSError:
+                logger.exception("Sending an event to %s failed", path)
+                metrics.counter("event_bus.dropped").inc()
+                self._peers = None
+
+
+class PostgresEventBus(EventBus):
+    """
+    Backend for workers on several hosts sharing a PostgreSQL database.
+
+    Events are sent with NOTIFY on `channel` and received with LISTEN, on
+    one dedicated asyncpg connection owned by a background task, which
+    reconnects when the connection is lost. Events wait for it in a queue
+    of at most `queue_size`, beyond which they are dropped and counted in
+    event_bus.dropped. PostgreSQL limits payloads to under 8000 bytes:
+    larger events are dropped too, and counted in event_bus.oversized. The
+    largest events published are keyframes, about 2 KB with a snake that
+    fills the grid, and relayed inputs, of at most
+    SESSION_RELAY_KEYFRAME_TICKS moves each. A NOTIFY the server fails
+    anyway is logged and skipped, keeping the connection and its LISTEN.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str = "snake_arena_events",
+        reconnect_delay: float = 1.0,
+        queue_size: int = 10_000,
+    ):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+
+    def _send(self, event: Event):
+        if self._loop is None:
+            return
+        # publish() may be called from a thread other than the bus's loop
+        self._loop.call_soon_threadsafe(self._enqueue, event.encode().decode())
+
+    def _enqueue(self, payload: str):
+        size = len(payload.encode())
+        if size >= NOTIFY_PAYLOAD_LIMIT:
+            # NOTIFY would fail on it
+            logger.warning("Dropping an event of %d bytes, too large to notify", size)
+            metrics.counter("event_bus.oversized").inc()
+            return
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # The connection is down or too slow: shed rather than grow
+            metrics.counter("event_bus.dropped").inc()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            event = Event.decode(payload)
+        except (ValueError, KeyError):
+            logger.warning("Ignoring malformed notification on %s", channel)
+            return
+        self._receive(event)
+
+    async def _run(self):
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self._on_notify)
+                while True:
+                    payload = await self._queue.get()
+                    try:
+                        await connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                    except asyncpg.PostgresError:
+                        # The server refused this one; the connection is fine
+                        logger.exception("Notifying an event failed; dropping it")
+                        metrics.counter("event_bus.notify_failed").inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event bus connection failed; reconnecting in %.1fs", self.reconnect_delay)
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                if connection is not None:
+                    await connection.close()
+
+
+def create_event_bus(backend: str) -> EventBus:
+    """The bus for the configured backend: "memory", "unix" or "postgres" """
+    if backend == "memory":
+        return InMemoryEventBus()
+    if backend == "unix":
+        return UnixSocketEventBus(settings.event_bus_socket_dir)
+    if backend == "postgres":
+        dsn = make_url(settings.database_url).set(drivername="postgresql")
+        return PostgresEventBus(dsn.render_as_string(hide_password=False), settings.event_bus_channel)
+    raise ValueError(f"Unknown event bus backend: {backend}")
+
+
+# Singleton instance
+event_bus = create_event_bus(settings.event_bus)
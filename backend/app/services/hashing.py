@@ -0,0 +1,131 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+from ..auth import configure_password_hasher, hash_password, verify_password
+from ..config import settings
+from ..metrics import metrics
+
+
+class HashingPoolBusy(Exception):
+    """Raised when the hashing pool already has its maximum number of jobs queued"""
+
+
+def _timed_hash(password: str) -> Tuple[str, float]:
+    """Hash a password in a worker and report how long Argon2 took"""
+    started = time.perf_counter()
+    hashed = hash_password(password)
+    return hashed, time.perf_counter() - started
+
+
+def _timed_verify(plain_password: str, hashed_password: str) -> Tuple[bool, float]:
+    """Verify a password in a worker and report how long Argon2 took"""
+    started = time.perf_counter()
+    valid = verify_password(plain_password, hashed_password)
+    return valid, time.perf_counter() - started
+
+
+class HashingPool:
+    """
+    Runs Argon2 hashing and verification off the event loop.
+
+    Jobs go to a process pool by default (a thread pool if configured), and
+    at most `max_pending` jobs may be queued or running at once; beyond that
+    HashingPoolBusy is raised so the caller can shed load with a 503 instead
+    of letting a login storm queue up unbounded CPU work. A pool broken by
+    a worker that died is replaced, and the job that found it broken is
+    run again once.
+    """
+
+    def __init__(
+        self,
+        kind: str = "process",
+        workers: Optional[int] = None,
+        max_pending: int = 64,
+        profile: str = "rfc9106-low-memory",
+    ):
+        self.kind = kind
+        self.profile = profile
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+            else:
+                # spawn, not fork: the server process runs threads of its own
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=configure_password_hasher,
+                    initargs=(self.profile,),
+                )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            metrics.counter("password_hash.rejected").inc()
+            raise HashingPoolBusy()
+
+        self.pending += 1
+        metrics.gauge("password_hash.pending").set(self.pending)
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                result, hash_seconds = await loop.run_in_executor(executor, func, *args)
+            except BrokenExecutor:
+                # A worker died (killed, out of memory) and took the pool with
+                # it: replace the pool and try once more
+                metrics.counter("password_hash.pool_broken").inc()
+                self._drop(executor)
+                result, hash_seconds = await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+            metrics.gauge("password_hash.pending").set(self.pending)
+
+        elapsed = time.perf_counter() - submitted
+        metrics.summary("password_hash.hash_seconds").observe(hash_seconds)
+        metrics.summary("password_hash.queue_wait_seconds").observe(max(0.0, elapsed - hash_seconds))
+        return result
+
+    async def hash(self, password: str) -> str:
+        """Hash a password using Argon2"""
+        return await self._run(_timed_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against an Argon2 hash"""
+        return await self._run(_timed_verify, plain_password, hashed_password)
+
+    def configure(self, profile: str):
+        """Switch to another Argon2 cost profile; running workers are replaced"""
+        configure_password_hasher(profile)
+        self.profile = profile
+        self.shutdown()
+
+    def _drop(self, executor: Executor):
+        """Stop a broken pool; the next job starts a new one"""
+        executor.shutdown(wait=False, cancel_futures=True)
+        if self._executor is executor:
+            self._executor = None
+
+    def shutdown(self):
+        """Stop the worker pool; it is recreated on next use"""
+        if self._executor is not None:
+            self._drop(self._executor)
+
+
+# Singleton instance
+hashing_pool = HashingPool(
+    kind=settings.password_hash_executor,
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+    profile=settings.argon2_profile,
+)
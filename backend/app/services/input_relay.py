@@ -0,0 +1,182 @@
+import json
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+from ..config import settings
+from ..engine.simulator import Game, validate_moves
+from ..metrics import metrics
+from ..models import GameMode
+from .event_bus import SESSION_ENDED, SESSION_INPUTS, SESSION_KEYFRAME, event_bus
+from .live_sessions import live_sessions
+from .session_broadcast import Subscriber
+
+
+class RelayedGame:
+    """
+    The player's side of a relayed game, on the worker it is connected to.
+
+    Inputs are played on a server-side Game as they arrive and published
+    as they were sent; every `keyframe_ticks` ticks, and when the game
+    ends, the game's state is published as a keyframe.
+    """
+
+    def __init__(self, session_id: str, seed: int, mode: GameMode, keyframe_ticks: int):
+        self.session_id = session_id
+        self.game = Game(seed, mode)
+        self.keyframe_ticks = keyframe_ticks
+        event_bus.publish(SESSION_KEYFRAME, {"id": session_id, "keyframe": self.game.state()})
+
+    def play(self, moves: str):
+        """
+        Play and relay a run of moves. Raises InvalidReplay for unknown
+        moves, or for moves after the game ended, once the moves up to
+        its end are relayed.
+        """
+        validate_moves(moves)
+        first = self.game.tick
+        keyframe = False
+        try:
+            for key in moves:
+                self.game.step(key)
+                keyframe = keyframe or self.game.tick % self.keyframe_ticks == 0
+        finally:
+            played = self.game.tick - first
+            if played:
+                event_bus.publish(SESSION_INPUTS, {"id": self.session_id, "tick": first, "moves": moves[:played]})
+            if keyframe or (played and self.game.game_over):
+                event_bus.publish(SESSION_KEYFRAME, {"id": self.session_id, "keyframe": self.game.state()})
+
+
+class RelayBuffer:
+    """
+    A session's latest keyframe and the moves played since, in a ring of
+    at most `capacity` moves. Should the ring fill up before the next
+    keyframe (keyframes lost on the way), there is nothing to catch up
+    from until one arrives.
+    """
+
+    __slots__ = ("keyframe", "moves")
+
+    def __init__(self, capacity: int):
+        self.keyframe: Optional[dict] = None
+        self.moves: Deque[str] = deque(maxlen=capacity)
+
+    @property
+    def tick(self) -> Optional[int]:
+        """The tick the next move is played on"""
+        return None if self.keyframe is None else self.keyframe["tick"] + len(self.moves)
+
+    def set_keyframe(self, keyframe: dict):
+        self.keyframe = keyframe
+        self.moves.clear()
+
+    def add(self, tick: int, moves: str):
+        if self.keyframe is None:
+            return
+        # Moves the keyframe already includes are skipped; a gap is unrecoverable
+        skip = self.tick - tick
+        if skip < 0 or len(self.moves) + len(moves) - skip > self.moves.maxlen:
+            self.keyframe = None
+            self.moves.clear()
+            return
+        self.moves.extend(moves[skip:])
+
+    def catch_up(self) -> Optional[dict]:
+        if self.keyframe is None:
+            return None
+        return {"keyframe": self.keyframe, "moves": "".join(self.moves)}
+
+
+class InputRelay:
+    """
+    Relays live games to spectators as inputs plus periodic keyframes.
+
+    Rather than board frames, spectators get the player's moves, which
+    they play on their own copy of the game, and a keyframe (the full
+    state, see Game.state) every so many ticks to start from or resync
+    to. Every worker keeps each relayed session's RelayBuffer up to date
+    from the event bus, so a spectator joining on any worker is sent the
+    latest keyframe and the moves since, and is live straight away.
+
+    Each input or keyframe message is serialized once per session and the
+    same text queued for all of its spectators.
+    """
+
+    def __init__(self, keyframe_ticks: int = 100):
+        self.keyframe_ticks = keyframe_ticks
+        self._buffers: Dict[str, RelayBuffer] = {}
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+
+    def start_game(self, session_id: str, seed: int, mode: GameMode) -> RelayedGame:
+        return RelayedGame(session_id, seed, mode, self.keyframe_ticks)
+
+    def subscribe(self, session_id: str) -> Subscriber:
+        """
+        Subscribe to a session's relay. The subscriber's first message is
+        a "catchup" if the session has a keyframe to start from.
+        """
+        subscriber = Subscriber()
+        buffer = self._buffers.get(session_id)
+        catch_up = buffer.catch_up() if buffer else None
+        if catch_up is not None:
+            subscriber.deliver(json.dumps({"type": "catchup", "id": session_id, **catch_up}))
+        self._subscribers.setdefault(session_id, set()).add(subscriber)
+        metrics.gauge("input_relay.spectators").set(sum(len(s) for s in self._subscribers.values()))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber, session_id: str):
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[session_id]
+        metrics.gauge("input_relay.spectators").set(sum(len(s) for s in self._subscribers.values()))
+
+    def _buffer(self, session_id: str) -> Optional[RelayBuffer]:
+        buffer = self._buffers.get(session_id)
+        # Events from another worker may trail the session's end
+        if buffer is None and live_sessions.get(session_id) is not None:
+            # Room for the moves between two keyframes, and a late one
+            buffer = self._buffers[session_id] = RelayBuffer(2 * self.keyframe_ticks)
+        return buffer
+
+    def _fan_out(self, session_id: str, message: dict, close: bool = False):
+        subscribers = self._subscribers.get(session_id)
+        if not subscribers:
+            return
+        text = json.dumps(message)
+        for subscriber in list(subscribers):
+            subscriber.deliver(text)
+            if close:
+                subscriber.deliver(None)
+        metrics.counter("input_relay.messages").inc(len(subscribers))
+
+    def keyframe(self, session_id: str, keyframe: dict):
+        buffer = self._buffer(session_id)
+        if buffer is not None:
+            buffer.set_keyframe(keyframe)
+        self._fan_out(session_id, {"type": "keyframe", "id": session_id, "keyframe": keyframe})
+
+    def inputs(self, session_id: str, tick: int, moves: str):
+        buffer = self._buffer(session_id)
+        if buffer is not None:
+            buffer.add(tick, moves)
+        self._fan_out(session_id, {"type": "inputs", "id": session_id, "tick": tick, "moves": moves})
+
+    def ended(self, session_id: str, score: int):
+        self._buffers.pop(session_id, None)
+        self._fan_out(session_id, {"type": "ended", "id": session_id, "score": score}, close=True)
+
+    def clear(self):
+        self._buffers.clear()
+        self._subscribers.clear()
+
+
+# Singleton instance
+input_relay = InputRelay(keyframe_ticks=settings.session_relay_keyframe_ticks)
+event_bus.subscribe(
+    SESSION_KEYFRAME, lambda event: input_relay.keyframe(event.data["id"], event.data["keyframe"])
+)
+event_bus.subscribe(
+    SESSION_INPUTS, lambda event: input_relay.inputs(event.data["id"], event.data["tick"], event.data["moves"])
+)
+event_bus.subscribe(SESSION_ENDED, lambda event: input_relay.ended(event.data["id"], event.data["score"]))
@@ -0,0 +1,314 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from sqlalchemy import and_, or_, select
+from ..config import settings
+from ..db_models import DBLeaderboardEntry
+from ..models import EntryStatus, GameMode, LeaderboardEntry, LeaderboardWindow
+from ..pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# Largest `limit` GET /leaderboard/ accepts
+LEADERBOARD_MAX_LIMIT = 100
+
+
+class LeaderboardCursor(NamedTuple):
+    """Sort key of the last entry of a leaderboard page"""
+    score: int
+    timestamp: datetime
+    id: str
+
+    @classmethod
+    def from_entry(cls, entry: LeaderboardEntry) -> "LeaderboardCursor":
+        return cls(entry.score, entry.timestamp, entry.id)
+
+    @classmethod
+    def decode(cls, cursor: str) -> "LeaderboardCursor":
+        score, timestamp, entry_id = decode_cursor(cursor, 3)
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+            if timestamp.tzinfo is not None:
+                # Entry timestamps are naive UTC
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            return cls(int(score), timestamp, str(entry_id))
+        except (TypeError, ValueError, OverflowError) as exc:
+            raise InvalidCursor(str(exc))
+
+    def encode(self) -> str:
+        return encode_cursor([self.score, self.timestamp.isoformat(), self.id])
+
+
+# A LeaderboardEntry's fields, in order, for queries returning plain rows
+ENTRY_COLUMNS = (
+    DBLeaderboardEntry.id,
+    DBLeaderboardEntry.username,
+    DBLeaderboardEntry.score,
+    DBLeaderboardEntry.mode,
+    DBLeaderboardEntry.timestamp,
+)
+
+
+def entry_from_row(row) -> LeaderboardEntry:
+    """A LeaderboardEntry from an (id, username, score, mode, timestamp) row"""
+    id, username, score, mode, timestamp = row
+    return LeaderboardEntry(id=id, username=username, score=score, mode=mode, timestamp=timestamp)
+
+
+def is_accepted():
+    """WHERE clause for the entries the leaderboard shows: not pending or rejected replays"""
+    return DBLeaderboardEntry.status == EntryStatus.ACCEPTED
+
+
+def leaderboard_order():
+    """ORDER BY clause matching the cache: best score, then earliest, then id"""
+    return (
+        DBLeaderboardEntry.score.desc(),
+        DBLeaderboardEntry.timestamp.asc(),
+        DBLeaderboardEntry.id.asc(),
+    )
+
+
+def after_cursor(
+    cursor: LeaderboardCursor,
+    score=DBLeaderboardEntry.score,
+    timestamp=DBLeaderboardEntry.timestamp,
+    entry_id=DBLeaderboardEntry.id
+):
+    """WHERE clause selecting the entries ranked after the cursor"""
+    return or_(
+        score < cursor.score,
+        and_(
+            score == cursor.score,
+            or_(timestamp > cursor.timestamp, and_(timestamp == cursor.timestamp, entry_id > cursor.id)),
+        ),
+    )
+
+
+def window_bounds(window: LeaderboardWindow, now: datetime) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """[start, end) of the window period containing now, in UTC; unbounded for ALL"""
+    if window == LeaderboardWindow.ALL:
+        return None, None
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == LeaderboardWindow.DAY:
+        return day, day + timedelta(days=1)
+    if window == LeaderboardWindow.WEEK:
+        monday = day - timedelta(days=day.weekday())
+        return monday, monday + timedelta(days=7)
+    first = day.replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+
+def _sort_key(score: int, timestamp: datetime, entry_id: str) -> Tuple:
+    """Ascending key for best-first order"""
+    return (-score, timestamp, entry_id)
+
+
+class _Ranked:
+    """Heap item ordering entries from worst to best ranked"""
+
+    __slots__ = ("entry",)
+
+    def __init__(self, entry: LeaderboardEntry):
+        self.entry = entry
+
+    def __lt__(self, other: "_Ranked") -> bool:
+        a, b = self.entry, other.entry
+        if a.score != b.score:
+            return a.score < b.score
+        if a.timestamp != b.timestamp:
+            return a.timestamp > b.timestamp
+        return a.id > b.id
+
+
+class TopK:
+    """
+    The k best leaderboard entries.
+
+    A min-heap keyed on rank keeps the worst retained entry at the root, so
+    a submission is admitted or rejected in O(log k). The sorted view used
+    by reads is rebuilt lazily, only after the heap has changed.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[_Ranked] = []
+        self._ids: Set[str] = set()
+        self._sorted: Optional[List[LeaderboardEntry]] = []
+        self._sorted_keys: List[Tuple] = []
+
+    def push(self, entry: LeaderboardEntry) -> bool:
+        """Offer an entry; returns True if it made the top k"""
+        if entry.id in self._ids:
+            return False
+        item = _Ranked(entry)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif self._heap[0] < item:
+            evicted = heapq.heapreplace(self._heap, item)
+            self._ids.discard(evicted.entry.id)
+        else:
+            return False
+        self._ids.add(entry.id)
+        self._sorted = None
+        return True
+
+    def entries(self) -> List[LeaderboardEntry]:
+        """All retained entries, best first"""
+        if self._sorted is None:
+            self._sorted = [item.entry for item in sorted(self._heap, reverse=True)]
+            self._sorted_keys = [_sort_key(e.score, e.timestamp, e.id) for e in self._sorted]
+        return self._sorted
+
+    def rank_of(self, entry: LeaderboardEntry) -> int:
+        """1-based place of a retained entry"""
+        self.entries()
+        return bisect_left(self._sorted_keys, _sort_key(entry.score, entry.timestamp, entry.id)) + 1
+
+    def after(self, cursor: LeaderboardCursor) -> List[LeaderboardEntry]:
+        """Retained entries ranked after the cursor, best first"""
+        entries = self.entries()
+        return entries[bisect_right(self._sorted_keys, _sort_key(*cursor)):]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class _Period:
+    """Top-k boards for the current period of one leaderboard window"""
+
+    def __init__(self, start: Optional[datetime], end: Optional[datetime], k: int):
+        self.start = start
+        self.end = end
+        self.is_warm = False
+        self.boards: Dict[Optional[GameMode], TopK] = {mode: TopK(k) for mode in [None, *GameMode]}
+
+    def covers(self, timestamp: datetime) -> bool:
+        return (self.start is None or self.start <= timestamp) and (self.end is None or timestamp < self.end)
+
+
+class LeaderboardCache:
+    """
+    Materialized top-k leaderboard per game mode, plus one across all modes,
+    for every leaderboard window.
+
+    Each window is warmed from the database once (at startup, or lazily on
+    the first read) and then kept current by submit_score, so GET
+    /leaderboard/ never has to sort leaderboard_entries. The day, week and
+    month windows hold only their current period and are reloaded when a
+    read finds that the period has rolled over.
+    """
+
+    def __init__(self, k: int):
+        self.k = max(k, LEADERBOARD_MAX_LIMIT)
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the next read warms the cache again"""
+        self._periods: Dict[LeaderboardWindow, _Period] = {}
+
+    @property
+    def is_warm(self) -> bool:
+        return self.is_current(LeaderboardWindow.ALL)
+
+    def is_current(self, window: LeaderboardWindow, now: Optional[datetime] = None) -> bool:
+        """Whether the window is loaded and still in the period containing now"""
+        period = self._periods.get(window)
+        if period is None or not period.is_warm:
+            return False
+        return period.start == window_bounds(window, now or datetime.utcnow())[0]
+
+    async def load(
+        self,
+        db,
+        window: LeaderboardWindow = LeaderboardWindow.ALL,
+        now: Optional[datetime] = None
+    ) -> Optional[datetime]:
+        """
+        Warm one window for the period containing now.
+
+        Returns the start of the preceding period if this call moved the
+        window onto a new period, so the caller can compact it.
+        """
+        start, end = window_bounds(window, now or datetime.utcnow())
+        current = self._periods.get(window)
+        rolled_over = current is None or current.start != start
+        if rolled_over:
+            # Install the new period first so submissions made while the
+            # queries run are recorded into it
+            current = self._periods[window] = _Period(start, end, self.k)
+
+        period = _Period(start, end, self.k)
+        for mode, board in period.boards.items():
+            query = select(*ENTRY_COLUMNS).where(is_accepted())
+            if mode:
+                query = query.where(DBLeaderboardEntry.mode == mode)
+            if start is not None:
+                query = query.where(DBLeaderboardEntry.timestamp >= start, DBLeaderboardEntry.timestamp < end)
+            result = await db.execute(query.order_by(*leaderboard_order()).limit(self.k))
+            for row in result:
+                board.push(entry_from_row(row))
+
+        # Keep submissions that arrived while the queries were running
+        for mode, board in current.boards.items():
+            for entry in board.entries():
+                period.boards[mode].push(entry)
+
+        period.is_warm = True
+        if self._periods.get(window) is current:
+            self._periods[window] = period
+        if rolled_over and start is not None:
+            return window_bounds(window, start - timedelta(microseconds=1))[0]
+        return None
+
+    def record(self, entry: LeaderboardEntry) -> List[Tuple[Optional[GameMode], int]]:
+        """
+        Account for a newly committed leaderboard entry.
+
+        Returns the (mode, rank) places it took on the all-time boards,
+        where None is the board across all modes.
+        """
+        changes = []
+        for window, period in self._periods.items():
+            if not period.covers(entry.timestamp):
+                continue
+            for mode in (None, entry.mode):
+                board = period.boards[mode]
+                if board.push(entry) and window == LeaderboardWindow.ALL:
+                    changes.append((mode, board.rank_of(entry)))
+        return changes
+
+    def _board(self, window: LeaderboardWindow, mode: Optional[GameMode]) -> TopK:
+        period = self._periods.get(window)
+        return period.boards[mode] if period else TopK(self.k)
+
+    def top(
+        self,
+        mode: Optional[GameMode] = None,
+        limit: int = 10,
+        window: LeaderboardWindow = LeaderboardWindow.ALL
+    ) -> List[LeaderboardEntry]:
+        return self._board(window, mode).entries()[:limit]
+
+    def page_after(
+        self,
+        cursor: LeaderboardCursor,
+        mode: Optional[GameMode] = None,
+        limit: int = 10,
+        window: LeaderboardWindow = LeaderboardWindow.ALL
+    ) -> Optional[List[LeaderboardEntry]]:
+        """
+        The page following the cursor, or None if it reaches past the cache.
+
+        The cache holds exactly the k best entries, so a page that fits
+        inside it, or any page while fewer than k entries exist at all,
+        can be answered without the database.
+        """
+        board = self._board(window, mode)
+        page = board.after(cursor)[:limit]
+        if len(page) == limit or len(board) < board.k:
+            return page
+        return None
+
+
+# Singleton instance
+leaderboard_cache = LeaderboardCache(settings.leaderboard_cache_size)
@@ -0,0 +1,103 @@
+import json
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from ..config import settings
+from ..metrics import metrics
+from ..models import GameMode, LeaderboardEntry
+from .event_bus import SCORE_SUBMITTED, Event, event_bus
+from .leaderboard_cache import leaderboard_cache
+from .session_broadcast import Subscriber
+
+# (sequence number, board mode, rank, formatted SSE event)
+RankEvent = Tuple[int, Optional[GameMode], int, str]
+
+
+def format_event(event_id: str, event: str, data) -> str:
+    """One text/event-stream message"""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class LeaderboardEvents:
+    """
+    Rank changes on the all-time leaderboard, for the SSE stream.
+
+    Each change is formatted once and queued for every subscriber of that
+    board whose top-N it falls in. The most recent `buffer_size` events
+    are kept so a client reconnecting with Last-Event-ID receives what it
+    missed instead of a new snapshot. Event ids are "<epoch>-<sequence>";
+    the epoch changes with every process, so ids from before a restart
+    never match and such clients get a snapshot.
+    """
+
+    def __init__(self, buffer_size: int = 1000):
+        self.epoch = os.urandom(4).hex()
+        self._sequence = 0
+        self._buffer: Deque[RankEvent] = deque(maxlen=buffer_size)
+        self._subscribers: Dict[Optional[GameMode], Dict[Subscriber, int]] = {
+            mode: {} for mode in [None, *GameMode]
+        }
+
+    @property
+    def last_event_id(self) -> str:
+        return f"{self.epoch}-{self._sequence}"
+
+    def subscribe(self, mode: Optional[GameMode], limit: int) -> Subscriber:
+        subscriber = Subscriber()
+        self._subscribers[mode][subscriber] = limit
+        metrics.gauge("leaderboard_stream.subscribers").set(self.subscribers)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber, mode: Optional[GameMode]):
+        self._subscribers[mode].pop(subscriber, None)
+        metrics.gauge("leaderboard_stream.subscribers").set(self.subscribers)
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, entry: LeaderboardEntry, changes: List[Tuple[Optional[GameMode], int]]):
+        """Publish the places an entry took, as returned by leaderboard_cache.record"""
+        for mode, rank in changes:
+            self._sequence += 1
+            text = format_event(self.last_event_id, "rank", {
+                "mode": mode.value if mode else None,
+                "rank": rank,
+                "entry": entry.model_dump(mode="json"),
+            })
+            self._buffer.append((self._sequence, mode, rank, text))
+            for subscriber, limit in list(self._subscribers[mode].items()):
+                if rank <= limit:
+                    subscriber.deliver(text)
+
+    def since(self, last_event_id: str, mode: Optional[GameMode], limit: int) -> Optional[List[str]]:
+        """
+        Events after last_event_id for a board, or None if they are no longer
+        all buffered (or the id is not from this process) and the client
+        needs a snapshot instead.
+        """
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) > self._sequence:
+            return None
+        sequence = int(sequence)
+        oldest = self._buffer[0][0] if self._buffer else self._sequence + 1
+        if sequence < oldest - 1:
+            return None
+        return [text for seq, board, rank, text in self._buffer if seq > sequence and board == mode and rank <= limit]
+
+    def clear(self):
+        self._buffer.clear()
+        for subscribers in self._subscribers.values():
+            subscribers.clear()
+
+
+# Singleton instance
+leaderboard_events = LeaderboardEvents(settings.leaderboard_stream_buffer_size)
+
+
+def _on_score_submitted(event: Event):
+    entry = LeaderboardEntry(**event.data["entry"])
+    leaderboard_events.publish(entry, leaderboard_cache.record(entry))
+
+
+event_bus.subscribe(SCORE_SUBMITTED, _on_score_submitted)
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, List, NamedTuple, Optional
+from sqlalchemy import bindparam, select
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..db_models import DBGameSession
+from ..metrics import metrics
+from ..models import GameMode, GameSession
+from ..pagination import InvalidCursor, decode_cursor, encode_cursor
+from .event_bus import SESSION_CREATED, SESSION_ENDED, SESSION_UPDATED, Event, event_bus
+
+logger = logging.getLogger(__name__)
+
+
+class LiveSession:
+    """In-memory state of an active game session"""
+
+    __slots__ = ("id", "user_id", "username", "score", "mode", "dirty")
+
+    def __init__(self, id: str, user_id: str, username: str, score: int, mode: GameMode):
+        self.id = id
+        self.user_id = user_id
+        self.username = username
+        self.score = score
+        self.mode = mode
+        self.dirty = False
+
+    @classmethod
+    def from_db(cls, session: DBGameSession) -> "LiveSession":
+        return cls(session.id, session.user_id, session.username, session.score, session.mode)
+
+    def to_model(self, is_active: bool = True) -> GameSession:
+        return GameSession(
+            id=self.id,
+            userId=self.user_id,
+            username=self.username,
+            score=self.score,
+            mode=self.mode,
+            isActive=is_active
+        )
+
+
+class SessionCursor(NamedTuple):
+    """Sort key of the last session of a page: best score first, then id"""
+    score: int
+    id: str
+
+    @classmethod
+    def from_session(cls, session: GameSession) -> "SessionCursor":
+        return cls(session.score, session.id)
+
+    @classmethod
+    def decode(cls, cursor: str) -> "SessionCursor":
+        score, session_id = decode_cursor(cursor, 2)
+        try:
+            return cls(int(score), str(session_id))
+        except (TypeError, ValueError) as exc:
+            raise InvalidCursor(str(exc))
+
+    def encode(self) -> str:
+        return encode_cursor([self.score, self.id])
+
+
+class SortedKeys:
+    """
+    Unique keys kept sorted in chunks of up to 2 * `load`, each chunk
+    sorted and the chunks in order, with the last key of each alongside.
+    Finding a key is a bisect of those last keys, then of its chunk, and
+    adding or removing one only shifts the rest of its chunk, so neither
+    costs O(n) as in one flat sorted list.
+    """
+
+    def __init__(self, load: int = 512):
+        self.load = load
+        self._len = 0
+        self._chunks: List[List[Any]] = []
+        self._maxes: List[Any] = []
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+        else:
+            i = bisect_left(self._maxes, key)
+            if i == len(self._maxes):
+                i -= 1
+                self._chunks[i].append(key)
+                self._maxes[i] = key
+            else:
+                insort(self._chunks[i], key)
+            chunk = self._chunks[i]
+            if len(chunk) > 2 * self.load:
+                self._chunks.insert(i + 1, chunk[self.load:])
+                del chunk[self.load:]
+                self._maxes.insert(i, chunk[-1])
+        self._len += 1
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+        self._len -= 1
+
+    def between(self, after=None, upto=None, limit: Optional[int] = None) -> List[Any]:
+        """At most `limit` keys, in order, above `after` and up to `upto`"""
+        keys: List[Any] = []
+        i = bisect_right(self._maxes, after) if after is not None else 0
+        j = bisect_right(self._chunks[i], after) if after is not None and i < len(self._chunks) else 0
+        while i < len(self._chunks):
+            for key in self._chunks[i][j:]:
+                if (upto is not None and key > upto) or len(keys) == limit:
+                    return keys
+                keys.append(key)
+            i, j = i + 1, 0
+        return keys
+
+
+class LiveSessionStore:
+    """
+    Owner of active game session state.
+
+    Score updates only touch memory and mark the session dirty; dirty
+    scores are checkpointed to game_sessions in one batched UPDATE every
+    `checkpoint_interval` seconds, and a session's final state is written
+    when it ends. A crash loses at most one interval of live scores, which
+    are transient anyway: the leaderboard entry is submitted separately.
+
+    Sessions are also kept ranked, per mode and across modes, as
+    SortedKeys of (-score, id), so a page of the listing costs a bisect
+    rather than a scan of every active session, and a score update does
+    not shift every key ranked below it.
+
+    The store is per process. Changes made by other workers arrive on the
+    event bus and are mirrored without marking the session dirty, since
+    the worker that made them checkpoints them. Sessions the store does
+    not hold (ended ones, or ones it missed events for) are read from the
+    database.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, checkpoint_interval: float = 5.0):
+        self.session_factory = session_factory
+        self.checkpoint_interval = checkpoint_interval
+        self._task: Optional[asyncio.Task] = None
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the next listing loads active sessions again"""
+        self.is_warm = False
+        self._sessions: Dict[str, LiveSession] = {}
+        self._ranked: Dict[Optional[GameMode], SortedKeys] = {mode: SortedKeys() for mode in [None, *GameMode]}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def load(self, db):
+        """Adopt the active sessions recorded in the database"""
+        result = await db.execute(select(DBGameSession).where(DBGameSession.is_active == True))
+        for session in result.scalars():
+            if session.id not in self._sessions:
+                self.add(LiveSession.from_db(session))
+        self.is_warm = True
+        metrics.gauge("live_sessions.active").set(len(self._sessions))
+
+    def _rank(self, session: LiveSession):
+        key = (-session.score, session.id)
+        self._ranked[None].add(key)
+        self._ranked[session.mode].add(key)
+
+    def _unrank(self, session: LiveSession):
+        key = (-session.score, session.id)
+        self._ranked[None].remove(key)
+        self._ranked[session.mode].remove(key)
+
+    def add(self, session: LiveSession):
+        previous = self._sessions.get(session.id)
+        if previous is not None:
+            self._unrank(previous)
+        self._sessions[session.id] = session
+        self._rank(session)
+        metrics.gauge("live_sessions.active").set(len(self._sessions))
+
+    def get(self, session_id: str) -> Optional[LiveSession]:
+        return self._sessions.get(session_id)
+
+    def active(self) -> List[GameSession]:
+        return [session.to_model() for session in self._sessions.values()]
+
+    def count(self, mode: Optional[GameMode] = None) -> int:
+        return len(self._ranked[mode])
+
+    def page(
+        self,
+        mode: Optional[GameMode] = None,
+        limit: int = 50,
+        min_score: Optional[int] = None,
+        cursor: Optional[SessionCursor] = None
+    ) -> List[GameSession]:
+        """Active sessions by best score, then id, after `cursor`"""
+        keys = self._ranked[mode].between(
+            after=(-cursor.score, cursor.id) if cursor else None,
+            upto=(-min_score, "\uffff") if min_score is not None else None,
+            limit=limit,
+        )
+        return [self._sessions[session_id].to_model() for _, session_id in keys]
+
+    def update_score(self, session_id: str, score: int, dirty: bool = True) -> bool:
+        """Set a live session's score; False if the store does not hold it"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        if score != session.score:
+            self._unrank(session)
+            session.score = score
+            self._rank(session)
+        session.dirty = session.dirty or dirty
+        return True
+
+    def pop(self, session_id: str) -> Optional[LiveSession]:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._unrank(session)
+        metrics.gauge("live_sessions.active").set(len(self._sessions))
+        return session
+
+    async def checkpoint(self, db) -> int:
+        """Write the scores of dirty sessions in one batch; returns how many"""
+        dirty = [session for session in self._sessions.values() if session.dirty]
+        if not dirty:
+            return 0
+        for session in dirty:
+            session.dirty = False
+
+        started = time.perf_counter()
+        sessions = DBGameSession.__table__
+        try:
+            await db.execute(
+                sessions.update().where(sessions.c.id == bindparam("b_id")).values(score=bindparam("b_score")),
+                [{"b_id": session.id, "b_score": session.score} for session in dirty]
+            )
+            await db.commit()
+        except BaseException:
+            for session in dirty:
+                session.dirty = True
+            raise
+
+        metrics.counter("live_sessions.checkpointed").inc(len(dirty))
+        metrics.summary("live_sessions.checkpoint_seconds").observe(time.perf_counter() - started)
+        return len(dirty)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                async with self.session_factory() as db:
+                    await self.checkpoint(db)
+            except Exception:
+                logger.exception("Live session checkpoint failed; retrying next interval")
+
+    def start(self):
+        """Start checkpointing in the background"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write a last checkpoint"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            async with self.session_factory() as db:
+                await self.checkpoint(db)
+        except Exception:
+            logger.exception("Final live session checkpoint failed")
+
+
+# Singleton instance
+live_sessions = LiveSessionStore(checkpoint_interval=settings.live_session_checkpoint_seconds)
+
+
+def _on_remote_session_created(event: Event):
+    session = event.data["session"]
+    live_sessions.add(LiveSession(
+        session["id"], session["userId"], session["username"], session["score"], GameMode(session["mode"])
+    ))
+
+
+event_bus.subscribe(SESSION_CREATED, _on_remote_session_created, remote_only=True)
+event_bus.subscribe(
+    SESSION_UPDATED, lambda event: live_sessions.update_score(event.data["id"], event.data["score"], dirty=False),
+    remote_only=True
+)
+event_bus.subscribe(SESSION_ENDED, lambda event: live_sessions.pop(event.data["id"]), remote_only=True)
@@ -0,0 +1,107 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from ..config import settings
+from ..metrics import metrics
+from ..models import User
+from .event_bus import USER_CHANGED, event_bus
+
+
+class TTLCache:
+    """
+    Size-bounded mapping whose entries expire.
+
+    Entries are kept in least-recently-used order; inserting past `max_size`
+    evicts the least recently used one, and expired entries are dropped
+    when they are looked up.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PrincipalCache:
+    """
+    Cache of authenticated principals for get_current_user.
+
+    Decoded tokens are cached by the SHA-256 of the token (the token itself
+    is never kept), mapping to the user id in its `sub` claim; users are
+    cached by id. A token entry never outlives the token's own `exp`.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.tokens = TTLCache(max_size, ttl)
+        self.users = TTLCache(max_size, ttl)
+
+    @staticmethod
+    def _token_key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get_token_subject(self, token: str) -> Optional[str]:
+        """Return the user id of an already validated token"""
+        user_id = self.tokens.get(self._token_key(token))
+        metrics.counter("principal_cache.token_hits" if user_id else "principal_cache.token_misses").inc()
+        return user_id
+
+    def put_token(self, token: str, user_id: str, expires_at: Optional[int] = None):
+        """Remember a validated token; expires_at is its `exp` claim"""
+        ttl = None
+        if expires_at is not None:
+            ttl = expires_at - time.time()
+            if ttl <= 0:
+                return
+        self.tokens.set(self._token_key(token), user_id, ttl)
+
+    def get_user(self, user_id: str) -> Optional[User]:
+        user = self.users.get(user_id)
+        metrics.counter("principal_cache.user_hits" if user else "principal_cache.user_misses").inc()
+        return user
+
+    def put_user(self, user: User):
+        self.users.set(user.id, user)
+
+    def invalidate_user(self, user_id: str):
+        """Drop a cached user after its row changed"""
+        self.users.pop(user_id)
+
+    def clear(self):
+        self.tokens.clear()
+        self.users.clear()
+
+
+# Singleton instance
+principal_cache = PrincipalCache(
+    max_size=settings.principal_cache_max_size,
+    ttl=settings.principal_cache_ttl_seconds,
+)
+event_bus.subscribe(USER_CHANGED, lambda event: principal_cache.invalidate_user(event.data["user_id"]))
@@ -0,0 +1,169 @@
+from bisect import bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, select
+from ..db_models import DBLeaderboardEntry
+from ..models import GameMode, LeaderboardEntry
+from .leaderboard_cache import is_accepted
+from .event_bus import SCORE_SUBMITTED, event_bus
+
+
+class FenwickTree:
+    """Binary indexed tree over non-negative counts: O(log n) add and prefix sum"""
+
+    def __init__(self, counts: List[int]):
+        # O(n) construction: push each node's sum up to its parent once
+        self._tree = [0] + list(counts)
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self) -> int:
+        return len(self._tree) - 1
+
+    def add(self, index: int, delta: int):
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index: int) -> int:
+        """Sum of counts[0..index]"""
+        total = 0
+        i = min(index, len(self) - 1) + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class ScoreRankIndex:
+    """
+    Order-statistic index over the scores of one leaderboard.
+
+    Scores are bucketed by exact value in a Fenwick tree, so counting the
+    entries above a score and recording a new entry are both O(log S),
+    where S is the largest score seen, independent of the number of
+    entries. The tree doubles as scores grow up to `max_capacity`; the rare
+    scores beyond that go to a sorted overflow list.
+    """
+
+    def __init__(self, capacity: int = 1 << 12, max_capacity: int = 1 << 20):
+        self.max_capacity = max_capacity
+        self.total = 0
+        self._counts = [0] * capacity
+        self._tree = FenwickTree(self._counts)
+        self._overflow: List[int] = []
+
+    @classmethod
+    def from_histogram(cls, histogram: Iterable[Tuple[int, int]], max_capacity: int = 1 << 20) -> "ScoreRankIndex":
+        """Build from (score, count) pairs in O(S + n)"""
+        histogram = list(histogram)
+        index = cls(max_capacity=max_capacity)
+        top = max((max(score, 0) for score, _ in histogram), default=0)
+        index._resize(min(top + 1, max_capacity))
+        for score, count in histogram:
+            score = max(score, 0)
+            if score >= max_capacity:
+                index._overflow.extend([score] * count)
+            else:
+                index._counts[score] += count
+            index.total += count
+        index._overflow.sort()
+        index._tree = FenwickTree(index._counts)
+        return index
+
+    def _resize(self, needed: int):
+        capacity = len(self._counts)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._counts.extend([0] * (min(capacity, self.max_capacity) - len(self._counts)))
+        self._tree = FenwickTree(self._counts)
+
+    def add(self, score: int, count: int = 1):
+        """Record `count` entries with this score (negative scores count as 0)"""
+        score = max(score, 0)
+        self.total += count
+        if score >= self.max_capacity:
+            for _ in range(count):
+                insort(self._overflow, score)
+            return
+        self._resize(score + 1)
+        self._counts[score] += count
+        self._tree.add(score, count)
+
+    def count_at_or_below(self, score: int) -> int:
+        if score < 0:
+            return 0
+        below = self._tree.prefix_sum(min(score, len(self._counts) - 1))
+        return below + bisect_right(self._overflow, score)
+
+    def count_above(self, score: int) -> int:
+        return self.total - self.count_at_or_below(score)
+
+    def rank(self, score: int) -> int:
+        """1-based place a score would take: one more than the entries strictly above it"""
+        return self.count_above(score) + 1
+
+
+class LeaderboardRankIndex:
+    """ScoreRankIndex per game mode plus one across all modes"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the next lookup loads the index again"""
+        self.is_warm = False
+        self._indexes: Dict[Optional[GameMode], ScoreRankIndex] = {
+            mode: ScoreRankIndex() for mode in [None, *GameMode]
+        }
+        self._recorded_while_loading: Optional[List[LeaderboardEntry]] = None
+
+    async def load(self, db):
+        """Build the indexes from a per-score histogram of leaderboard_entries"""
+        self._recorded_while_loading = []
+        try:
+            result = await db.execute(
+                select(DBLeaderboardEntry.mode, DBLeaderboardEntry.score, func.count())
+                .where(is_accepted())
+                .group_by(DBLeaderboardEntry.mode, DBLeaderboardEntry.score)
+            )
+            rows = result.all()
+        finally:
+            recorded, self._recorded_while_loading = self._recorded_while_loading, None
+
+        histograms: Dict[Optional[GameMode], List[Tuple[int, int]]] = {mode: [] for mode in [None, *GameMode]}
+        for mode, score, count in rows:
+            histograms[mode].append((score, count))
+            histograms[None].append((score, count))
+        self._indexes = {mode: ScoreRankIndex.from_histogram(h) for mode, h in histograms.items()}
+
+        # Unlike the top-k cache, counts cannot be deduplicated by id: an
+        # entry committed while the query ran may be counted twice. Startup
+        # warming has no concurrent submissions, so only a lazy warm-up
+        # under load can be off, by the few entries submitted meanwhile.
+        for entry in recorded:
+            self.record(entry)
+        self.is_warm = True
+
+    def record(self, entry: LeaderboardEntry):
+        """Account for a newly committed leaderboard entry"""
+        if self._recorded_while_loading is not None:
+            self._recorded_while_loading.append(entry)
+            return
+        self._indexes[None].add(entry.score)
+        self._indexes[entry.mode].add(entry.score)
+
+    def rank(self, score: int, mode: Optional[GameMode] = None) -> int:
+        return self._indexes[mode].rank(score)
+
+    def total(self, mode: Optional[GameMode] = None) -> int:
+        return self._indexes[mode].total
+
+
+# Singleton instance
+rank_index = LeaderboardRankIndex()
+event_bus.subscribe(SCORE_SUBMITTED, lambda event: rank_index.record(LeaderboardEntry(**event.data["entry"])))
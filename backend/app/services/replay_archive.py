@@ -0,0 +1,151 @@
+import fcntl
+import mmap
+import os
+import struct
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..config import settings
+from ..metrics import metrics
+
+# Index record: entry id (UUID bytes), offset and length in the segment
+INDEX_RECORD = struct.Struct("!16sQI")
+
+
+class ReplayArchive:
+    """
+    Append-only store of encoded replays, keyed by leaderboard entry id.
+
+    Replays are appended to numbered segment files (NNNNNNNN.seg), a new
+    one once the last reaches `segment_bytes`, and each gets a fixed-size
+    record in the segment's index file (NNNNNNNN.idx). Appends from any
+    process are serialised by an flock on the directory's lock file, and
+    the replay is flushed before its index record, so an indexed replay is
+    always complete.
+
+    Reads go through an mmap of the segment and return a memoryview into
+    it: nothing is copied until the bytes are sent. An id not in the
+    in-memory index makes it read the index records appended since, by
+    this process or another, at most once every `refresh_seconds`: misses
+    in between are answered from the index as it is. So a replay another
+    process archived can be missing for that long, and requests for ids
+    that have none don't read every index file each.
+    """
+
+    def __init__(self, directory: str = "./replays", segment_bytes: int = 64 * 1024 * 1024,
+                 refresh_seconds: float = 1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.refresh_seconds = refresh_seconds
+        self._refreshed: Optional[float] = None
+        self._index: Dict[bytes, Tuple[int, int, int]] = {}  # id -> (segment, offset, length)
+        self._index_read: Dict[int, int] = {}  # segment -> bytes of its index read
+        self._maps: Dict[int, mmap.mmap] = {}
+
+    def _path(self, segment: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"{segment:08d}.{suffix}")
+
+    def _segments(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".idx"))
+
+    def append(self, entry_id: str, replay: bytes):
+        """Store a replay; durable once this returns"""
+        self.append_many([(entry_id, replay)])
+
+    def append_many(self, replays: Iterable[Tuple[str, bytes]]):
+        """
+        Store replays under one lock, with one fsync per file written;
+        durable once this returns. It blocks, so the event loop calls it
+        in a thread.
+        """
+        replays = [(uuid.UUID(entry_id).bytes, replay) for entry_id, replay in replays]
+        if not replays:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        locations = []
+        with open(os.path.join(self.directory, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            segments = self._segments()
+            segment = segments[-1] if segments else 0
+            size = os.path.getsize(self._path(segment, "seg")) if segments else 0
+            # Each segment written: the data first, then its index records
+            pending: Dict[int, Tuple[List[bytes], List[bytes]]] = {}
+            for key, replay in replays:
+                if size >= self.segment_bytes:
+                    segment, size = segment + 1, 0
+                data, records = pending.setdefault(segment, ([], []))
+                data.append(replay)
+                records.append(INDEX_RECORD.pack(key, size, len(replay)))
+                locations.append((key, (segment, size, len(replay))))
+                size += len(replay)
+            for segment, (data, records) in pending.items():
+                self._write(self._path(segment, "seg"), data)
+                self._write(self._path(segment, "idx"), records)
+        self._index.update(locations)
+        metrics.counter("replay_archive.appended").inc(len(replays))
+        metrics.counter("replay_archive.bytes").inc(sum(len(replay) for _, replay in replays))
+
+    @staticmethod
+    def _write(path: str, chunks: List[bytes]):
+        with open(path, "ab") as file:
+            file.write(b"".join(chunks))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _refresh(self):
+        """Read the index records appended since the last refresh"""
+        self._refreshed = time.monotonic()
+        for segment in self._segments():
+            with open(self._path(segment, "idx"), "rb") as index:
+                index.seek(self._index_read.get(segment, 0))
+                records = index.read()
+            # A record being written by another process is read next time
+            whole = len(records) - len(records) % INDEX_RECORD.size
+            for key, offset, length in INDEX_RECORD.iter_unpack(records[:whole]):
+                self._index[key] = (segment, offset, length)
+            self._index_read[segment] = self._index_read.get(segment, 0) + whole
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        """A map of the segment covering at least its first `end` bytes"""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            # Views into a previous, shorter map keep it alive until released
+            with open(self._path(segment, "seg"), "rb") as data:
+                mapped = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def get(self, entry_id: str) -> Optional[memoryview]:
+        """The encoded replay of an entry, or None if it has none"""
+        try:
+            key = uuid.UUID(entry_id).bytes
+        except ValueError:
+            return None
+        location = self._index.get(key)
+        if location is None:
+            if self._refreshed is not None and time.monotonic() - self._refreshed < self.refresh_seconds:
+                metrics.counter("replay_archive.refresh_skipped").inc()
+                return None
+            self._refresh()
+            location = self._index.get(key)
+            if location is None:
+                return None
+        segment, offset, length = location
+        return memoryview(self._map(segment, offset + length))[offset:offset + length]
+
+    def clear(self):
+        """Forget the index and maps; the files are left alone"""
+        self._index.clear()
+        self._index_read.clear()
+        self._maps.clear()
+        self._refreshed = None
+
+
+# Singleton instance
+replay_archive = ReplayArchive(
+    directory=settings.replay_archive_dir,
+    segment_bytes=settings.replay_archive_segment_bytes,
+    refresh_seconds=settings.replay_archive_refresh_seconds,
+)
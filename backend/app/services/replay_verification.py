@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import and_, func, or_, select
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..db_models import DBLeaderboardEntry, DBLeaderboardReplay
+from ..engine.batch import MIN_VECTOR_BATCH, Replay, verify_replays
+from ..engine.replay_format import encode_replay
+from ..engine.simulator import SimulationResult
+from ..metrics import metrics
+from ..models import EntryStatus, LeaderboardEntry
+from .best_scores import best_of_batch, best_score_upsert, raise_high_scores
+from .event_bus import SCORE_SUBMITTED, USER_CHANGED, event_bus
+from .replay_archive import ReplayArchive, replay_archive
+# Subscribe to the events published here
+from . import leaderboard_events, principal_cache, rank_index  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_verify(replays: Sequence[Replay], chunk_size: int) -> Tuple[List[Optional[SimulationResult]], float]:
+    """Play replays in a worker and report how long it took"""
+    started = time.perf_counter()
+    results = verify_replays(replays, chunk_size)
+    return results, time.perf_counter() - started
+
+
+class ReplayVerifier:
+    """
+    Promotes or rejects leaderboard entries submitted with a replay.
+
+    Such entries are inserted as pending. Whenever one is submitted, and
+    every `interval` seconds anyway, the oldest pending entries are
+    claimed: at most `batch_size` of them and `batch_moves` moves in all,
+    which bounds a batch's memory in the workers. Claiming sets them to
+    verifying, stamped with the claim's time, and is committed straight
+    away, so no transaction stays open while they are played. They are
+    split by length into shares of at most `chunk_size` and played back in
+    a process pool (a thread pool if configured), each worker running the
+    NumPy batch simulator. An entry whose replay scores exactly its score
+    is accepted, any other is rejected. One short transaction then sets
+    the statuses, conditional on the entries still holding this claim,
+    archives the replays of the entries it accepted, removes the decided
+    replays from the table and raises the best and high scores of the
+    accepted ones, which are published like any other submission.
+
+    Verifiers only claim pending entries, and verifying ones whose claim
+    is older than `lease` seconds: their verifier died. On PostgreSQL the
+    claim also reads with SKIP LOCKED, so verifiers claiming at the same
+    moment take different entries without waiting; elsewhere the claim's
+    own conditional update settles it. A batch that fails, its pool broken
+    by a killed worker for instance, hands its entries back as pending; a
+    broken pool is dropped and the next batch starts a new one.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        kind: str = "process",
+        workers: Optional[int] = None,
+        batch_size: int = 4096,
+        batch_moves: int = 20_000_000,
+        chunk_size: int = 1024,
+        interval: float = 1.0,
+        lease: float = 300.0,
+        archive: ReplayArchive = replay_archive,
+    ):
+        self.session_factory = session_factory
+        self.archive = archive
+        self.kind = kind
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.batch_moves = batch_moves
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.lease = lease
+        self._executor: Optional[Executor] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="replay-verify")
+            else:
+                # spawn, not fork: the server process runs threads of its own
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._executor
+
+    async def _play(self, replays: List[Replay]) -> Tuple[List[Optional[SimulationResult]], float]:
+        """verify_replays across the pool: (results in order, CPU seconds spent)"""
+        # Shares of replays of similar length, since a batch runs as long as
+        # its longest replay; at least one per worker while that leaves
+        # them big enough to vectorise
+        order = sorted(range(len(replays)), key=lambda i: len(replays[i][1]))
+        size = max(MIN_VECTOR_BATCH, min(self.chunk_size, -(-len(order) // self.workers)))
+        shares = [order[start:start + size] for start in range(0, len(order), size)]
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            done = await asyncio.gather(*(
+                loop.run_in_executor(executor, _timed_verify, [replays[i] for i in share], self.chunk_size)
+                for share in shares
+            ))
+        except BrokenExecutor:
+            # Never usable again: the next batch starts a new pool
+            metrics.counter("replay_verifier.pool_broken").inc()
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self._executor is executor:
+                self._executor = None
+            raise
+        results: List[Optional[SimulationResult]] = [None] * len(replays)
+        for share, (share_results, _) in zip(shares, done):
+            for i, result in zip(share, share_results):
+                results[i] = result
+        return results, sum(seconds for _, seconds in done)
+
+    def _claimable(self, now: datetime):
+        """Pending entries, and verifying ones whose verifier's lease ran out"""
+        status, claimed_at = DBLeaderboardEntry.status, DBLeaderboardEntry.claimed_at
+        return or_(
+            status == EntryStatus.PENDING,
+            and_(status == EntryStatus.VERIFYING, claimed_at < now - timedelta(seconds=self.lease)),
+        )
+
+    async def _claim(self, db, now: datetime) -> list:
+        """
+        Claim the oldest claimable entries as of now, and return them and
+        their replays as (entry, seed, moves) rows: at most batch_size of
+        them and batch_moves moves in all, but at least one
+        """
+        sizes = (await db.execute(
+            select(DBLeaderboardEntry.id, func.length(DBLeaderboardReplay.moves))
+            .join(DBLeaderboardReplay, DBLeaderboardReplay.entry_id == DBLeaderboardEntry.id)
+            .where(self._claimable(now))
+            .order_by(DBLeaderboardEntry.timestamp)
+            .limit(self.batch_size)
+            .with_for_update(of=DBLeaderboardEntry, skip_locked=True)
+        )).all()
+        candidates, moves = [], 0
+        for entry_id, length in sizes:
+            if candidates and moves + length > self.batch_moves:
+                break
+            candidates.append(entry_id)
+            moves += length
+        if not candidates:
+            return []
+        entries = DBLeaderboardEntry.__table__
+        # Conditional too, should another verifier have claimed some of them
+        # since: only the rows it matched are this claim's
+        claimed = list((await db.execute(
+            entries.update()
+            .where(entries.c.id.in_(candidates), self._claimable(now))
+            .values(status=EntryStatus.VERIFYING, claimed_at=now)
+            .returning(entries.c.id)
+        )).scalars())
+        if not claimed:
+            return []
+        return (await db.execute(
+            select(DBLeaderboardEntry, DBLeaderboardReplay.seed, DBLeaderboardReplay.moves)
+            .join(DBLeaderboardReplay, DBLeaderboardReplay.entry_id == DBLeaderboardEntry.id)
+            .where(DBLeaderboardEntry.id.in_(claimed))
+            .order_by(DBLeaderboardEntry.timestamp)
+        )).all()
+
+    def _holding(self, ids, now: datetime):
+        """The entries among ids that still hold the claim made at now"""
+        entries = DBLeaderboardEntry.__table__
+        return and_(entries.c.id.in_(ids), entries.c.status == EntryStatus.VERIFYING, entries.c.claimed_at == now)
+
+    async def verify_pending(self, db) -> int:
+        """Verify a batch of the oldest pending entries; returns how many were claimed"""
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        rows = await self._claim(db, now)
+        # Committed before playing: the claim is in the rows, not in locks
+        await db.commit()
+        if not rows:
+            return 0
+        try:
+            promoted, demoted, batch, high, cpu_seconds = await self._decide(db, rows, now)
+        except Exception:
+            # Hand the entries back rather than leave them to the lease
+            await db.rollback()
+            entries = DBLeaderboardEntry.__table__
+            await db.execute(
+                entries.update()
+                .where(self._holding([entry.id for entry, _, _ in rows], now))
+                .values(status=EntryStatus.PENDING, claimed_at=None)
+            )
+            await db.commit()
+            raise
+
+        for user_id in high:
+            event_bus.publish(USER_CHANGED, {"user_id": user_id})
+        for _, entry in batch:
+            event_bus.publish(SCORE_SUBMITTED, {"entry": entry.model_dump(mode="json")})
+
+        elapsed = time.perf_counter() - started
+        metrics.counter("replay_verifier.accepted").inc(len(batch))
+        metrics.counter("replay_verifier.rejected").inc(len(demoted))
+        if len(promoted) + len(demoted) < len(rows):
+            # Their lease ran out and another verifier claimed them
+            metrics.counter("replay_verifier.claims_lost").inc(len(rows) - len(promoted) - len(demoted))
+        metrics.summary("replay_verifier.batch_seconds").observe(elapsed)
+        metrics.summary("replay_verifier.replays_per_second").observe(len(rows) / elapsed)
+        if cpu_seconds > 0:
+            metrics.summary("replay_verifier.replays_per_core_second").observe(len(rows) / cpu_seconds)
+        return len(rows)
+
+    async def _decide(self, db, rows: list, now: datetime):
+        """Play the claimed rows and commit the decisions this claim still holds"""
+        results, cpu_seconds = await self._play([(seed, moves, entry.mode) for entry, seed, moves in rows])
+        verified = [result is not None and result.score == entry.score for (entry, _, _), result in zip(rows, results)]
+        accepted = [entry.id for (entry, _, _), ok in zip(rows, verified) if ok]
+        rejected = [entry.id for (entry, _, _), ok in zip(rows, verified) if not ok]
+
+        entries = DBLeaderboardEntry.__table__
+        promoted = set()
+        if accepted:
+            promoted = set((await db.execute(
+                entries.update()
+                .where(self._holding(accepted, now))
+                .values(status=EntryStatus.ACCEPTED, claimed_at=None)
+                .returning(entries.c.id)
+            )).scalars())
+        demoted = set()
+        if rejected:
+            demoted = set((await db.execute(
+                entries.update()
+                .where(self._holding(rejected, now))
+                .values(status=EntryStatus.REJECTED, claimed_at=None)
+                .returning(entries.c.id)
+            )).scalars())
+        # Only the entries this verifier promoted: archived before the
+        # decisions are committed, so should that fail they are handed back
+        # and archived again, superseding this copy
+        await asyncio.to_thread(self.archive.append_many, [
+            (entry.id, encode_replay(seed, moves, entry.mode))
+            for entry, seed, moves in rows if entry.id in promoted
+        ])
+        batch = [
+            (entry.user_id, LeaderboardEntry(
+                id=entry.id, username=entry.username, score=entry.score, mode=entry.mode, timestamp=entry.timestamp
+            ))
+            for entry, _, _ in rows if entry.id in promoted
+        ]
+        # The entries another verifier claimed since keep their replays
+        decided = promoted | demoted
+        if decided:
+            await db.execute(
+                DBLeaderboardReplay.__table__.delete()
+                .where(DBLeaderboardReplay.entry_id.in_(decided))
+            )
+        best, high = best_of_batch(batch)
+        if batch:
+            await db.execute(best_score_upsert(db.get_bind().dialect.name), best)
+            await db.execute(
+                raise_high_scores(),
+                [{"b_user_id": user_id, "b_score": score} for user_id, score in high.items()]
+            )
+        await db.commit()
+        return promoted, demoted, batch, high, cpu_seconds
+
+    def notify(self):
+        """Wake the verifier: an entry is pending"""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                # Until the queue is drained
+                while True:
+                    async with self.session_factory() as db:
+                        if not await self.verify_pending(db):
+                            break
+            except Exception:
+                logger.exception("Verifying replays failed; retrying next interval")
+
+    def start(self):
+        """Start verifying in the background"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Singleton instance
+replay_verifier = ReplayVerifier(
+    kind=settings.replay_verifier_executor,
+    workers=settings.replay_verifier_workers,
+    batch_size=settings.replay_verifier_batch_size,
+    batch_moves=settings.replay_verifier_batch_moves,
+    chunk_size=settings.replay_verifier_chunk_size,
+    interval=settings.replay_verifier_interval_seconds,
+    lease=settings.replay_verifier_lease_seconds,
+)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+from typing import Dict, Optional, Set
+from ..metrics import metrics
+from ..models import GameSession
+from .event_bus import SESSION_CREATED, SESSION_ENDED, SESSION_UPDATED, event_bus
+
+# Messages a spectator may fall behind by before it is disconnected
+SPECTATOR_QUEUE_SIZE = 256
+
+
+class Subscriber:
+    """A spectator's queue of serialized messages; None closes the stream"""
+
+    __slots__ = ("queue", "loop", "dropped")
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(SPECTATOR_QUEUE_SIZE)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = False
+
+    def deliver(self, text: Optional[str]):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._put(text)
+        else:
+            # Published from another thread's event loop
+            self.loop.call_soon_threadsafe(self._put, text)
+
+    def _put(self, text: Optional[str]):
+        if self.dropped:
+            return
+        if self.queue.full():
+            # Too slow to keep up: disconnect rather than buffer without bound
+            self.dropped = True
+            metrics.counter("spectators.dropped_slow").inc()
+            text = None
+            while not self.queue.empty():
+                self.queue.get_nowait()
+        self.queue.put_nowait(text)
+
+
+class SessionBroadcaster:
+    """
+    Fans session changes out to WebSocket spectators.
+
+    There is one subscriber set for the list of all sessions and one per
+    watched session. Each change is serialized once and the same text is
+    queued for every subscriber, so the cost per update does not grow with
+    the number of spectators beyond a queue append each.
+    """
+
+    def __init__(self):
+        self._all: Set[Subscriber] = set()
+        self._sessions: Dict[str, Set[Subscriber]] = {}
+
+    @property
+    def spectators(self) -> int:
+        return len(self._all) + sum(len(subscribers) for subscribers in self._sessions.values())
+
+    def subscribe(self, session_id: Optional[str] = None) -> Subscriber:
+        """Subscribe to every session, or to one session's changes"""
+        subscriber = Subscriber()
+        if session_id is None:
+            self._all.add(subscriber)
+        else:
+            self._sessions.setdefault(session_id, set()).add(subscriber)
+        metrics.gauge("spectators.connected").set(self.spectators)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber, session_id: Optional[str] = None):
+        if session_id is None:
+            self._all.discard(subscriber)
+        else:
+            subscribers = self._sessions.get(session_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._sessions[session_id]
+        metrics.gauge("spectators.connected").set(self.spectators)
+
+    def _publish(self, session_id: str, message: dict, close: bool = False):
+        watchers = self._sessions.get(session_id, ())
+        if not self._all and not watchers:
+            return
+        text = json.dumps(message)
+        for subscriber in list(self._all):
+            subscriber.deliver(text)
+        for subscriber in list(watchers):
+            subscriber.deliver(text)
+            if close:
+                subscriber.deliver(None)
+        metrics.counter("spectators.messages").inc(len(self._all) + len(watchers))
+
+    def created(self, session: GameSession):
+        self._publish(session.id, {"type": "created", "session": session.model_dump(mode="json")})
+
+    def updated(self, session_id: str, score: int):
+        self._publish(session_id, {"type": "updated", "id": session_id, "score": score})
+
+    def ended(self, session_id: str, score: int):
+        self._publish(session_id, {"type": "ended", "id": session_id, "score": score}, close=True)
+
+    def clear(self):
+        self._all.clear()
+        self._sessions.clear()
+
+
+# Singleton instance
+session_broadcaster = SessionBroadcaster()
+event_bus.subscribe(SESSION_CREATED, lambda event: session_broadcaster.created(GameSession(**event.data["session"])))
+event_bus.subscribe(SESSION_UPDATED, lambda event: session_broadcaster.updated(event.data["id"], event.data["score"]))
+event_bus.subscribe(SESSION_ENDED, lambda event: session_broadcaster.ended(event.data["id"], event.data["score"]))
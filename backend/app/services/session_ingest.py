@@ -0,0 +1,64 @@
+import itertools
+import struct
+from typing import Optional
+from ..metrics import metrics
+
+# Client -> server: session slot, sequence number, score (10 bytes)
+SCORE_FRAME = struct.Struct("!HIi")
+# Server -> client: session slot, last sequence number applied (6 bytes)
+ACK_FRAME = struct.Struct("!HI")
+
+_slots = itertools.count(1)
+
+
+class InvalidFrame(ValueError):
+    """A binary frame that does not follow the ingest protocol"""
+
+
+class ScoreIngest:
+    """
+    State of one session's binary score ingest channel.
+
+    The handshake assigns the channel a 16-bit slot, which every frame
+    must carry. Sequence numbers must increase; a frame that does not
+    advance the sequence is a replay or duplicate and is ignored. Frames
+    only replace the pending score, and take() hands out the latest one
+    at most once, so however fast a client sends, storage sees one
+    update per flush.
+    """
+
+    __slots__ = ("session_id", "slot", "last_sequence", "applied_sequence", "_pending")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.slot = next(_slots) & 0xFFFF
+        self.last_sequence = 0
+        self.applied_sequence = 0
+        self._pending: Optional[int] = None
+
+    def accept(self, frame: bytes) -> bool:
+        """Take a frame's score; False if it is stale. Raises InvalidFrame."""
+        if len(frame) != SCORE_FRAME.size:
+            raise InvalidFrame(f"Expected {SCORE_FRAME.size} bytes, got {len(frame)}")
+        slot, sequence, score = SCORE_FRAME.unpack(frame)
+        if slot != self.slot:
+            raise InvalidFrame(f"Frame for slot {slot} on slot {self.slot}")
+        metrics.counter("session_ingest.frames").inc()
+        if sequence <= self.last_sequence:
+            metrics.counter("session_ingest.stale_frames").inc()
+            return False
+        if self._pending is not None:
+            metrics.counter("session_ingest.coalesced").inc()
+        self.last_sequence = sequence
+        self._pending = score
+        return True
+
+    def take(self) -> Optional[int]:
+        """The latest score not yet applied, or None"""
+        score, self._pending = self._pending, None
+        if score is not None:
+            self.applied_sequence = self.last_sequence
+        return score
+
+    def ack(self) -> bytes:
+        return ACK_FRAME.pack(self.slot, self.applied_sequence)
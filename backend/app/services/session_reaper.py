@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import func, select
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..db_models import DBGameSession
+from ..metrics import metrics
+from .event_bus import SESSION_ENDED, event_bus
+from .live_sessions import live_sessions
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """
+    Ends game sessions whose client went away without ending them.
+
+    A session's updated_at is its heartbeat: every score update refreshes
+    it (live scores when they are checkpointed), so `idle_timeout` must be
+    well above the live session checkpoint interval. Every `interval`
+    seconds, active sessions idle for longer than that are ended in
+    batches of `batch_size`, each one UPDATE on the partial index of
+    active sessions, and the ends are published like any other. The
+    database's clock writes updated_at, so it computes the cutoff too.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        idle_timeout: float = 300.0,
+        interval: float = 60.0,
+        batch_size: int = 500,
+    ):
+        self.session_factory = session_factory
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def _cutoff(self, dialect_name: str):
+        """now - idle_timeout in SQL, on the clock that writes updated_at"""
+        if dialect_name == "sqlite":
+            # CURRENT_TIMESTAMP is UTC text there, like the stored values
+            return func.datetime("now", f"-{self.idle_timeout} seconds")
+        return func.now() - timedelta(seconds=self.idle_timeout)
+
+    async def reap(self, db) -> int:
+        """End every session idle for longer than idle_timeout; returns how many"""
+        cutoff = self._cutoff(db.get_bind().dialect.name)
+        sessions = DBGameSession.__table__
+        started = time.perf_counter()
+        reaped = 0
+        while True:
+            idle = (
+                select(sessions.c.id)
+                .where(sessions.c.is_active == True, sessions.c.updated_at < cutoff)
+                .order_by(sessions.c.updated_at)
+                .limit(self.batch_size)
+            )
+            # The conditions are repeated so a session updated since the
+            # select, or ended by a concurrent reaper, is left alone
+            result = await db.execute(
+                sessions.update()
+                .where(sessions.c.id.in_(idle.scalar_subquery()))
+                .where(sessions.c.is_active == True, sessions.c.updated_at < cutoff)
+                .values(is_active=False)
+                .returning(sessions.c.id, sessions.c.score)
+            )
+            ended = result.all()
+            await db.commit()
+            for session_id, score in ended:
+                live_sessions.pop(session_id)
+                event_bus.publish(SESSION_ENDED, {"id": session_id, "score": score})
+            reaped += len(ended)
+            if len(ended) < self.batch_size:
+                break
+
+        if reaped:
+            metrics.counter("session_reaper.reaped").inc(reaped)
+        metrics.summary("session_reaper.reap_seconds").observe(time.perf_counter() - started)
+        return reaped
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                async with self.session_factory() as db:
+                    await self.reap(db)
+            except Exception:
+                logger.exception("Reaping idle sessions failed; retrying next interval")
+
+    def start(self):
+        """Start reaping in the background"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Singleton instance
+session_reaper = SessionReaper(
+    idle_timeout=settings.session_idle_timeout_seconds,
+    interval=settings.session_reaper_interval_seconds,
+)
@@ -0,0 +1,321 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, TextIO, Tuple
+from sqlalchemy.exc import DataError, IntegrityError
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..db_models import DBLeaderboardEntry, generate_uuid
+from ..metrics import metrics
+from ..models import GameMode, LeaderboardEntry
+from .best_scores import best_of_batch, best_score_upsert, dialect_insert, raise_high_scores
+from .event_bus import SCORE_SUBMITTED, USER_CHANGED, event_bus
+from .leaderboard_cache import leaderboard_cache
+from .leaderboard_events import leaderboard_events
+# Subscribe to the events published here
+from . import principal_cache, rank_index  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# (user_id, entry) of an accepted submission
+Submission = Tuple[str, LeaderboardEntry]
+
+DEAD_LETTER_FILE = "dead_letter.jsonl"
+
+
+class WriteBehindFull(Exception):
+    """Raised when `max_pending` submissions are already waiting to be written"""
+
+
+class ScoreWriteBehind:
+    """
+    Write-behind path for leaderboard submissions.
+
+    submit() gives the entry its id and timestamp, appends it to a spill
+    file, publishes it to the in-memory leaderboards and rank indexes of
+    every worker and returns. A background flusher writes whatever has
+    queued up every `flush_interval` seconds, or as soon as `batch_size`
+    submissions are waiting, with multi-row INSERTs in a single transaction.
+    When that transaction fails, the entries are written one at a time, so
+    one bad row does not hold back the rest. A row the database rejects on
+    its own (IntegrityError, DataError) is dead-lettered: logged, counted
+    and appended to `spill_dir`/dead_letter.jsonl. Any other failure keeps
+    the entries not written yet for the next flush. At most `max_pending`
+    submissions wait at once; submit() raises WriteBehindFull beyond that.
+
+    Spill files are segments: each flush closes the active one, and a
+    segment is deleted only once its entries are committed. Every process
+    spills into its own subdirectory of `spill_dir`, held with an flock for
+    as long as it runs. start() adopts and replays the subdirectories of
+    processes that are gone; inserts ignore ids that are already present,
+    so replaying a committed segment is harmless.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        spill_dir: str = "./write_behind",
+        flush_interval: float = 0.05,
+        batch_size: int = 500,
+        max_pending: int = 100_000,
+        enabled: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.spill_dir = spill_dir
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._pending: List[Submission] = []
+        self._segments: List[str] = []  # closed segments holding the pending entries
+        self._spill: Optional[TextIO] = None
+        self._spill_path: Optional[str] = None
+        self._dir: Optional[str] = None
+        self._dir_lock: Optional[TextIO] = None
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, user_id: str, username: str, score: int, mode: GameMode) -> LeaderboardEntry:
+        """Accept a submission; it is durable in the spill file when this returns"""
+        if len(self._pending) >= self.max_pending:
+            metrics.counter("write_behind.rejected").inc()
+            raise WriteBehindFull()
+        entry = LeaderboardEntry(
+            id=generate_uuid(),
+            username=username,
+            score=score,
+            mode=mode,
+            timestamp=datetime.utcnow()
+        )
+        self._append(user_id, entry)
+        self._pending.append((user_id, entry))
+        event_bus.publish(SCORE_SUBMITTED, {"entry": entry.model_dump(mode="json")})
+
+        metrics.gauge("write_behind.pending").set(len(self._pending))
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return entry
+
+    def _own_dir(self) -> str:
+        """This process's spill subdirectory, locked on first use"""
+        if self._dir is None:
+            path = os.path.join(self.spill_dir, generate_uuid())
+            os.makedirs(path)
+            self._dir_lock = open(os.path.join(path, "lock"), "w")
+            fcntl.flock(self._dir_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._dir = path
+        return self._dir
+
+    def _append(self, user_id: str, entry: LeaderboardEntry):
+        if self._spill is None:
+            self._spill_path = os.path.join(self._own_dir(), f"{time.time_ns():020d}.jsonl")
+            self._spill = open(self._spill_path, "a", encoding="utf-8")
+        record = {"user_id": user_id, **entry.model_dump(mode="json")}
+        self._spill.write(json.dumps(record) + "\n")
+        # Reaches the OS before the client is acknowledged, so it survives a
+        # process crash; the segment is fsynced when a flush closes it
+        self._spill.flush()
+
+    def _close_segment(self):
+        if self._spill is not None:
+            os.fsync(self._spill.fileno())
+            self._spill.close()
+            self._segments.append(self._spill_path)
+            self._spill = self._spill_path = None
+
+    async def flush(self) -> int:
+        """Write everything accepted so far; returns the number of entries written"""
+        async with self._flush_lock:
+            self._close_segment()
+            batch, self._pending = self._pending, []
+            segments, self._segments = self._segments, []
+            started = time.perf_counter()
+            size = written = len(batch)
+            try:
+                if batch:
+                    try:
+                        await self._write(batch)
+                    except Exception:
+                        metrics.counter("write_behind.failed_flushes").inc()
+                        logger.warning("Write-behind batch of %d failed; writing it row by row", len(batch), exc_info=True)
+                        written = await self._write_each(batch)
+            except BaseException:
+                # Keep what is left for the next attempt (also when cancelled
+                # mid-write); the segments stay on disk
+                self._pending[:0] = batch
+                self._segments[:0] = segments
+                raise
+            finally:
+                metrics.gauge("write_behind.pending").set(len(self._pending))
+
+            for path in segments:
+                os.remove(path)
+            if size:
+                metrics.counter("write_behind.flushed").inc(written)
+                metrics.summary("write_behind.flush_seconds").observe(time.perf_counter() - started)
+                metrics.summary("write_behind.batch_size").observe(size)
+            return written
+
+    async def _write_each(self, batch: List[Submission]) -> int:
+        """
+        Write a batch one entry at a time, dead-lettering the entries the
+        database rejects; returns how many were written. Entries done with
+        are removed from `batch`, so on failure it holds the ones left.
+        """
+        written = done = 0
+        try:
+            for submission in batch:
+                try:
+                    await self._write([submission])
+                    written += 1
+                except (DataError, IntegrityError) as exc:
+                    self._dead_letter(submission, exc)
+                done += 1
+        finally:
+            del batch[:done]
+        return written
+
+    def _dead_letter(self, submission: Submission, exc: Exception):
+        user_id, entry = submission
+        record = {"user_id": user_id, **entry.model_dump(mode="json"), "error": str(exc.orig)}
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(os.path.join(self.spill_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as dead_letter:
+            dead_letter.write(json.dumps(record) + "\n")
+            dead_letter.flush()
+            os.fsync(dead_letter.fileno())
+        metrics.counter("write_behind.dead_lettered").inc()
+        logger.error("Dead-lettered leaderboard submission %s: %s", json.dumps(record), exc.orig)
+
+    async def _write(self, batch: List[Submission]):
+        """Insert a batch, and raise best and high scores, in one transaction"""
+        best, high = best_of_batch(batch)
+
+        async with self.session_factory() as db:
+            dialect_name = db.get_bind().dialect.name
+            insert = dialect_insert(dialect_name)(DBLeaderboardEntry).on_conflict_do_nothing(index_elements=["id"])
+            rows = [
+                {
+                    "id": entry.id,
+                    "user_id": user_id,
+                    "username": entry.username,
+                    "score": entry.score,
+                    "mode": entry.mode,
+                    "timestamp": entry.timestamp,
+                }
+                for user_id, entry in batch
+            ]
+            for i in range(0, len(rows), self.batch_size):
+                await db.execute(insert, rows[i:i + self.batch_size])
+            await db.execute(best_score_upsert(dialect_name), best)
+            await db.execute(
+                raise_high_scores(),
+                [{"b_user_id": user_id, "b_score": score} for user_id, score in high.items()]
+            )
+            await db.commit()
+
+        for user_id in high:
+            event_bus.publish(USER_CHANGED, {"user_id": user_id})
+        # Windows this worker reloaded since submit() read the database
+        # without these entries; the top-k ignores ids it already holds
+        for _, entry in batch:
+            leaderboard_events.publish(entry, leaderboard_cache.record(entry))
+
+    def _load_spilled(self) -> int:
+        """Adopt the spill directories of dead processes and queue their entries"""
+        if not os.path.isdir(self.spill_dir):
+            return 0
+        loaded = 0
+        for name in sorted(os.listdir(self.spill_dir)):
+            orphan = os.path.join(self.spill_dir, name)
+            if orphan == self._dir or not os.path.isdir(orphan):
+                continue
+            try:
+                lock = open(os.path.join(orphan, "lock"), "a")
+            except OSError:
+                # Adopted by another process in the meantime
+                continue
+            with lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Belongs to a live process
+                    continue
+                for segment in sorted(os.listdir(orphan)):
+                    if segment.endswith(".jsonl"):
+                        path = os.path.join(self._own_dir(), segment)
+                        os.rename(os.path.join(orphan, segment), path)
+                        loaded += self._read_segment(path)
+                        self._segments.append(path)
+                os.remove(os.path.join(orphan, "lock"))
+                os.rmdir(orphan)
+        return loaded
+
+    def _read_segment(self, path: str) -> int:
+        read = 0
+        with open(path, encoding="utf-8") as spill:
+            for line in spill:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line torn by the crash was never acknowledged
+                    continue
+                user_id = record.pop("user_id")
+                self._pending.append((user_id, LeaderboardEntry(**record)))
+                read += 1
+        return read
+
+    async def start(self):
+        """Replay spilled submissions, then start the background flusher"""
+        if self._load_spilled():
+            try:
+                replayed = await self.flush()
+                logger.info("Replayed %d spilled leaderboard submissions", replayed)
+            except Exception:
+                logger.exception("Replaying spilled leaderboard submissions failed; the flusher will retry")
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed; %d submissions kept for retry", self.pending)
+
+    async def stop(self):
+        """Stop the flusher and write what is left; on failure it stays spilled"""
+        if self._task is not None:
+            # Let a flush in progress finish rather than cancelling it
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final write-behind flush failed; %d submissions left in spill files", self.pending)
+
+
+# Singleton instance
+score_write_behind = ScoreWriteBehind(
+    spill_dir=settings.leaderboard_write_behind_spill_dir,
+    flush_interval=settings.leaderboard_write_behind_flush_ms / 1000,
+    batch_size=settings.leaderboard_write_behind_batch_size,
+    max_pending=settings.leaderboard_write_behind_max_pending,
+    enabled=settings.leaderboard_write_behind,
+)
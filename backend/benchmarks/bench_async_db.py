@@ -0,0 +1,223 @@
+"""Benchmark: blocking sync DB path vs. async DB path under concurrent load
+
+Runs the read endpoints (GET /api/leaderboard/ and GET /api/sessions/) of two
+in-process apps against the same seeded database and reports requests per
+second and latency percentiles:
+
+- before: handlers call the sync DatabaseService on a blocking Session
+  from get_db, which is what the routers did before the async data layer
+- after: the real application, using AsyncDatabaseService on an AsyncSession
+
+SQLite answers from the local page cache, so on its own it hides the cost of
+blocking. --latency-ms adds a simulated network round trip to every statement
+(a blocking sleep for the sync engine, an awaited one for the async engine),
+which is what a remote PostgreSQL server looks like to each driver.
+
+Usage:
+    # 200 concurrent clients against a temporary SQLite database
+    uv run python -m benchmarks.bench_async_db
+
+    # Against PostgreSQL (the database is seeded, so use a scratch database)
+    uv run python -m benchmarks.bench_async_db --database-url postgresql://user:pw@localhost/bench
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import List, Optional
+
+import httpx
+from fastapi import Depends, FastAPI, Query
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.util import await_only
+
+from app.database import Base, get_async_db, get_async_database_url, get_db
+from app.db_models import DBUser, DBLeaderboardEntry, DBGameSession
+from app.main import app as async_app
+from app.models import GameMode, GameSession, LeaderboardEntry
+from app.services.database import db_service
+
+
+def build_blocking_app() -> FastAPI:
+    """Build an app that serves the read endpoints the old, blocking way"""
+    blocking_app = FastAPI()
+
+    @blocking_app.get("/api/leaderboard/", response_model=List[LeaderboardEntry])
+    async def get_leaderboard(
+        mode: Optional[GameMode] = None,
+        limit: int = Query(default=10, ge=1, le=100),
+        db: Session = Depends(get_db)
+    ):
+        return db_service.get_leaderboard(db, mode, limit)
+
+    @blocking_app.get("/api/sessions/", response_model=List[GameSession])
+    async def get_active_sessions(db: Session = Depends(get_db)):
+        return db_service.get_active_sessions(db)
+
+    return blocking_app
+
+
+def seed(engine, users: int, entries: int, sessions: int):
+    """Create the schema and fill it with random users, scores and sessions"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db_users = [
+            DBUser(username=f"bench{i}", email=f"bench{i}@example.com", hashed_password="x")
+            for i in range(users)
+        ]
+        db.add_all(db_users)
+        db.flush()
+        db.add_all(
+            DBLeaderboardEntry(
+                user_id=user.id,
+                username=user.username,
+                score=random.randint(0, 5000),
+                mode=random.choice(list(GameMode)),
+            )
+            for user in random.choices(db_users, k=entries)
+        )
+        db.add_all(
+            DBGameSession(
+                user_id=user.id,
+                username=user.username,
+                score=random.randint(0, 1000),
+                mode=random.choice(list(GameMode)),
+            )
+            for user in random.choices(db_users, k=sessions)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def add_round_trip_latency(engine, async_engine, latency: float):
+    """Delay every statement by `latency` seconds on both engines"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def blocking_round_trip(*args):
+        time.sleep(latency)
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def awaited_round_trip(*args):
+        # Runs inside SQLAlchemy's greenlet, so the event loop keeps serving
+        await_only(asyncio.sleep(latency))
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Return the pct-th percentile of samples (nearest rank)"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_load(app: FastAPI, clients: int, requests_per_client: int) -> dict:
+    """Drive app with `clients` concurrent clients and collect latencies"""
+    paths = ["/api/leaderboard/?limit=10", "/api/leaderboard/?mode=walls&limit=50", "/api/sessions/"]
+    latencies: List[float] = []
+    errors = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            nonlocal errors
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                response = await client.get(random.choice(paths))
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def print_result(label: str, result: dict):
+    print(
+        f"{label:<8} {result['requests']:>8} req  {result['rps']:>9.1f} req/s  "
+        f"p50 {result['p50_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+        f"errors {result['errors']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark blocking vs. async DB access")
+    parser.add_argument("--database-url", help="Scratch database to seed (default: temporary SQLite file)")
+    parser.add_argument("--clients", type=int, default=200, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=25, help="Requests per client")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated DB round trip per statement")
+    args = parser.parse_args()
+
+    db_path = None
+    database_url = args.database_url
+    if database_url is None:
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{db_path}"
+
+    try:
+        print(f"Seeding {args.users} users, {args.entries} entries, {args.sessions} sessions...")
+        # The blocking app needs one connection per client: with the default
+        # pool it deadlocks once the pool is exhausted, because the handler
+        # waits for a connection on the event loop thread while the sessions
+        # that would release one are closed from that same loop. The async
+        # app waits for a free connection without blocking, so it keeps the
+        # default pool.
+        engine = create_engine(database_url, pool_size=args.clients, max_overflow=0)
+        seed(engine, args.users, args.entries, args.sessions)
+        SyncSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        async_engine = create_async_engine(get_async_database_url(database_url))
+        if args.latency_ms > 0:
+            add_round_trip_latency(engine, async_engine, args.latency_ms / 1000)
+        AsyncSession = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+        def override_get_db():
+            db = SyncSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        async def override_get_async_db():
+            async with AsyncSession() as db:
+                yield db
+
+        blocking_app = build_blocking_app()
+        blocking_app.dependency_overrides[get_db] = override_get_db
+        async_app.dependency_overrides[get_async_db] = override_get_async_db
+
+        print(
+            f"{args.clients} concurrent clients x {args.requests} requests, "
+            f"{args.latency_ms} ms per statement\n"
+        )
+        print_result("before", asyncio.run(run_load(blocking_app, args.clients, args.requests)))
+        print_result("after", asyncio.run(run_load(async_app, args.clients, args.requests)))
+
+        async_app.dependency_overrides.clear()
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+    finally:
+        if db_path and os.path.exists(db_path):
+            os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Load test: bot players driving the real API traffic pattern
+
+Each bot signs up, logs in, creates a session, plays a game, sends
+PUT /api/sessions/{id} whenever its score changes, ends the session with
+DELETE and submits its score to POST /api/leaderboard/ (with the game's
+replay if --replays is given). All games are played in lockstep on one
+NumPy BatchGame, by the heuristic of the frontend's aiPlayer.ts, so one
+process can play thousands of them at game speed and leave its time to
+the HTTP clients.
+
+By default the bots target the application in-process, through an ASGI
+transport, with its lifespan running (background tasks included) on a
+temporary SQLite database. With --url they target a running server.
+
+Reports, per endpoint, requests, errors, requests per second and latency
+percentiles. Signups and logins are retried on 503, since the password
+hashing pool sheds load by design; each attempt is counted.
+
+Usage:
+    # 500 bots against the in-process app
+    uv run python -m benchmarks.bench_bot_load
+
+    # 2000 bots at the client's real speed (150 ms per tick) against a server
+    uv run python -m benchmarks.bench_bot_load --url http://localhost:8000 --bots 2000 --tick-ms 150
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+from app.engine.batch import BatchGame
+from app.engine.simulator import GRID_SIZE, MOVE_KEYS
+from app.models import GameMode
+
+# aiPlayer.ts considers UP, DOWN, LEFT, RIGHT in that order, and a stable
+# sort keeps that order between moves that score the same
+_CANDIDATES = np.array([MOVE_KEYS["U"], MOVE_KEYS["D"], MOVE_KEYS["L"], MOVE_KEYS["R"]])
+_DX = np.array([0, 1, 0, -1])[_CANDIDATES]
+_DY = np.array([-1, 0, 1, 0])[_CANDIDATES]
+_KEYS = np.array([ord(key) for key, _ in sorted(MOVE_KEYS.items(), key=lambda item: item[1])], dtype=np.uint8)
+
+# Attempts at a request answered 503
+RETRIES = 5
+
+
+def choose_moves(game: BatchGame, rows: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """aiPlayer.ts getAIDirection for the games `rows`: one direction code each"""
+    walls = game.mode[rows] == 0
+    head_x = (game.head_cell[rows] % GRID_SIZE)[:, None]
+    head_y = (game.head_cell[rows] // GRID_SIZE)[:, None]
+    x, y = head_x + _DX, head_y + _DY
+    x = np.where(walls[:, None], x, x % GRID_SIZE)
+    y = np.where(walls[:, None], y, y % GRID_SIZE)
+    inside = (x >= 0) & (x < GRID_SIZE) & (y >= 0) & (y < GRID_SIZE)
+    cells = np.where(inside, y * GRID_SIZE + x, 0)
+
+    food_x = (game.food[rows] % GRID_SIZE)[:, None]
+    food_y = (game.food[rows] // GRID_SIZE)[:, None]
+    score = -(np.abs(x - food_x) + np.abs(y - food_y))
+    score -= 1000 * ~inside
+    score -= 1000 * (inside & game.occupied[rows[:, None], cells])
+    direction = game.direction[rows][:, None]
+    score += 2 * (_CANDIDATES == direction)
+    near_wall = np.minimum(np.minimum(x, y), np.minimum(GRID_SIZE - 1 - x, GRID_SIZE - 1 - y)) <= 1
+    score -= 50 * (walls[:, None] & near_wall)
+    # The reverse of the current direction is never a candidate
+    score = np.where(_CANDIDATES == (direction + 2) % 4, -10 ** 9, score)
+
+    order = np.argsort(-score, axis=1, kind="stable")
+    # 10% of the time, the second best move
+    pick = np.where(rng.random(rows.size) < 0.1, order[:, 1], order[:, 0])
+    return _CANDIDATES[pick]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Return the pct-th percentile of samples (nearest rank)"""
+    # Not imported from bench_async_db: that imports the app, whose
+    # settings must wait for load_app()
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))]
+
+
+class Stats:
+    """Latencies and errors per endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, path: str, **kwargs) -> httpx.Response:
+        for attempt in range(RETRIES):
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            self.latencies[label].append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                self.errors[label] += 1
+            if response.status_code != 503:
+                break
+            await asyncio.sleep(0.05 * 2 ** attempt)
+        return response
+
+    def report(self, elapsed: float):
+        print(f"{'endpoint':<24} {'requests':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for label, latencies in self.latencies.items():
+            print(
+                f"{label:<24} {len(latencies):>8} {self.errors[label]:>7} {len(latencies) / elapsed:>9.1f} "
+                f"{statistics.median(latencies) * 1000:>8.2f} {percentile(latencies, 95) * 1000:>8.2f} "
+                f"{percentile(latencies, 99) * 1000:>8.2f}"
+            )
+
+
+class Arena:
+    """The bots' games, played in lockstep every tick"""
+
+    def __init__(self, bots: int, max_ticks: int, seed: int):
+        self.rng = np.random.default_rng(seed)
+        self.seeds = [int(s) for s in self.rng.integers(0, 2 ** 32, bots)]
+        self.modes = [GameMode.WALLS if i % 2 else GameMode.PASS_THROUGH for i in range(bots)]
+        self.game = BatchGame(self.seeds, self.modes)
+        self.max_ticks = max_ticks
+        self.moves = np.zeros((bots, max_ticks), dtype=np.uint8)
+        self.playing = np.zeros(bots, dtype=bool)
+        self.updates: List[asyncio.Queue] = [asyncio.Queue() for _ in range(bots)]
+        self.decisions = 0
+
+    def start(self, bot: int):
+        self.playing[bot] = True
+
+    def replay_moves(self, bot: int) -> str:
+        ticks = int(self.game.ticks[bot])
+        return _KEYS[self.moves[bot, :ticks]].tobytes().decode()
+
+    def tick(self):
+        rows = np.flatnonzero(self.playing)
+        if not rows.size:
+            return
+        codes = choose_moves(self.game, rows, self.rng)
+        self.moves[rows, self.game.ticks[rows]] = codes
+        before = self.game.score[rows]
+        ended = self.game.step(rows, codes)
+        self.decisions += rows.size
+        done = ended | (self.game.ticks[rows] >= self.max_ticks)
+        for bot in rows[self.game.score[rows] != before]:
+            self.updates[bot].put_nowait(int(self.game.score[bot]))
+        for bot in rows[done]:
+            self.playing[bot] = False
+            self.updates[bot].put_nowait(None)
+
+    async def run(self, tick_seconds: float, bots_done: asyncio.Event):
+        while not bots_done.is_set():
+            started = time.perf_counter()
+            self.tick()
+            await asyncio.sleep(max(0.0, tick_seconds - (time.perf_counter() - started)))
+
+
+async def play_bot(bot: int, client: httpx.AsyncClient, arena: Arena, stats: Stats, replays: bool, run_id: str):
+    credentials = {"email": f"bot{bot}-{run_id}@example.com", "password": "password123"}
+    await stats.call(client, "POST /auth/signup", "POST", "/api/auth/signup", json={
+        "username": f"bot{bot}-{run_id}", **credentials
+    })
+    response = await stats.call(client, "POST /auth/login", "POST", "/api/auth/login", json=credentials)
+    if response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+    mode = arena.modes[bot]
+    response = await stats.call(client, "POST /sessions", "POST", "/api/sessions/", json={"mode": mode.value}, headers=headers)
+    if response.status_code != 200:
+        return
+    session_id = response.json()["id"]
+
+    arena.start(bot)
+    while True:
+        score = await arena.updates[bot].get()
+        if score is None:
+            break
+        await stats.call(client, "PUT /sessions/{id}", "PUT", f"/api/sessions/{session_id}", json={"score": score}, headers=headers)
+    await stats.call(client, "DELETE /sessions/{id}", "DELETE", f"/api/sessions/{session_id}", headers=headers)
+
+    score = int(arena.game.score[bot])
+    body = {"score": score, "mode": mode.value}
+    if replays:
+        body["replay"] = {"seed": arena.seeds[bot], "moves": arena.replay_moves(bot)}
+    await stats.call(client, "POST /leaderboard", "POST", "/api/leaderboard/", json=body, headers=headers)
+
+
+async def run(args, app=None) -> None:
+    arena = Arena(args.bots, args.max_ticks, args.seed)
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.connections)
+    if app is not None:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+    else:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60)
+
+    run_id = os.urandom(4).hex()
+    bots_done = asyncio.Event()
+    async with client:
+        ticker = asyncio.create_task(arena.run(args.tick_ms / 1000, bots_done))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            play_bot(bot, client, arena, stats, args.replays, run_id) for bot in range(args.bots)
+        ))
+        elapsed = time.perf_counter() - started
+        bots_done.set()
+        await ticker
+
+    ticks = int(arena.game.ticks.sum())
+    print(f"{args.bots} bots, {ticks:,} ticks played in {elapsed:.1f} s "
+          f"({arena.decisions / elapsed:,.0f} bot moves/s), "
+          f"mean score {arena.game.score.mean():.0f}\n")
+    stats.report(elapsed)
+
+
+def load_app(database_url: str):
+    """
+    The application, on `database_url`. Settings are read when app
+    modules are first imported, so the URL is set before importing them.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    from app.database import init_db
+    from app.main import app
+    init_db()
+    return app
+
+
+async def run_in_process(args, app):
+    from app.database import async_engine
+    async with app.router.lifespan_context(app):
+        await run(args, app)
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test with bot players")
+    parser.add_argument("--url", help="Server to target (default: the app in-process on a temporary database)")
+    parser.add_argument("--bots", type=int, default=500)
+    parser.add_argument("--tick-ms", type=float, default=50.0, help="Milliseconds per game tick; the client uses 150")
+    parser.add_argument("--max-ticks", type=int, default=2000, help="Games still running after this many ticks end")
+    parser.add_argument("--connections", type=int, default=200, help="HTTP connections to a server")
+    parser.add_argument("--replays", action="store_true", help="Submit scores with their replays")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run(args))
+        return
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        asyncio.run(run_in_process(args, load_app(f"sqlite:///{db_path}")))
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
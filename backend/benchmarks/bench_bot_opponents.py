@@ -0,0 +1,108 @@
+"""Benchmark: bot opponent decisions per second per core
+
+Plays --games bot games (1,024 by default) for a random number of ticks
+each, up to --warmup, so the batch holds boards of every length. Then it
+times choose_moves() over batches of increasing size, drawn from those
+boards, and reports decisions per second and per CPU second. NumPy runs
+these operations on one thread, so the second figure is per core. The
+batch of 1 is the cost of deciding each game on its own.
+
+Last, --players asyncio players each ask the BotOpponents service for
+--ticks ticks in turn, to show the batching window at work: decisions
+per second and the mean batch size it gathered.
+
+Usage:
+    uv run python -m benchmarks.bench_bot_opponents
+
+    # Longer games, and more players on the service
+    uv run python -m benchmarks.bench_bot_opponents --warmup 3000 --players 2000
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.engine.batch import BatchGame
+from app.engine.bot import choose_moves
+from app.metrics import metrics
+from app.models import GameMode
+from app.services.bot_opponents import BotOpponents
+
+
+def warm_up(games: int, warmup: int) -> BatchGame:
+    """Games played by the bot for a random number of ticks each; ended ones start over"""
+    rng = np.random.default_rng(7)
+    seeds = [int(seed) for seed in rng.integers(0, 2 ** 32, games)]
+    modes = [GameMode.WALLS if i % 2 else GameMode.PASS_THROUGH for i in range(games)]
+    game = BatchGame(seeds, modes)
+    targets = rng.integers(0, warmup + 1, games)
+    for tick in range(warmup):
+        rows = np.flatnonzero(targets > tick)
+        if not rows.size:
+            break
+        ended = rows[game.step(rows, choose_moves(game, rows))]
+        if ended.size:
+            game.restart(ended, [seeds[row] for row in ended], [modes[row] for row in ended])
+    return game
+
+
+def time_batches(game: BatchGame, size: int, seconds: float = 1.0):
+    """(decisions per second, per CPU second) for choose_moves over batches of `size`"""
+    rows = np.arange(game.size)
+    decisions = 0
+    started, cpu_started = time.perf_counter(), time.process_time()
+    while time.perf_counter() - started < seconds:
+        for start in range(0, game.size - size + 1, size):
+            choose_moves(game, rows[start:start + size])
+            decisions += size
+    return decisions / (time.perf_counter() - started), decisions / (time.process_time() - cpu_started)
+
+
+async def run_service(players: int, ticks: int, batch_ms: float):
+    opponents = BotOpponents(max_games=players, batch_ms=batch_ms)
+
+    async def play(seed: int):
+        slot = opponents.start_game(seed, GameMode.WALLS if seed % 2 else GameMode.PASS_THROUGH)
+        for _ in range(ticks):
+            await opponents.step(slot)
+            if opponents.game.game_over[slot]:
+                break
+
+    started, cpu_started = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(play(seed) for seed in range(players)))
+    elapsed, cpu_seconds = time.perf_counter() - started, time.process_time() - cpu_started
+    decisions = int(opponents.game.ticks.sum())
+    batch_size = metrics.summary("bot_opponents.batch_size").snapshot()["mean"]
+    print(f"service, {players} players   {decisions / elapsed:>12,.0f} decisions/s  "
+          f"{decisions / cpu_seconds:>12,.0f} per core  ({batch_size:,.0f} per batch)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot opponent decisions")
+    parser.add_argument("--games", type=int, default=1024)
+    parser.add_argument("--warmup", type=int, default=1000, help="Most ticks a game is played before timing")
+    parser.add_argument("--players", type=int, default=512)
+    parser.add_argument("--ticks", type=int, default=200, help="Ticks each service player asks for")
+    parser.add_argument("--batch-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"Warming up {args.games:,} games for up to {args.warmup:,} ticks...")
+    game = warm_up(args.games, args.warmup)
+    print(f"snakes of {game.length.mean():.0f} cells on average\n")
+
+    single = None
+    for size in (1, 16, 64, 256, 1024):
+        if size > game.size:
+            break
+        per_second, per_core = time_batches(game, size)
+        single = single or per_core
+        print(f"batch of {size:<5}          {per_second:>12,.0f} decisions/s  "
+              f"{per_core:>12,.0f} per core  ({per_core / single:.1f}x)")
+
+    asyncio.run(run_service(args.players, args.ticks, args.batch_ms))
+
+
+if __name__ == "__main__":
+    main()
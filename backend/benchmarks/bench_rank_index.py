@@ -0,0 +1,80 @@
+"""Benchmark: rank lookups on the Fenwick-backed score index
+
+Builds a ScoreRankIndex over N leaderboard scores (10M by default), then
+times rank lookups and new-entry updates. With --compare-sql it also loads
+the same scores into a temporary SQLite table with a score index and times
+the SELECT COUNT(*) WHERE score > x the index replaces.
+
+Usage:
+    uv run python -m benchmarks.bench_rank_index
+
+    # Smaller run that includes the SQL comparison
+    uv run python -m benchmarks.bench_rank_index --entries 1000000 --compare-sql
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+
+from app.services.rank_index import ScoreRankIndex
+
+
+def random_score() -> int:
+    """Snake-like score: a multiple of 10 with a long tail"""
+    return int(random.expovariate(1 / 500)) // 10 * 10
+
+
+def time_per_op(func, probes) -> float:
+    """Microseconds per call of func over probes"""
+    started = time.perf_counter()
+    for probe in probes:
+        func(probe)
+    return (time.perf_counter() - started) / len(probes) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the leaderboard rank index")
+    parser.add_argument("--entries", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--compare-sql", action="store_true", help="Also time COUNT(*) on SQLite")
+    args = parser.parse_args()
+
+    print(f"Generating {args.entries:,} scores...")
+    scores = [random_score() for _ in range(args.entries)]
+    probes = [random_score() for _ in range(args.lookups)]
+
+    started = time.perf_counter()
+    index = ScoreRankIndex.from_histogram(Counter(scores).items())
+    print(f"build from histogram     {time.perf_counter() - started:>10.3f} s")
+    print(f"rank lookup              {time_per_op(index.rank, probes):>10.2f} us/op")
+    print(f"record new entry         {time_per_op(index.add, probes):>10.2f} us/op")
+
+    if args.compare_sql:
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        try:
+            connection = sqlite3.connect(db_path)
+            connection.execute("CREATE TABLE leaderboard_entries (score INTEGER NOT NULL)")
+            connection.executemany("INSERT INTO leaderboard_entries VALUES (?)", ((s,) for s in scores))
+            connection.execute("CREATE INDEX idx_score ON leaderboard_entries (score)")
+            connection.commit()
+
+            sql_probes = probes[:max(1, args.lookups // 1000)]
+
+            def count_above(score):
+                connection.execute(
+                    "SELECT COUNT(*) FROM leaderboard_entries WHERE score > ?", (score,)
+                ).fetchone()
+
+            print(f"SQLite COUNT(*) > score  {time_per_op(count_above, sql_probes):>10.2f} us/op")
+            connection.close()
+        finally:
+            os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
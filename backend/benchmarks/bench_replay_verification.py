@@ -0,0 +1,98 @@
+"""Benchmark: replay verification throughput
+
+Generates N replays (2,000 by default) of up to --moves ticks, then plays
+them back three ways and reports replays per second:
+
+- the scalar simulator, one replay at a time, on one core
+- the NumPy batch simulator (verify_replays), on one core
+- the ReplayVerifier's process pool, the batch simulator on every worker
+
+Per-core figures divide by the CPU seconds the workers report, so they
+can be compared with the single-core ones.
+
+Usage:
+    uv run python -m benchmarks.bench_replay_verification
+
+    # Longer games, on four workers
+    uv run python -m benchmarks.bench_replay_verification --moves 10000 --workers 4
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from app.engine.batch import verify_replays
+from app.engine.simulator import InvalidReplay, simulate
+from app.models import GameMode
+from app.services.replay_verification import ReplayVerifier
+
+
+def longest_valid(seed: int, log: str, mode: GameMode) -> str:
+    """The longest prefix of a log that simulate() accepts: up to its game's end"""
+    low, high = 0, len(log)
+    while low < high:
+        middle = (low + high + 1) // 2
+        try:
+            simulate(seed, log[:middle], mode)
+            low = middle
+        except InvalidReplay:
+            high = middle - 1
+    return log[:low]
+
+
+def generate_replays(count: int, moves: int):
+    """Logs turning at random on about one tick in seven, cut where their game ended"""
+    rnd = random.Random(7)
+    replays = []
+    for _ in range(count):
+        seed = rnd.getrandbits(32)
+        mode = rnd.choice(list(GameMode))
+        log = "".join(rnd.choice("URDL") if rnd.random() < 0.15 else "." for _ in range(moves))
+        replays.append((seed, longest_valid(seed, log, mode), mode))
+    return replays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark replay verification")
+    parser.add_argument("--replays", type=int, default=2000)
+    parser.add_argument("--moves", type=int, default=4000)
+    parser.add_argument("--workers", type=int, default=None, help="Pool size; defaults to the CPU count")
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"Generating {args.replays:,} replays of up to {args.moves:,} moves...")
+    replays = generate_replays(args.replays, args.moves)
+    total_moves = sum(len(moves) for _, moves, _ in replays)
+    print(f"{total_moves / len(replays):,.0f} moves per replay on average")
+
+    started = time.perf_counter()
+    expected = [simulate(*replay) for replay in replays]
+    scalar = len(replays) / (time.perf_counter() - started)
+    print(f"scalar, one core          {scalar:>10,.0f} replays/s")
+
+    started = time.perf_counter()
+    results = verify_replays(replays, args.chunk_size)
+    batch = len(replays) / (time.perf_counter() - started)
+    assert results == expected, "batch and scalar simulators disagree"
+    print(f"NumPy batch, one core     {batch:>10,.0f} replays/s  ({batch / scalar:.1f}x)")
+
+    verifier = ReplayVerifier(kind="process", workers=args.workers, chunk_size=args.chunk_size)
+
+    async def run_pool():
+        # The first call starts the workers; time the second
+        await verifier._play(replays)
+        started = time.perf_counter()
+        results, cpu_seconds = await verifier._play(replays)
+        elapsed = time.perf_counter() - started
+        await verifier.stop()
+        return results, elapsed, cpu_seconds
+
+    results, elapsed, cpu_seconds = asyncio.run(run_pool())
+    assert results == expected, "pool and scalar simulators disagree"
+    print(f"pool of {verifier.workers:<3} total         {len(replays) / elapsed:>10,.0f} replays/s")
+    print(f"pool of {verifier.workers:<3} per core      {len(replays) / cpu_seconds:>10,.0f} replays/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Microbenchmark: leaderboard JSON responses, cost per entry
+
+Compares the two ways a page of leaderboard entries turns into a JSON
+response body, for pages of 10 to 1,000 entries:
+
+- before: ORM entities, to_dict(), a LeaderboardEntry built from that,
+  then FastAPI's response_model path (validate again, jsonable_encoder,
+  json.dumps)
+- after: plain row tuples, one LeaderboardEntry each, written straight to
+  bytes by the precompiled TypeAdapter of LeaderboardEntriesResponse
+
+It times both with the rows read from an in-memory SQLite database, and
+with the entries already built, as the top-k cache serves them.
+
+Usage:
+    uv run python -m benchmarks.bench_serialization
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.db_models import DBLeaderboardEntry
+from app.models import EntryStatus, GameMode, LeaderboardEntry
+from app.responses import LeaderboardEntriesResponse
+from app.services.leaderboard_cache import ENTRY_COLUMNS, entry_from_row, leaderboard_order
+
+_FIELD = create_model_field(name="Response", type_=List[LeaderboardEntry], mode="serialization")
+
+
+async def response_model_body(entries: List[LeaderboardEntry]) -> bytes:
+    """What FastAPI does with a list returned under response_model=List[LeaderboardEntry]"""
+    content = await serialize_response(field=_FIELD, response_content=entries)
+    return JSONResponse(content).body
+
+
+async def fast_body(entries: List[LeaderboardEntry]) -> bytes:
+    return LeaderboardEntriesResponse(entries).body
+
+
+async def per_entry(func, entries: int, seconds: float = 0.5) -> float:
+    """Microseconds per entry of func(), run for about `seconds`"""
+    runs = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        await func()
+        runs += 1
+    return (time.perf_counter() - started) / runs / entries * 1e6
+
+
+async def run(sizes: List[int]):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    started = datetime(2026, 1, 1)
+    with Session(engine) as db:
+        db.add_all(
+            DBLeaderboardEntry(
+                id=str(uuid.uuid4()), user_id=str(uuid.uuid4()), username=f"player{i}", score=i * 10,
+                mode=GameMode.WALLS, timestamp=started + timedelta(seconds=i), status=EntryStatus.ACCEPTED,
+            )
+            for i in range(max(sizes))
+        )
+        db.commit()
+
+    print(f"{'entries':>8} {'source':<8} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    with Session(engine) as db:
+        for size in sizes:
+            async def before():
+                db.expunge_all()
+                entities = db.scalars(select(DBLeaderboardEntry).order_by(*leaderboard_order()).limit(size))
+                return await response_model_body([LeaderboardEntry(**entity.to_dict()) for entity in entities])
+
+            async def after():
+                rows = db.execute(select(*ENTRY_COLUMNS).order_by(*leaderboard_order()).limit(size))
+                return await fast_body([entry_from_row(row) for row in rows])
+
+            assert await before() == await after(), "the two paths disagree"
+            entries = [entry_from_row(row) for row in db.execute(select(*ENTRY_COLUMNS).limit(size))]
+            for source, paths in (
+                ("database", (before, after)),
+                ("cache", (lambda: response_model_body(entries), lambda: fast_body(entries))),
+            ):
+                old, new = [await per_entry(path, size) for path in paths]
+                print(f"{size:>8} {source:<8} {old:>10.2f} {new:>10.2f} {old / new:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark leaderboard response serialization")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes))
+
+
+if __name__ == "__main__":
+    main()
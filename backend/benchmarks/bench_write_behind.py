@@ -0,0 +1,164 @@
+"""Benchmark: per-submission commits vs. the write-behind queue
+
+Drives score submissions from concurrent clients straight into the service
+layer and reports committed inserts per second and acknowledgement latency:
+
+- direct: AsyncDatabaseService.submit_score, one transaction per score
+- write-behind: ScoreWriteBehind.submit, flushed in batches in the
+  background; the clock stops once the last batch is committed
+
+--latency-ms adds a simulated network round trip to every statement, which
+is what a remote PostgreSQL server looks like to the driver.
+
+Usage:
+    # 50 concurrent clients against a temporary SQLite database
+    uv run python -m benchmarks.bench_write_behind
+
+    # Against PostgreSQL (the database is reset, so use a scratch database)
+    uv run python -m benchmarks.bench_write_behind --database-url postgresql://user:pw@localhost/bench
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import List
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.util import await_only
+
+from app.database import Base, get_async_database_url
+from app.db_models import DBUser, DBLeaderboardEntry
+from app.models import GameMode
+from app.services.async_database import async_db_service
+from app.services.write_behind import ScoreWriteBehind
+from benchmarks.bench_async_db import percentile
+
+
+def seed_users(database_url: str, users: int) -> List[DBUser]:
+    """Reset the schema and create the submitting users"""
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    try:
+        db_users = [
+            DBUser(username=f"bench{i}", email=f"bench{i}@example.com", hashed_password="x")
+            for i in range(users)
+        ]
+        db.add_all(db_users)
+        db.commit()
+        return db_users
+    finally:
+        db.close()
+        engine.dispose()
+
+
+async def run_submissions(submit, clients: int, per_client: int, users: List[DBUser]) -> List[float]:
+    """Submit from `clients` concurrent clients and collect acknowledgement latencies"""
+    latencies: List[float] = []
+
+    async def client():
+        for _ in range(per_client):
+            user = random.choice(users)
+            started = time.perf_counter()
+            await submit(user, random.randint(0, 5000), random.choice(list(GameMode)))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies
+
+
+async def bench_direct(session_factory, clients, per_client, users) -> tuple:
+    async def submit(user, score, mode):
+        async with session_factory() as db:
+            await async_db_service.submit_score(db, user.id, user.username, score, mode)
+
+    started = time.perf_counter()
+    latencies = await run_submissions(submit, clients, per_client, users)
+    return latencies, time.perf_counter() - started
+
+
+async def bench_write_behind(session_factory, clients, per_client, users, spill_dir, flush_ms, batch_size) -> tuple:
+    writer = ScoreWriteBehind(session_factory, spill_dir, flush_ms / 1000, batch_size, enabled=True)
+    await writer.start()
+
+    async def submit(user, score, mode):
+        writer.submit(user.id, user.username, score, mode)
+        # Let the flusher run between submissions, as request handling would
+        await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    latencies = await run_submissions(submit, clients, per_client, users)
+    await writer.stop()
+    return latencies, time.perf_counter() - started
+
+
+async def count_entries(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(select(func.count()).select_from(DBLeaderboardEntry))
+
+
+def print_result(label: str, committed: int, latencies: List[float], elapsed: float):
+    print(
+        f"{label:<13} {committed:>8} rows  {committed / elapsed:>9.1f} inserts/s  "
+        f"ack p50 {statistics.median(latencies) * 1000:>8.3f} ms  p99 {percentile(latencies, 99) * 1000:>8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark write-behind leaderboard submissions")
+    parser.add_argument("--database-url", help="Scratch database to reset (default: temporary SQLite file)")
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent submitting clients")
+    parser.add_argument("--submissions", type=int, default=100, help="Submissions per client")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--flush-ms", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated DB round trip per statement")
+    args = parser.parse_args()
+
+    db_path = None
+    database_url = args.database_url
+    if database_url is None:
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{db_path}"
+
+    try:
+        with tempfile.TemporaryDirectory() as spill_dir:
+            print(
+                f"{args.clients} concurrent clients x {args.submissions} submissions, "
+                f"{args.latency_ms} ms per statement\n"
+            )
+            for label in ("direct", "write-behind"):
+                users = seed_users(database_url, args.users)
+                async_engine = create_async_engine(get_async_database_url(database_url))
+                if args.latency_ms > 0:
+                    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+                    def round_trip(*_):
+                        await_only(asyncio.sleep(args.latency_ms / 1000))
+                session_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+                if label == "direct":
+                    run = bench_direct(session_factory, args.clients, args.submissions, users)
+                else:
+                    run = bench_write_behind(
+                        session_factory, args.clients, args.submissions, users,
+                        spill_dir, args.flush_ms, args.batch_size
+                    )
+                latencies, elapsed = asyncio.run(run)
+                committed = asyncio.run(count_entries(session_factory))
+                print_result(label, committed, latencies, elapsed)
+                asyncio.run(async_engine.dispose())
+    finally:
+        if db_path and os.path.exists(db_path):
+            os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,93 @@
+import os
+import tempfile
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app as fastapi_app
-from app.database import Base, get_db
+from app.database import Base, get_db, get_async_db, get_async_database_url
+from app.services.bot_opponents import bot_opponents
+from app.services.input_relay import input_relay
+from app.services.leaderboard_cache import leaderboard_cache
+from app.services.leaderboard_events import leaderboard_events
+from app.services.live_sessions import live_sessions
+from app.services.session_broadcast import session_broadcaster
+from app.services.principal_cache import principal_cache
+from app.services.rank_index import rank_index
 # Import db_models to ensure tables are registered with Base
 import app.db_models  # noqa: F401
 
-# Create in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@pytest.fixture(scope="session")
+def test_db_url():
+    """
+    Create a temporary SQLite database file for the test session.
 
+    The sync session used by tests and the async sessions used by the API
+    need to see the same data, so an in-memory database cannot be used.
+    """
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    yield f"sqlite:///{db_path}"
+    if os.path.exists(db_path):
+        os.remove(db_path)
 
-# Create tables once at module level
-Base.metadata.create_all(bind=engine)
+
+@pytest.fixture(scope="session")
+def engine(test_db_url):
+    """Create the sync engine and the schema once per test session"""
+    engine = create_engine(test_db_url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def async_session_factory(engine, test_db_url):
+    """Create the async session factory used by the API during tests"""
+    async_engine = create_async_engine(get_async_database_url(test_db_url), poolclass=NullPool)
+    return async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 
 @pytest.fixture
-def db():
+def db(engine):
     """Create a fresh database session for each test"""
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
-    
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
     try:
         yield session
     finally:
         session.close()
-        transaction.rollback()
-        connection.close()
+        # Empty every table so each test starts from a clean database
+        with engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
 
 
 @pytest.fixture
-def client(db):
+def client(db, async_session_factory):
     """Create a test client with database dependency override"""
     def override_get_db():
         try:
             yield db
         finally:
             pass
-    
+
+    async def override_get_async_db():
+        async with async_session_factory() as session:
+            yield session
+
     fastapi_app.dependency_overrides[get_db] = override_get_db
+    fastapi_app.dependency_overrides[get_async_db] = override_get_async_db
     yield TestClient(fastapi_app)
     fastapi_app.dependency_overrides.clear()
+    principal_cache.clear()
+    leaderboard_cache.clear()
+    leaderboard_events.clear()
+    live_sessions.clear()
+    session_broadcaster.clear()
+    rank_index.clear()
+    input_relay.clear()
+    bot_opponents.clear()
@@ -4,3 +4,17 @@ def test_root(client: TestClient):
     response = client.get("/api")
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to Snake Arena API"}
+
+
+def test_metrics(client: TestClient):
+    """Test the metrics endpoint reports password hashing timings"""
+    client.post("/api/auth/signup", json={
+        "username": "metricsuser",
+        "email": "metrics@example.com",
+        "password": "password123"
+    })
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["password_hash.hash_seconds"]["count"] >= 1
+    assert "password_hash.queue_wait_seconds" in data
@@ -1,5 +1,13 @@
+import os
+import signal
+import time
 from fastapi.testclient import TestClient
 from app.services.database import db_service
+from app.services.hashing import hashing_pool
+from app.auth import build_password_hasher, password_needs_rehash
+from app.metrics import metrics
+from app.services.principal_cache import TTLCache
+from app.db_models import DBUser
 from app.models import GameMode
 
 
@@ -84,6 +92,63 @@ def test_login_invalid_credentials(client: TestClient, db):
     assert response.status_code == 401
 
 
+def test_login_rehashes_old_profile(client: TestClient, db):
+    """Test login upgrades a hash made under an older cost profile"""
+    old_hash = build_password_hasher("owasp-minimum").hash("password123")
+    db.add(DBUser(username="olduser", email="old@example.com", hashed_password=old_hash))
+    db.commit()
+    assert password_needs_rehash(old_hash)
+    
+    response = client.post("/api/auth/login", json={
+        "email": "old@example.com",
+        "password": "password123"
+    })
+    assert response.status_code == 200
+    
+    db.expire_all()
+    user = db_service.get_user_by_email(db, "old@example.com")
+    assert user.hashed_password != old_hash
+    assert not password_needs_rehash(user.hashed_password)
+
+
+def test_login_server_busy(client: TestClient, db, monkeypatch):
+    """Test login is rejected with 503 when the hashing pool is full"""
+    client.post("/api/auth/signup", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    monkeypatch.setattr(hashing_pool, "max_pending", 0)
+    
+    response = client.post("/api/auth/login", json={
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_login_after_a_hashing_worker_dies(client: TestClient, db):
+    """Test a hashing pool broken by a killed worker is replaced and login still succeeds"""
+    client.post("/api/auth/signup", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    worker = next(iter(hashing_pool._executor._processes.values()))
+    os.kill(worker.pid, signal.SIGKILL)
+    worker.join(5)
+    # The pool notices the death on its own thread
+    time.sleep(0.5)
+    
+    response = client.post("/api/auth/login", json={
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    assert response.status_code == 200
+    assert metrics.counter("password_hash.pool_broken").value >= 1
+
+
 def test_logout(client: TestClient, db):
     """Test logout endpoint"""
     # Signup to get a token
@@ -123,3 +188,58 @@ def test_get_me_invalid_token(client: TestClient, db):
     response = client.get("/api/auth/me", headers=headers)
     assert response.status_code == 401
 
+
+def test_get_me_is_served_from_principal_cache(client: TestClient, db):
+    """Test repeated authenticated calls reuse the cached principal"""
+    signup_response = client.post("/api/auth/signup", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    headers = {"Authorization": f"Bearer {signup_response.json()['token']}"}
+    
+    client.get("/api/auth/me", headers=headers)
+    hits = metrics.counter("principal_cache.user_hits").value
+    token_hits = metrics.counter("principal_cache.token_hits").value
+    
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert metrics.counter("principal_cache.user_hits").value == hits + 1
+    assert metrics.counter("principal_cache.token_hits").value == token_hits + 1
+
+
+def test_get_me_after_high_score_change(client: TestClient, db):
+    """Test the cached principal is invalidated when the high score changes"""
+    signup_response = client.post("/api/auth/signup", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    headers = {"Authorization": f"Bearer {signup_response.json()['token']}"}
+    assert client.get("/api/auth/me", headers=headers).json()["highScore"] == 0
+    
+    client.post("/api/leaderboard/", json={"score": 700, "mode": "walls"}, headers=headers)
+    
+    assert client.get("/api/auth/me", headers=headers).json()["highScore"] == 700
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test the cache drops the least recently used entry when full"""
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    """Test entries are not returned after their TTL"""
+    cache = TTLCache(max_size=10, ttl=60)
+    cache.set("a", 1, ttl=0)
+    
+    assert cache.get("a") is None
+    assert len(cache) == 0
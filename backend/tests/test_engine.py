@@ -0,0 +1,265 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.db_models import DBLeaderboardEntry, DBLeaderboardReplay
+from app.engine.batch import MIN_VECTOR_BATCH, BatchGame, simulate_batch, verify_replays
+from app.engine.bot import _FULL, choose_moves, flood
+from app.engine.replay_format import decode_replay
+from app.engine.rng import Mulberry32
+from app.engine.simulator import CELLS, GRID_SIZE, MAX_MOVES, MOVE_KEYS, Game, InvalidReplay, simulate
+from app.models import EntryStatus, GameMode
+from app.services.database import db_service
+from app.services.replay_archive import ReplayArchive
+from app.services.replay_verification import ReplayVerifier
+
+
+def random_moves(seed: int, ticks: int = 3000) -> str:
+    """A move log turning at random on about one tick in seven"""
+    rnd = random.Random(seed)
+    return "".join(rnd.choice("URDL") if rnd.random() < 0.15 else "." for _ in range(ticks))
+
+
+def test_rng_matches_the_client():
+    """Test Mulberry32 gives the values the JavaScript version gives"""
+    rng = Mulberry32(42)
+    assert [rng.next_u32() for _ in range(3)] == [2581720956, 1925393290, 3661312704]
+    rng = Mulberry32(0xFFFFFFFF)
+    assert [rng.next_u32() for _ in range(3)] == [3850105811, 813802916, 3073704848]
+
+
+def test_walls_end_the_game():
+    """Test leaving the grid in walls mode ends the game, and nothing is played after it"""
+    # The head starts at x=10 heading right; the tenth move leaves the grid
+    assert simulate(1, "." * 9, GameMode.WALLS) == (0, 9, False)
+    assert simulate(1, "." * 10, GameMode.WALLS) == (0, 10, True)
+    # Reversing is ignored
+    assert simulate(1, "L" + "." * 9, GameMode.WALLS) == (0, 10, True)
+    with pytest.raises(InvalidReplay):
+        simulate(1, "." * 11, GameMode.WALLS)
+
+
+def test_eating_food_scores():
+    """Test reaching the food scores 10"""
+    # Seed 41 places the first food at (17, 10), straight ahead of the head
+    assert simulate(41, "." * 6, GameMode.WALLS).score == 0
+    assert simulate(41, "." * 7, GameMode.WALLS).score == 10
+
+
+@pytest.mark.parametrize("seed, mode, expected", [
+    # Scores, ticks and endings of gameLogic.ts's moveSnake() on the same logs, its
+    # food drawn from Mulberry32
+    (3, GameMode.PASS_THROUGH, (110, 3000, False)),
+    (10, GameMode.PASS_THROUGH, (90, 2950, True)),
+    (12, GameMode.PASS_THROUGH, (40, 1809, True)),
+    (0, GameMode.WALLS, (0, 10, True)),
+])
+def test_replays_match_the_client(seed, mode, expected):
+    """Test random logs score, last and end as gameLogic.ts plays them with seeded food"""
+    moves = random_moves(seed)[:expected[1]]
+    assert simulate(seed, moves, mode) == expected
+
+
+def test_malformed_logs_are_rejected():
+    """Test logs with unknown moves or too many moves are rejected"""
+    with pytest.raises(InvalidReplay):
+        simulate(1, "..X", GameMode.WALLS)
+    with pytest.raises(InvalidReplay):
+        simulate(1, "." * (MAX_MOVES + 1), GameMode.PASS_THROUGH)
+
+
+def test_game_steps_like_simulate():
+    """Test playing a log tick by tick gives simulate()'s result at every tick"""
+    for seed, mode in [(3, GameMode.PASS_THROUGH), (12, GameMode.PASS_THROUGH), (41, GameMode.WALLS)]:
+        moves = random_moves(seed, 2000)
+        game = Game(seed, mode)
+        for tick, key in enumerate(moves):
+            game.step(key)
+            if tick % 97 == 0 or game.game_over:
+                assert (game.score, game.tick, game.game_over) == simulate(seed, moves[:tick + 1], mode)
+            if game.game_over:
+                break
+        with pytest.raises(InvalidReplay):
+            game.step(".") if game.game_over else game.step("?")
+
+
+def test_batch_matches_the_scalar_simulator():
+    """Test simulate_batch gives simulate's result, or None where it raises, for every replay"""
+    replays = []
+    for seed in range(300):
+        mode = GameMode.WALLS if seed % 2 else GameMode.PASS_THROUGH
+        moves = random_moves(seed, ticks=seed * 7)
+        replays.append((seed, moves, mode))
+    # Malformed, too long, and continuing after the game ended
+    replays += [(1, "..X", GameMode.WALLS), (1, "." * (MAX_MOVES + 1), GameMode.WALLS), (1, "." * 11, GameMode.WALLS)]
+
+    expected = []
+    for replay in replays:
+        try:
+            expected.append(simulate(*replay))
+        except InvalidReplay:
+            expected.append(None)
+    assert simulate_batch(replays) == expected
+    assert verify_replays(replays, chunk_size=MIN_VECTOR_BATCH) == expected
+
+
+def test_flood_wraps_only_in_pass_through():
+    """Test a flood fill crosses the edges of pass-through boards only"""
+    free = np.full((2, GRID_SIZE), _FULL, dtype=np.uint32)
+    free[:, GRID_SIZE // 2] = 0  # a full row of body across the board
+    seeds = np.zeros((2, GRID_SIZE), dtype=np.uint32)
+    seeds[:, 0] = 1
+    wrap = np.array([[0], [_FULL]], dtype=np.uint32)
+    reached = np.bitwise_count(flood(seeds, free, wrap)).sum(axis=1)
+    assert reached.tolist() == [CELLS // 2, CELLS - GRID_SIZE]
+
+
+def test_bot_plays_by_the_rules():
+    """Test the bot's games, stepped in batches, are the games its moves replay to"""
+    keys = {direction: key for key, direction in MOVE_KEYS.items()}
+    seeds = list(range(32))
+    modes = [GameMode.WALLS if seed % 2 else GameMode.PASS_THROUGH for seed in seeds]
+    game = BatchGame(seeds, modes)
+    # A slot reused for a new game starts from scratch
+    game.step(np.arange(32), np.full(32, MOVE_KEYS["D"]))
+    game.restart(np.arange(32), seeds, modes)
+    logs = [""] * 32
+    running = np.arange(32)
+    for _ in range(400):
+        codes = choose_moves(game, running)
+        for row, code in zip(running, codes):
+            logs[row] += keys[int(code)]
+        running = running[~game.step(running, codes)]
+    for row, seed in enumerate(seeds):
+        result = (int(game.score[row]), int(game.ticks[row]), bool(game.game_over[row]))
+        assert simulate(seed, logs[row], modes[row]) == result
+    # The frontend's aiPlayer.ts averages around 70
+    assert game.score.mean() > 200
+
+
+def test_submission_with_replay_is_verified(client: TestClient, db, async_session_factory, tmp_path):
+    """Test pending entries are accepted or rejected by their replays, in batches bounded by moves"""
+    signup_response = client.post("/api/auth/signup", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    headers = {"Authorization": f"Bearer {signup_response.json()['token']}"}
+    replay = {"seed": 41, "moves": "." * 7}
+    
+    response = client.post("/api/leaderboard/", json={"score": 10, "mode": "walls", "replay": {"seed": 41, "moves": "?"}}, headers=headers)
+    assert response.status_code == 400
+    for score in (20, 10):
+        response = client.post("/api/leaderboard/", json={"score": score, "mode": "walls", "replay": replay}, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["status"] == "pending"
+    # Pending entries are not on the leaderboard
+    assert client.get("/api/leaderboard/").json() == []
+    
+    verifier = ReplayVerifier(
+        async_session_factory, kind="thread", workers=2, batch_moves=10, archive=ReplayArchive(str(tmp_path))
+    )
+    
+    async def verify():
+        async with async_session_factory() as session:
+            return await verifier.verify_pending(session)
+    
+    # Seven moves each: one entry per batch
+    assert asyncio.run(verify()) == 1
+    assert asyncio.run(verify()) == 1
+    asyncio.run(verifier.stop())
+    db.expire_all()
+    statuses = {entry.score: entry.status for entry in db.query(DBLeaderboardEntry)}
+    assert statuses == {20: EntryStatus.REJECTED, 10: EntryStatus.ACCEPTED}
+    assert [entry["score"] for entry in client.get("/api/leaderboard/").json()] == [10]
+    assert client.get("/api/auth/me", headers=headers).json()["highScore"] == 10
+    assert asyncio.run(verify()) == 0
+    # The accepted replay is archived, and no replay is left in the table
+    accepted = db.query(DBLeaderboardEntry).filter(DBLeaderboardEntry.score == 10).one()
+    assert decode_replay(verifier.archive.get(accepted.id)) == (41, "." * 7, GameMode.WALLS)
+    assert db.query(DBLeaderboardReplay).count() == 0
+
+
+def test_broken_pool_is_replaced(client: TestClient, db, async_session_factory, tmp_path):
+    """Test a verifier whose pool broke starts a new one, the entries left pending meanwhile"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    entry_id = str(uuid.uuid4())
+    db.add(DBLeaderboardEntry(
+        id=entry_id, user_id=user.id, username=user.username, score=10, mode=GameMode.WALLS,
+        status=EntryStatus.PENDING,
+    ))
+    db.add(DBLeaderboardReplay(entry_id=entry_id, seed=41, moves="." * 7))
+    db.commit()
+    verifier = ReplayVerifier(async_session_factory, kind="thread", workers=1, archive=ReplayArchive(str(tmp_path)))
+    
+    def fail():
+        raise RuntimeError("worker died")
+    
+    async def verify():
+        async with async_session_factory() as session:
+            return await verifier.verify_pending(session)
+    
+    verifier._executor = ThreadPoolExecutor(max_workers=1, initializer=fail)
+    with pytest.raises(BrokenExecutor):
+        asyncio.run(verify())
+    assert verifier._executor is None
+    db.expire_all()
+    assert db.get(DBLeaderboardEntry, entry_id).status == EntryStatus.PENDING
+    
+    assert asyncio.run(verify()) == 1
+    asyncio.run(verifier.stop())
+    db.expire_all()
+    assert db.get(DBLeaderboardEntry, entry_id).status == EntryStatus.ACCEPTED
+
+
+def test_claimed_entries_are_left_to_their_verifier(client: TestClient, db, async_session_factory, tmp_path):
+    """Test verifiers skip entries claimed by another until its lease runs out, and only the holder archives"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    entry_id = str(uuid.uuid4())
+    db.add(DBLeaderboardEntry(
+        id=entry_id, user_id=user.id, username=user.username, score=10, mode=GameMode.WALLS,
+        status=EntryStatus.PENDING,
+    ))
+    db.add(DBLeaderboardReplay(entry_id=entry_id, seed=41, moves="." * 7))
+    db.commit()
+    archive = ReplayArchive(str(tmp_path))
+    archived = []
+    append_many = archive.append_many
+    
+    def record(replays):
+        replays = list(replays)
+        archived.extend(replay_id for replay_id, _ in replays)
+        append_many(replays)
+    
+    archive.append_many = record
+    first = ReplayVerifier(async_session_factory, kind="thread", workers=1, lease=60, archive=archive)
+    second = ReplayVerifier(async_session_factory, kind="thread", workers=1, lease=60, archive=archive)
+    claimed_at = datetime.utcnow() - timedelta(seconds=30)
+    
+    async def run():
+        async with async_session_factory() as session:
+            rows = await first._claim(session, claimed_at)
+            await session.commit()
+        assert [entry.id for entry, _, _ in rows] == [entry_id]
+        async with async_session_factory() as session:
+            assert await second.verify_pending(session) == 0
+        # The first verifier's lease runs out: the entry is claimable again
+        second.lease = 10
+        async with async_session_factory() as session:
+            assert await second.verify_pending(session) == 1
+        # Deciding on a lost claim changes nothing
+        async with async_session_factory() as session:
+            promoted, demoted, batch, _, _ = await first._decide(session, rows, claimed_at)
+        assert (promoted, demoted, batch) == (set(), set(), [])
+        await first.stop()
+        await second.stop()
+    
+    asyncio.run(run())
+    db.expire_all()
+    entry = db.get(DBLeaderboardEntry, entry_id)
+    assert (entry.status, entry.claimed_at) == (EntryStatus.ACCEPTED, None)
+    assert archived == [entry_id]
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import socket
+from fastapi.testclient import TestClient
+from app.metrics import metrics
+from app.services.event_bus import (
+    SCORE_SUBMITTED, SESSION_CREATED, SESSION_ENDED, SESSION_UPDATED, USER_CHANGED,
+    NOTIFY_PAYLOAD_LIMIT, Event, InMemoryEventBus, PostgresEventBus, UnixSocketEventBus, event_bus
+)
+from app.services.live_sessions import live_sessions
+from app.services.principal_cache import principal_cache
+from app.models import User
+
+
+def remote(topic: str, data: dict) -> Event:
+    """An event as another worker would have published it"""
+    return Event(topic, data, "another-worker")
+
+
+def test_in_memory_buses_deliver_to_each_other():
+    """Test buses on one hub deliver to each other, remote-only handlers skipping their own events"""
+    hub = []
+    first, second = InMemoryEventBus(hub), InMemoryEventBus(hub)
+    received = {"first": [], "first remote": [], "second": []}
+    first.subscribe("topic", lambda event: received["first"].append(event.data))
+    first.subscribe("topic", lambda event: received["first remote"].append(event.data), remote_only=True)
+    second.subscribe("topic", lambda event: received["second"].append(event.data))
+
+    first.publish("topic", {"n": 1})
+    second.publish("topic", {"n": 2})
+
+    assert received == {
+        "first": [{"n": 1}, {"n": 2}],
+        "first remote": [{"n": 2}],
+        "second": [{"n": 1}, {"n": 2}],
+    }
+
+
+def test_failing_handler_does_not_stop_delivery():
+    """Test a handler that raises does not keep the event from the handlers after it"""
+    bus = InMemoryEventBus()
+    received = []
+    bus.subscribe("topic", lambda event: 1 / 0)
+    bus.subscribe("topic", lambda event: received.append(event.data))
+    bus.publish("topic", {})
+    assert received == [{}]
+
+
+def test_unix_socket_buses_deliver_to_each_other(tmp_path):
+    """Test buses sharing a socket directory deliver to each other and remove sockets left behind"""
+    directory = str(tmp_path)
+    # A socket left behind by a worker that died
+    stale = os.path.join(directory, "dead.sock")
+
+    async def exchange():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as dead:
+            dead.bind(stale)
+
+        first, second = UnixSocketEventBus(directory), UnixSocketEventBus(directory)
+        received = asyncio.Queue()
+        second.subscribe("topic", lambda event: received.put_nowait(event.data))
+        await first.start()
+        await second.start()
+        try:
+            first.publish("topic", {"n": 1})
+            return await asyncio.wait_for(received.get(), 5)
+        finally:
+            await first.stop()
+            await second.stop()
+
+    assert asyncio.run(exchange()) == {"n": 1}
+    assert os.listdir(directory) == []
+
+
+def test_unix_socket_peers_are_listed_now_and_then(tmp_path):
+    """Test a bus sends to the sockets it last listed, until its peer list is refreshed"""
+    directory = str(tmp_path)
+
+    async def exchange():
+        first = UnixSocketEventBus(directory, peer_refresh_seconds=60)
+        second = UnixSocketEventBus(directory)
+        received = asyncio.Queue()
+        second.subscribe("topic", lambda event: received.put_nowait(event.data))
+        await first.start()
+        try:
+            first.publish("topic", {"n": 0})
+            await second.start()
+            # Not listed yet
+            first.publish("topic", {"n": 1})
+            first.peer_refresh_seconds = 0
+            first.publish("topic", {"n": 2})
+            return await asyncio.wait_for(received.get(), 5), received.qsize()
+        finally:
+            await first.stop()
+            await second.stop()
+
+    assert asyncio.run(exchange()) == ({"n": 2}, 0)
+
+
+def test_postgres_bus_queue_is_bounded():
+    """Test events published while the connection is down are dropped beyond the queue size"""
+    dropped = metrics.counter("event_bus.dropped")
+
+    async def publish():
+        bus = PostgresEventBus("postgresql://nowhere/none", reconnect_delay=60, queue_size=2)
+        await bus.start()
+        try:
+            before = dropped.value
+            for n in range(5):
+                bus.publish("topic", {"n": n})
+            await asyncio.sleep(0)
+            return bus._queue.qsize(), dropped.value - before
+        finally:
+            await bus.stop()
+
+    assert asyncio.run(publish()) == (2, 3)
+
+
+def test_postgres_bus_survives_a_failed_notify(monkeypatch):
+    """Test oversized events are dropped, and a failed NOTIFY keeps the connection"""
+    import asyncpg
+
+    class Connection:
+        def __init__(self):
+            self.sent = []
+
+        async def add_listener(self, channel, callback):
+            pass
+
+        async def execute(self, query, channel, payload):
+            if "fail" in payload:
+                raise asyncpg.PostgresError("refused")
+            self.sent.append(Event.decode(payload).data)
+
+        async def close(self):
+            pass
+
+    connections = []
+
+    async def connect(dsn):
+        connections.append(Connection())
+        return connections[-1]
+
+    monkeypatch.setattr(asyncpg, "connect", connect)
+    oversized = metrics.counter("event_bus.oversized")
+    failed = metrics.counter("event_bus.notify_failed")
+    before = oversized.value, failed.value
+
+    async def publish():
+        bus = PostgresEventBus("postgresql://nowhere/none", reconnect_delay=60)
+        await bus.start()
+        try:
+            bus.publish("topic", {"n": "x" * NOTIFY_PAYLOAD_LIMIT})
+            bus.publish("topic", {"n": "fail"})
+            bus.publish("topic", {"n": 1})
+            for _ in range(10):
+                await asyncio.sleep(0)
+        finally:
+            await bus.stop()
+
+    asyncio.run(publish())
+    assert len(connections) == 1
+    assert connections[0].sent == [{"n": 1}]
+    assert (oversized.value - before[0], failed.value - before[1]) == (1, 1)
+
+
+def test_remote_score_reaches_leaderboard_and_rank_index(client: TestClient, db):
+    """Test a score submitted on another worker reaches the leaderboard and the rank index"""
+    # Warm both read models; the entry itself is in the other worker's database
+    assert client.get("/api/leaderboard/").json() == []
+    assert client.get("/api/leaderboard/rank", params={"score": 100}).json()["rank"] == 1
+    event_bus._receive(remote(SCORE_SUBMITTED, {"entry": {
+        "id": "remote-entry",
+        "username": "elsewhere",
+        "score": 500,
+        "mode": "walls",
+        "timestamp": "2026-01-01T00:00:00",
+    }}))
+
+    leaderboard = client.get("/api/leaderboard/").json()
+    assert [entry["id"] for entry in leaderboard] == ["remote-entry"]
+    assert client.get("/api/leaderboard/rank", params={"score": 100}).json()["rank"] == 2
+
+
+def test_remote_user_change_invalidates_principal(client: TestClient, db):
+    """Test a user changed on another worker is dropped from the principal cache"""
+    principal_cache.put_user(User(id="user-1", username="someone", email="someone@example.com", highScore=0))
+    event_bus._receive(remote(USER_CHANGED, {"user_id": "user-1"}))
+    assert principal_cache.get_user("user-1") is None
+
+
+def test_remote_sessions_are_mirrored_and_broadcast(client: TestClient, db):
+    """Test sessions created, updated and ended on another worker are mirrored and broadcast"""
+    session = {"id": "remote-session", "userId": "user-1", "username": "someone",
+               "score": 0, "mode": "walls", "isActive": True}
+    with client.websocket_connect("/api/ws/sessions") as websocket:
+        assert websocket.receive_json() == {"type": "snapshot", "sessions": []}
+
+        event_bus._receive(remote(SESSION_CREATED, {"session": session}))
+        assert websocket.receive_json() == {"type": "created", "session": session}
+        event_bus._receive(remote(SESSION_UPDATED, {"id": "remote-session", "score": 30}))
+        assert websocket.receive_json() == {"type": "updated", "id": "remote-session", "score": 30}
+
+        mirrored = live_sessions.get("remote-session")
+        assert mirrored.score == 30
+        # The worker that owns it checkpoints it
+        assert not mirrored.dirty
+
+        event_bus._receive(remote(SESSION_ENDED, {"id": "remote-session", "score": 30}))
+        assert websocket.receive_json() == {"type": "ended", "id": "remote-session", "score": 30}
+    assert live_sessions.get("remote-session") is None
@@ -1,6 +1,16 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
+from app.db_models import DBLeaderboardEntry, DBLeaderboardWindowSummary, DBUser, DBUserBestScore
+from app.services.async_database import async_db_service
 from app.services.database import db_service
-from app.models import GameMode
+from app.routers.leaderboard import stream_leaderboard
+from app.services.leaderboard_cache import TopK, leaderboard_cache, window_bounds
+from app.services.leaderboard_events import LeaderboardEvents
+from app.services.rank_index import ScoreRankIndex
+from app.models import GameMode, LeaderboardEntry, LeaderboardWindow
+from app.pagination import encode_cursor
 
 
 def test_get_leaderboard_empty(client: TestClient, db):
@@ -26,6 +36,22 @@ def test_get_leaderboard_with_data(client: TestClient, db):
     assert data[0]["score"] == 1000
 
 
+def test_leaderboard_bytes_match_the_standard_encoder(client: TestClient, db):
+    """Test the precompiled serializer writes what response_model and json.dumps would"""
+    user = db_service.create_user(db, "jöueur", "test@example.com", "password123")
+    for score in (1000, 900):
+        db_service.submit_score(db, user.id, user.username, score, GameMode.WALLS)
+    
+    for url in ("/api/leaderboard/?limit=1", "/api/leaderboard/?distinct=users"):
+        response = client.get(url)
+        assert response.headers["content-type"] == "application/json"
+        expected = [entry.model_dump(mode="json") for entry in (
+            db_service.get_best_scores(db) if "distinct" in url else db_service.get_leaderboard(db, limit=1)
+        )]
+        assert response.content == json.dumps(expected, ensure_ascii=False, separators=(",", ":")).encode()
+    assert "X-Next-Cursor" in client.get("/api/leaderboard/?limit=1").headers
+
+
 def test_get_leaderboard_with_mode_filter(client: TestClient, db):
     """Test get leaderboard with mode filter"""
     # Create user and submit scores for different modes
@@ -78,3 +104,383 @@ def test_submit_score(client: TestClient, db):
     entries = leaderboard_response.json()
     assert any(entry["score"] == 1000 for entry in entries)
 
+
+def test_get_leaderboard_is_ordered_by_score(client: TestClient, db):
+    """Test entries come back best first, per mode and across modes"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    for score, mode in [(300, GameMode.WALLS), (900, GameMode.PASS_THROUGH), (600, GameMode.WALLS)]:
+        db_service.submit_score(db, user.id, user.username, score, mode)
+    
+    all_modes = client.get("/api/leaderboard/").json()
+    assert [entry["score"] for entry in all_modes] == [900, 600, 300]
+    
+    walls = client.get("/api/leaderboard/?mode=walls").json()
+    assert [entry["score"] for entry in walls] == [600, 300]
+
+
+def test_get_leaderboard_is_served_from_cache(client: TestClient, db):
+    """Test reads come from the top-k cache once it is warm"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    db_service.submit_score(db, user.id, user.username, 100, GameMode.WALLS)
+    assert len(client.get("/api/leaderboard/").json()) == 1
+    
+    # A row written behind the service's back is not seen by the cache
+    db.add(DBLeaderboardEntry(user_id=user.id, username=user.username, score=5000, mode=GameMode.WALLS))
+    db.commit()
+    assert [entry["score"] for entry in client.get("/api/leaderboard/").json()] == [100]
+    
+    # Submissions through the service are
+    db_service.submit_score(db, user.id, user.username, 200, GameMode.WALLS)
+    assert [entry["score"] for entry in client.get("/api/leaderboard/").json()] == [200, 100]
+
+
+def test_get_leaderboard_pages_past_top_k(client: TestClient, db):
+    """Test cursor pagination walks the whole leaderboard in order"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    now = datetime(2025, 1, 1)
+    # Many ties on score and some on timestamp, so the id tiebreak matters
+    db.add_all([
+        DBLeaderboardEntry(
+            user_id=user.id,
+            username=user.username,
+            score=(i % 25) * 10,
+            mode=GameMode.WALLS if i % 3 else GameMode.PASS_THROUGH,
+            timestamp=now + timedelta(seconds=i % 7)
+        )
+        for i in range(250)
+    ])
+    db.commit()
+    
+    expected = [
+        entry.id for entry in db.query(DBLeaderboardEntry).order_by(
+            DBLeaderboardEntry.score.desc(), DBLeaderboardEntry.timestamp, DBLeaderboardEntry.id
+        )
+    ]
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 100}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/leaderboard/", params=params)
+        assert response.status_code == 200
+        seen += [entry["id"] for entry in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+    
+    # Pages inside the cached top 100 and past it agree with the database
+    first = client.get("/api/leaderboard/?mode=walls&limit=60")
+    second = client.get(f"/api/leaderboard/?mode=walls&limit=60&cursor={first.headers['X-Next-Cursor']}")
+    walls = [e.id for e in db_service.get_leaderboard(db, GameMode.WALLS, limit=120)]
+    assert [e["id"] for e in first.json() + second.json()] == walls
+
+
+def test_get_leaderboard_invalid_cursor(client: TestClient, db):
+    """Test a malformed cursor is rejected"""
+    response = client.get("/api/leaderboard/?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_get_leaderboard_cursor_with_offset(client: TestClient, db):
+    """Test a cursor timestamp with a UTC offset pages like its naive UTC time"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    now = datetime(2025, 1, 1)
+    entries = [
+        DBLeaderboardEntry(user_id=user.id, username=user.username, score=100, mode=GameMode.WALLS,
+                           timestamp=now + timedelta(seconds=i))
+        for i in range(3)
+    ]
+    db.add_all(entries)
+    db.commit()
+    
+    cursor = encode_cursor([100, "2025-01-01T02:00:01+02:00", entries[1].id])
+    response = client.get("/api/leaderboard/", params={"cursor": cursor})
+    assert response.status_code == 200
+    assert [entry["id"] for entry in response.json()] == [entries[2].id]
+
+
+def test_get_leaderboard_by_window(client: TestClient, db):
+    """Test day/week/month windows only rank scores from the current period"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    now = datetime.utcnow()
+    ages = [timedelta(0), timedelta(days=3), timedelta(days=10), timedelta(days=40), timedelta(days=400)]
+    for i, age in enumerate(ages):
+        db.add(DBLeaderboardEntry(
+            user_id=user.id, username=user.username, score=100 * (i + 1), mode=GameMode.WALLS, timestamp=now - age
+        ))
+    db.commit()
+    
+    for window in LeaderboardWindow:
+        start, end = window_bounds(window, now)
+        expected = sorted(
+            [100 * (i + 1) for i, age in enumerate(ages) if start is None or start <= now - age < end],
+            reverse=True
+        )
+        response = client.get(f"/api/leaderboard/?window={window.value}")
+        assert response.status_code == 200
+        assert [entry["score"] for entry in response.json()] == expected
+    
+    # New submissions land in every window
+    db_service.submit_score(db, user.id, user.username, 50, GameMode.WALLS)
+    assert 50 in [entry["score"] for entry in client.get("/api/leaderboard/?window=day").json()]
+
+
+def test_leaderboard_window_rolls_over_and_compacts(db, async_session_factory):
+    """Test a window reloads on a new period and the finished one is summarized"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    yesterday = today - timedelta(days=1)
+    for score, timestamp in [(300, yesterday), (200, yesterday), (100, today)]:
+        db.add(DBLeaderboardEntry(
+            user_id=user.id, username=user.username, score=score, mode=GameMode.WALLS, timestamp=timestamp
+        ))
+    db.commit()
+    
+    async def roll_over():
+        async with async_session_factory() as session:
+            await leaderboard_cache.load(session, LeaderboardWindow.DAY, now=yesterday)
+            yesterdays = [e.score for e in leaderboard_cache.top(window=LeaderboardWindow.DAY)]
+            rolled_over = await leaderboard_cache.load(session, LeaderboardWindow.DAY, now=today)
+            todays = [e.score for e in leaderboard_cache.top(window=LeaderboardWindow.DAY)]
+            written = await async_db_service.compact_leaderboard_window(session, LeaderboardWindow.DAY, rolled_over)
+            again = await async_db_service.compact_leaderboard_window(session, LeaderboardWindow.DAY, rolled_over)
+            return yesterdays, rolled_over, todays, written, again
+    
+    try:
+        yesterdays, rolled_over, todays, written, again = asyncio.run(roll_over())
+    finally:
+        leaderboard_cache.clear()
+    
+    assert yesterdays == [300, 200]
+    assert rolled_over == yesterday.replace(hour=0)
+    assert todays == [100]
+    # Ranked once across all modes and once for walls; nothing the second time
+    assert (written, again) == (4, 0)
+    summary = db.query(DBLeaderboardWindowSummary).filter(
+        DBLeaderboardWindowSummary.mode == GameMode.WALLS
+    ).order_by(DBLeaderboardWindowSummary.rank).all()
+    assert [(row.rank, row.score) for row in summary] == [(1, 300), (2, 200)]
+
+
+def test_missed_window_periods_are_compacted_and_served(client: TestClient, db, async_session_factory):
+    """Test every period that ended unseen is compacted, and finished periods are served from their summary"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    for days_ago, score in [(5, 500), (3, 300), (3, 250), (1, 100), (0, 50)]:
+        db.add(DBLeaderboardEntry(
+            user_id=user.id, username=user.username, score=score, mode=GameMode.WALLS,
+            timestamp=today - timedelta(days=days_ago)
+        ))
+    db.commit()
+
+    async def compact():
+        async with async_session_factory() as session:
+            return [await async_db_service.compact_leaderboard_windows(session, LeaderboardWindow.DAY) for _ in range(2)]
+
+    # Days 5, 3 and 1 ago, each ranked across all modes and for walls
+    assert asyncio.run(compact()) == [8, 0]
+    periods = {row.period_start for row in db.query(DBLeaderboardWindowSummary)}
+    assert periods == {(today - timedelta(days=days)).replace(hour=0) for days in (5, 3, 1)}
+
+    three_days_ago = (today - timedelta(days=3)).isoformat()
+    response = client.get("/api/leaderboard/", params={"window": "day", "period": three_days_ago, "limit": 1})
+    assert [e["score"] for e in response.json()] == [300]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/api/leaderboard/", params={
+        "window": "day", "period": three_days_ago, "mode": "walls", "cursor": cursor
+    })
+    assert [e["score"] for e in response.json()] == [250]
+    # The current period is served live
+    response = client.get("/api/leaderboard/", params={"window": "day", "period": today.isoformat()})
+    assert [e["score"] for e in response.json()] == [50]
+    response = client.get("/api/leaderboard/", params={"period": three_days_ago})
+    assert response.status_code == 400
+    response = client.get("/api/leaderboard/", params={"window": "day", "period": "9999-12-31T00:00:00"})
+    assert response.status_code == 400
+
+
+def test_get_leaderboard_distinct_users(client: TestClient, db):
+    """Test distinct=users returns one best entry per player"""
+    alice = db_service.create_user(db, "alice", "alice@example.com", "password123")
+    bob = db_service.create_user(db, "bob", "bob@example.com", "password123")
+    for user, score, mode in [
+        (alice, 500, GameMode.WALLS),
+        (alice, 900, GameMode.WALLS),
+        (alice, 700, GameMode.WALLS),
+        (alice, 800, GameMode.PASS_THROUGH),
+        (bob, 600, GameMode.WALLS),
+        (bob, 100, GameMode.PASS_THROUGH),
+    ]:
+        db_service.submit_score(db, user.id, user.username, score, mode)
+    
+    response = client.get("/api/leaderboard/?distinct=users")
+    assert response.status_code == 200
+    assert [(e["username"], e["score"], e["mode"]) for e in response.json()] == [
+        ("alice", 900, "walls"),
+        ("bob", 600, "walls"),
+    ]
+    
+    pass_through = client.get("/api/leaderboard/?distinct=users&mode=pass-through").json()
+    assert [(e["username"], e["score"]) for e in pass_through] == [("alice", 800), ("bob", 100)]
+    
+    # Pages continue from the cursor without repeating a player
+    first = client.get("/api/leaderboard/?distinct=users&limit=1")
+    second = client.get(f"/api/leaderboard/?distinct=users&limit=1&cursor={first.headers['X-Next-Cursor']}")
+    assert [e["username"] for e in first.json() + second.json()] == ["alice", "bob"]
+    
+    response = client.get("/api/leaderboard/?distinct=users&window=day")
+    assert response.status_code == 400
+
+
+def test_concurrent_submissions_keep_the_high_score(db, async_session_factory):
+    """Test concurrent submits for one user never lose the highest score"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    scores = [(i * 37) % 101 * 10 for i in range(40)]
+    
+    async def submit(score, mode):
+        async with async_session_factory() as session:
+            await async_db_service.submit_score(session, user.id, user.username, score, mode)
+    
+    async def submit_all():
+        await asyncio.gather(*[
+            submit(score, GameMode.WALLS if i % 2 else GameMode.PASS_THROUGH) for i, score in enumerate(scores)
+        ])
+    
+    try:
+        asyncio.run(submit_all())
+    finally:
+        leaderboard_cache.clear()
+    
+    db.expire_all()
+    assert db.get(DBUser, user.id).high_score == max(scores)
+    best = {row.mode: row.score for row in db.query(DBUserBestScore).filter(DBUserBestScore.user_id == user.id)}
+    assert best == {
+        GameMode.PASS_THROUGH: max(scores[0::2]),
+        GameMode.WALLS: max(scores[1::2]),
+    }
+    assert db.query(DBLeaderboardEntry).count() == len(scores)
+
+
+def parse_event(text: str) -> dict:
+    fields = dict(line.split(": ", 1) for line in text.strip().splitlines())
+    return {"id": fields["id"], "event": fields["event"], "data": json.loads(fields["data"])}
+
+
+def test_leaderboard_stream(db, async_session_factory):
+    """Test the SSE feed sends a snapshot, then rank changes, and resumes"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    for score in (300, 200, 100):
+        db_service.submit_score(db, user.id, user.username, score, GameMode.WALLS)
+    
+    async def stream(limit, last_event_id=None, submissions=()):
+        async with async_session_factory() as session:
+            response = await stream_leaderboard(mode=None, limit=limit, last_event_id=last_event_id, db=session)
+            events = response.body_iterator
+            received = [await events.__anext__()]
+            for score in submissions:
+                db_service.submit_score(db, user.id, user.username, score, GameMode.WALLS)
+            if submissions:
+                received.append(await events.__anext__())
+            await events.aclose()
+            return [parse_event(text) for text in received]
+    
+    try:
+        # 50 does not make the top 3, 250 takes second place
+        snapshot, change = asyncio.run(stream(3, submissions=(50, 250)))
+        assert snapshot["event"] == "snapshot"
+        assert [entry["score"] for entry in snapshot["data"]] == [300, 200, 100]
+        assert change["event"] == "rank"
+        assert (change["data"]["mode"], change["data"]["rank"], change["data"]["entry"]["score"]) == (None, 2, 250)
+        
+        # Resuming from the snapshot replays the missed change instead
+        assert asyncio.run(stream(3, last_event_id=snapshot["id"])) == [change]
+        
+        # Unknown ids get a new snapshot
+        assert asyncio.run(stream(3, last_event_id="gone-1"))[0]["event"] == "snapshot"
+    finally:
+        leaderboard_cache.clear()
+
+
+def test_leaderboard_events_buffer_is_bounded():
+    """Test resume falls back to a snapshot once missed events are evicted"""
+    events = LeaderboardEvents(buffer_size=2)
+    entry = LeaderboardEntry(id="e", username="p", score=10, mode=GameMode.WALLS, timestamp=datetime(2025, 1, 1))
+    start = events.last_event_id
+    events.publish(entry, [(None, 1), (GameMode.WALLS, 1)])
+    assert len(events.since(start, GameMode.WALLS, 10)) == 1
+    events.publish(entry, [(None, 1)])
+    assert events.since(start, None, 10) is None
+    assert events.since(events.last_event_id, None, 10) == []
+
+
+def test_top_k_keeps_best_entries():
+    """Test the top-k structure evicts the worst entry and breaks ties by time"""
+    top = TopK(3)
+    now = datetime(2025, 1, 1)
+    for i, score in enumerate([50, 10, 40, 30, 40]):
+        top.push(LeaderboardEntry(
+            id=f"entry-{i}",
+            username="player",
+            score=score,
+            mode=GameMode.WALLS,
+            timestamp=now + timedelta(seconds=i)
+        ))
+    
+    assert [entry.id for entry in top.entries()] == ["entry-0", "entry-2", "entry-4"]
+
+
+def test_get_score_rank(client: TestClient, db):
+    """Test the rank of an arbitrary score per mode and across modes"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    for score, mode in [(300, GameMode.WALLS), (900, GameMode.PASS_THROUGH), (600, GameMode.WALLS)]:
+        db_service.submit_score(db, user.id, user.username, score, mode)
+    
+    response = client.get("/api/leaderboard/rank?score=600")
+    assert response.status_code == 200
+    assert response.json() == {"mode": None, "score": 600, "rank": 2, "total": 3}
+    
+    data = client.get("/api/leaderboard/rank?score=1000&mode=walls").json()
+    assert data["rank"] == 1
+    assert data["total"] == 2
+    
+    # Entries submitted after the index is loaded are counted
+    db_service.submit_score(db, user.id, user.username, 700, GameMode.WALLS)
+    assert client.get("/api/leaderboard/rank?score=600&mode=walls").json()["rank"] == 2
+
+
+def test_get_my_rank(client: TestClient, db):
+    """Test the rank of the current user's best score"""
+    other = db_service.create_user(db, "other", "other@example.com", "password123")
+    db_service.submit_score(db, other.id, other.username, 800, GameMode.WALLS)
+    
+    signup_response = client.post("/api/auth/signup", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    headers = {"Authorization": f"Bearer {signup_response.json()['token']}"}
+    assert client.get("/api/leaderboard/me/rank", headers=headers).status_code == 404
+    
+    client.post("/api/leaderboard/", json={"score": 500, "mode": "walls"}, headers=headers)
+    client.post("/api/leaderboard/", json={"score": 900, "mode": "walls"}, headers=headers)
+    
+    data = client.get("/api/leaderboard/me/rank?mode=walls", headers=headers).json()
+    assert data["score"] == 900
+    assert data["rank"] == 1
+    assert data["total"] == 3
+
+
+def test_score_rank_index_counts_entries_above():
+    """Test the Fenwick-backed index against a plain count"""
+    scores = [0, 10, 10, 50, 4095, 4096, 10 ** 7, -5]
+    index = ScoreRankIndex(capacity=16, max_capacity=1 << 13)
+    for score in scores:
+        index.add(score)
+    built = ScoreRankIndex.from_histogram([(s, 1) for s in scores], max_capacity=1 << 13)
+    
+    for probe in [-1, 0, 5, 10, 49, 50, 4095, 4096, 5000, 10 ** 7, 10 ** 8]:
+        expected = sum(1 for s in scores if max(s, 0) > probe) + 1
+        assert index.rank(probe) == expected
+        assert built.rank(probe) == expected
@@ -0,0 +1,87 @@
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from app.engine.replay_format import decode_replay, encode_replay
+from app.engine.simulator import InvalidReplay
+from app.models import GameMode
+from app.routers import leaderboard as leaderboard_router
+from app.services.replay_archive import ReplayArchive
+from test_engine import random_moves
+
+
+def test_replay_format_round_trips():
+    """Test replays decode to what was encoded, in about a quarter of the text's size"""
+    for seed, ticks in [(0, 0), (1, 1), (0xFFFFFFFF, 4000), (12345, 20000)]:
+        moves = random_moves(seed, ticks)
+        encoded = encode_replay(seed, moves, GameMode.PASS_THROUGH)
+        assert decode_replay(encoded) == (seed, moves, GameMode.PASS_THROUGH)
+    # About two bits and a byte of tick delta per press
+    moves = random_moves(3, 4000)
+    assert len(encode_replay(3, moves, GameMode.WALLS)) < len(moves) / 4
+
+
+def test_corrupt_replays_are_rejected():
+    """Test truncated, padded or mislabelled replays fail to decode"""
+    encoded = encode_replay(7, "..U..L.R", GameMode.WALLS)
+    for corrupt in (b"", b"XXXX" + encoded[4:], encoded[:-1], encoded + b"\0"):
+        with pytest.raises(InvalidReplay):
+            decode_replay(corrupt)
+
+
+def test_archive_is_shared_between_processes(tmp_path):
+    """Test an archive finds replays another instance appended, across segments"""
+    writer = ReplayArchive(str(tmp_path), segment_bytes=100)
+    reader = ReplayArchive(str(tmp_path))
+    replays = {str(uuid.uuid4()): bytes([i]) * 60 for i in range(5)}
+    for entry_id, replay in replays.items():
+        writer.append(entry_id, replay)
+
+    assert len(list(tmp_path.glob("*.seg"))) == 3
+    for entry_id, replay in replays.items():
+        assert reader.get(entry_id) == replay
+    assert reader.get(str(uuid.uuid4())) is None
+    assert reader.get("not-an-id") is None
+
+
+def test_replay_endpoint_supports_ranges(client: TestClient, tmp_path, monkeypatch):
+    """Test the replay endpoint serves whole replays, byte ranges, 416 and 404"""
+    archive = ReplayArchive(str(tmp_path))
+    monkeypatch.setattr(leaderboard_router, "replay_archive", archive)
+    entry_id = str(uuid.uuid4())
+    replay = encode_replay(41, random_moves(41, 2000), GameMode.WALLS)
+    archive.append(entry_id, replay)
+
+    response = client.get(f"/api/leaderboard/{entry_id}/replay")
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == replay
+
+    response = client.get(f"/api/leaderboard/{entry_id}/replay", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 10-19/{len(replay)}"
+    assert response.content == replay[10:20]
+
+    response = client.get(f"/api/leaderboard/{entry_id}/replay", headers={"Range": "bytes=-5"})
+    assert response.content == replay[-5:]
+    response = client.get(f"/api/leaderboard/{entry_id}/replay", headers={"Range": f"bytes={len(replay)}-"})
+    assert response.status_code == 416
+    assert client.get(f"/api/leaderboard/{uuid.uuid4()}/replay").status_code == 404
+
+
+def test_batches_and_throttled_refreshes(tmp_path):
+    """Test a batch of replays is appended across segments, and misses only reread the index now and then"""
+    writer = ReplayArchive(str(tmp_path), segment_bytes=100)
+    reader = ReplayArchive(str(tmp_path), refresh_seconds=60)
+    assert reader.get(str(uuid.uuid4())) is None
+
+    replays = {str(uuid.uuid4()): bytes([i]) * 60 for i in range(5)}
+    writer.append_many(replays.items())
+    assert len(list(tmp_path.glob("*.seg"))) == 3
+    for entry_id, replay in replays.items():
+        assert writer.get(entry_id) == replay
+        # Archived since the reader's last refresh, which was too recent
+        assert reader.get(entry_id) is None
+
+    reader.refresh_seconds = 0
+    for entry_id, replay in replays.items():
+        assert reader.get(entry_id) == replay
@@ -1,4 +1,29 @@
+import asyncio
+import random
+import pytest
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from app.db_models import DBGameSession
+from app.models import GameMode
+from app.engine.simulator import Game, simulate
+from app.routers import sessions as sessions_router
+from app.services.bot_opponents import BotOpponents
+from app.services.database import db_service
+from app.services.input_relay import RelayBuffer, input_relay
+from app.services.live_sessions import LiveSession, SessionCursor, SortedKeys, live_sessions
+from app.services.session_broadcast import SPECTATOR_QUEUE_SIZE, SessionBroadcaster
+from app.services.session_reaper import SessionReaper
+from app.services.session_ingest import ACK_FRAME, SCORE_FRAME, InvalidFrame, ScoreIngest
+
+
+def signup_headers(client: TestClient) -> dict:
+    response = client.post("/api/auth/signup", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "password123"
+    })
+    return {"Authorization": f"Bearer {response.json()['token']}"}
 
 
 def test_get_active_sessions_empty(client: TestClient, db):
@@ -101,3 +126,365 @@ def test_get_nonexistent_session(client: TestClient, db):
     response = client.get("/api/sessions/nonexistent-id")
     assert response.status_code == 404
 
+
+
+def test_live_scores_are_checkpointed(client: TestClient, db, async_session_factory):
+    """Test score updates stay in memory until a checkpoint or the end of the session"""
+    headers = signup_headers(client)
+    first = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    second = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    
+    for score in (10, 20, 30):
+        client.put(f"/api/sessions/{first}", json={"score": score}, headers=headers)
+    client.put(f"/api/sessions/{second}", json={"score": 50}, headers=headers)
+    
+    assert client.get(f"/api/sessions/{first}").json()["score"] == 30
+    assert {s["id"]: s["score"] for s in client.get("/api/sessions/").json()} == {first: 30, second: 50}
+    assert db.get(DBGameSession, first).score == 0
+    
+    async def checkpoint():
+        async with async_session_factory() as session:
+            return await live_sessions.checkpoint(session), await live_sessions.checkpoint(session)
+    
+    assert asyncio.run(checkpoint()) == (2, 0)
+    db.expire_all()
+    assert (db.get(DBGameSession, first).score, db.get(DBGameSession, second).score) == (30, 50)
+    
+    # Ending writes the final score even without a checkpoint
+    client.put(f"/api/sessions/{second}", json={"score": 70}, headers=headers)
+    client.delete(f"/api/sessions/{second}", headers=headers)
+    db.expire_all()
+    ended = db.get(DBGameSession, second)
+    assert (ended.score, ended.is_active) == (70, False)
+    assert [s["id"] for s in client.get("/api/sessions/").json()] == [first]
+
+
+def test_active_sessions_are_paged_by_score(client: TestClient, db, async_session_factory):
+    """Test the session listing filters, orders by score and pages with a cursor"""
+    headers = signup_headers(client)
+    scores = {"walls": [30, 10, 50], "pass-through": [40, 20]}
+    for mode, mode_scores in scores.items():
+        for score in mode_scores:
+            session_id = client.post("/api/sessions/", json={"mode": mode}, headers=headers).json()["id"]
+            client.put(f"/api/sessions/{session_id}", json={"score": score}, headers=headers)
+    
+    first = client.get("/api/sessions/", params={"limit": 2})
+    assert [s["score"] for s in first.json()] == [50, 40]
+    second = client.get("/api/sessions/", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [s["score"] for s in second.json()] == [30, 20]
+    third = client.get("/api/sessions/", params={"limit": 2, "cursor": second.headers["X-Next-Cursor"]})
+    assert [s["score"] for s in third.json()] == [10]
+    assert "X-Next-Cursor" not in third.headers
+    
+    walls = client.get("/api/sessions/", params={"mode": "walls", "min_score": 30}).json()
+    assert [s["score"] for s in walls] == [50, 30]
+    assert client.get("/api/sessions/", params={"cursor": "not-a-cursor"}).status_code == 400
+    
+    assert client.get("/api/sessions/count").json() == {"mode": None, "count": 5}
+    assert client.get("/api/sessions/count", params={"mode": "walls"}).json() == {"mode": "walls", "count": 3}
+    
+    # The database listing orders and pages the same way
+    async def checkpoint():
+        async with async_session_factory() as session:
+            await live_sessions.checkpoint(session)
+    
+    asyncio.run(checkpoint())
+    page = db_service.get_active_sessions(db, min_score=20, limit=2, cursor=SessionCursor(40, "~"))
+    assert [s.score for s in page] == [30, 20]
+    assert db_service.count_active_sessions(db, GameMode.PASS_THROUGH) == 2
+
+
+def test_idle_sessions_are_reaped(client: TestClient, db, async_session_factory):
+    """Test sessions without a heartbeat past the idle timeout are ended in batches"""
+    headers = signup_headers(client)
+    ids = [client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"] for _ in range(3)]
+    client.put(f"/api/sessions/{ids[0]}", json={"score": 40}, headers=headers)
+    reaper = SessionReaper(session_factory=async_session_factory, idle_timeout=60, batch_size=1)
+    
+    async def checkpoint_and_reap():
+        async with async_session_factory() as session:
+            await live_sessions.checkpoint(session)
+            return await reaper.reap(session)
+    
+    # Nothing is idle yet
+    assert asyncio.run(checkpoint_and_reap()) == 0
+    
+    # The checkpoint is the first session's heartbeat
+    db.query(DBGameSession).update({"updated_at": datetime.utcnow() - timedelta(minutes=5)})
+    db.commit()
+    client.put(f"/api/sessions/{ids[0]}", json={"score": 50}, headers=headers)
+    assert asyncio.run(checkpoint_and_reap()) == 2
+    
+    assert [s["id"] for s in client.get("/api/sessions/").json()] == [ids[0]]
+    db.expire_all()
+    assert [db.get(DBGameSession, session_id).is_active for session_id in ids] == [True, False, False]
+
+
+def test_sorted_keys_match_a_sorted_list():
+    """Test sorted keys split into chunks keep the order and slices of one sorted list"""
+    rng = random.Random(7)
+    keys = SortedKeys(load=4)
+    expected = []
+    for _ in range(2000):
+        if expected and rng.random() < 0.4:
+            key = expected.pop(rng.randrange(len(expected)))
+            keys.remove(key)
+        else:
+            key = (-rng.randrange(50), str(rng.random()))
+            keys.add(key)
+            expected = sorted(expected + [key])
+        assert len(keys) == len(expected)
+    assert keys.between() == expected
+    for after, upto in [(expected[10], None), (None, (-25, "\uffff")), (expected[5], expected[30]), (expected[-1], None)]:
+        ranked = [key for key in expected if (after is None or key > after) and (upto is None or key <= upto)]
+        assert keys.between(after, upto, limit=7) == ranked[:7]
+    assert keys.between((-10, "0.5"), limit=100) == [key for key in expected if key > (-10, "0.5")][:100]
+
+
+def test_sessions_from_the_database_are_adopted(client: TestClient, db):
+    """Test active sessions written by another process are served and updated"""
+    headers = signup_headers(client)
+    user_id = client.get("/api/auth/me", headers=headers).json()["id"]
+    session = DBGameSession(user_id=user_id, username="testuser", score=5, mode=GameMode.WALLS, is_active=True)
+    db.add(session)
+    db.commit()
+    
+    assert [s["id"] for s in client.get("/api/sessions/").json()] == [session.id]
+    assert client.put(f"/api/sessions/{session.id}", json={"score": 15}, headers=headers).status_code == 200
+    assert isinstance(live_sessions.get(session.id), LiveSession)
+    assert live_sessions.get(session.id).score == 15
+
+
+def test_spectate_all_sessions(client: TestClient, db):
+    """Test the session list stream sends a snapshot and then deltas"""
+    headers = signup_headers(client)
+    existing = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    
+    with client.websocket_connect("/api/ws/sessions") as websocket:
+        snapshot = websocket.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert [s["id"] for s in snapshot["sessions"]] == [existing]
+        
+        created = client.post("/api/sessions/", json={"mode": "pass-through"}, headers=headers).json()["id"]
+        message = websocket.receive_json()
+        assert (message["type"], message["session"]["id"]) == ("created", created)
+        
+        client.put(f"/api/sessions/{created}", json={"score": 40}, headers=headers)
+        assert websocket.receive_json() == {"type": "updated", "id": created, "score": 40}
+        
+        client.delete(f"/api/sessions/{existing}", headers=headers)
+        assert websocket.receive_json() == {"type": "ended", "id": existing, "score": 0}
+
+
+def test_spectate_one_session(client: TestClient, db):
+    """Test a session stream only carries that session and closes when it ends"""
+    headers = signup_headers(client)
+    watched = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    other = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    
+    with client.websocket_connect(f"/api/ws/sessions/{watched}") as websocket:
+        assert websocket.receive_json()["session"]["id"] == watched
+        client.put(f"/api/sessions/{other}", json={"score": 99}, headers=headers)
+        client.put(f"/api/sessions/{watched}", json={"score": 10}, headers=headers)
+        assert websocket.receive_json() == {"type": "updated", "id": watched, "score": 10}
+        client.delete(f"/api/sessions/{watched}", headers=headers)
+        assert websocket.receive_json() == {"type": "ended", "id": watched, "score": 10}
+        assert websocket.receive()["type"] == "websocket.close"
+
+
+def test_spectate_unknown_session(client: TestClient, db):
+    """Test watching a session that does not exist is refused"""
+    with client.websocket_connect("/api/ws/sessions/nonexistent-id") as websocket:
+        message = websocket.receive()
+        assert (message["type"], message["code"]) == ("websocket.close", 4404)
+
+
+def test_broadcast_serializes_once_and_drops_slow_spectators():
+    """Test every spectator gets the same text and a full queue disconnects"""
+    async def fan_out():
+        broadcaster = SessionBroadcaster()
+        subscribers = [broadcaster.subscribe() for _ in range(1000)]
+        watcher = broadcaster.subscribe("session-1")
+        broadcaster.updated("session-1", 10)
+        texts = {id(subscriber.queue.get_nowait()) for subscriber in subscribers + [watcher]}
+        
+        for score in range(SPECTATOR_QUEUE_SIZE + 1):
+            broadcaster.updated("session-1", score)
+        return len(texts), watcher.dropped, watcher.queue.get_nowait()
+    
+    assert asyncio.run(fan_out()) == (1, True, None)
+
+
+def test_score_ingest_coalesces_and_rejects_stale_frames():
+    """Test frames coalesce to the latest score and older or malformed frames are refused"""
+    ingest = ScoreIngest("session")
+    assert ingest.accept(SCORE_FRAME.pack(ingest.slot, 1, 10))
+    assert ingest.accept(SCORE_FRAME.pack(ingest.slot, 3, 30))
+    assert not ingest.accept(SCORE_FRAME.pack(ingest.slot, 2, 20))
+    assert ingest.take() == 30
+    assert ingest.take() is None
+    assert ACK_FRAME.unpack(ingest.ack()) == (ingest.slot, 3)
+    with pytest.raises(InvalidFrame):
+        ingest.accept(SCORE_FRAME.pack(ingest.slot + 1, 4, 40))
+    with pytest.raises(InvalidFrame):
+        ingest.accept(b"\x00")
+
+
+def test_binary_score_ingest(client: TestClient, db):
+    """Test scores sent as binary frames are acknowledged and applied, until the session ends"""
+    headers = signup_headers(client)
+    session_id = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    token = headers["Authorization"].removeprefix("Bearer ")
+
+    with client.websocket_connect(f"/api/sessions/{session_id}/ingest") as websocket:
+        websocket.send_json({"token": token})
+        ready = websocket.receive_json()
+        assert ready["type"] == "ready"
+        for sequence, score in [(1, 10), (2, 20), (3, 30)]:
+            websocket.send_bytes(SCORE_FRAME.pack(ready["slot"], sequence, score))
+        applied = 0
+        while applied < 3:
+            _, applied = ACK_FRAME.unpack(websocket.receive_bytes())
+        assert client.get(f"/api/sessions/{session_id}").json()["score"] == 30
+
+        # Ending the session closes the channel
+        client.delete(f"/api/sessions/{session_id}", headers=headers)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_bytes()
+        assert closed.value.code == 1000
+
+
+def test_binary_score_ingest_rejections(client: TestClient, db):
+    """Test the ingest channel closes on a bad token, an unknown session or a malformed frame"""
+    headers = signup_headers(client)
+    session_id = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    token = headers["Authorization"].removeprefix("Bearer ")
+
+    with client.websocket_connect(f"/api/sessions/{session_id}/ingest") as websocket:
+        websocket.send_json({"token": "not a token"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+        assert closed.value.code == 4401
+
+    with client.websocket_connect("/api/sessions/unknown/ingest") as websocket:
+        websocket.send_json({"token": token})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+        assert closed.value.code == 4404
+
+    with client.websocket_connect(f"/api/sessions/{session_id}/ingest") as websocket:
+        websocket.send_json({"token": token})
+        websocket.receive_json()
+        websocket.send_bytes(b"short")
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_bytes()
+        assert closed.value.code == 1003
+
+
+def test_spectators_catch_up_from_the_latest_keyframe(client: TestClient, db, monkeypatch):
+    """Test a spectator joining mid-game gets a keyframe and the moves since, then follows live"""
+    monkeypatch.setattr(input_relay, "keyframe_ticks", 5)
+    headers = signup_headers(client)
+    session_id = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    token = headers["Authorization"].removeprefix("Bearer ")
+    
+    with client.websocket_connect(f"/api/sessions/{session_id}/inputs") as player, \
+            client.websocket_connect(f"/api/ws/sessions/{session_id}/inputs") as early:
+        player.send_json({"token": token, "seed": 41})
+        assert player.receive_json() == {"type": "ready"}
+        assert early.receive_json()["type"] == "keyframe"
+        # Seed 41 puts the first food seven cells ahead; the keyframe is due on tick 5
+        player.send_text("...")
+        player.send_text("....")
+        assert early.receive_json() == {"type": "inputs", "id": session_id, "tick": 0, "moves": "..."}
+        assert early.receive_json()["moves"] == "...."
+        keyframe = early.receive_json()["keyframe"]
+        player.send_text("DD")
+        assert early.receive_json()["tick"] == 7
+        
+        game = Game(41, GameMode.WALLS)
+        for key in ".......":
+            game.step(key)
+        assert keyframe == game.state()
+        assert keyframe["score"] == 10
+        assert client.get(f"/api/sessions/{session_id}").json()["score"] == 10
+        
+        with client.websocket_connect(f"/api/ws/sessions/{session_id}/inputs") as late:
+            assert late.receive_json() == {"type": "catchup", "id": session_id, "keyframe": keyframe, "moves": "DD"}
+            # Heading down from row 12: the eighth move hits the wall
+            player.send_text(".....")
+            assert late.receive_json()["moves"] == "....."
+            assert not late.receive_json()["keyframe"]["gameOver"]
+            player.send_text("...")
+            assert late.receive_json()["moves"] == "..."
+            assert late.receive_json()["keyframe"]["gameOver"]
+            with pytest.raises(WebSocketDisconnect) as closed:
+                player.receive_json()
+            assert closed.value.code == 1000
+            
+            client.delete(f"/api/sessions/{session_id}", headers=headers)
+            assert late.receive_json() == {"type": "ended", "id": session_id, "score": 10}
+            assert late.receive()["type"] == "websocket.close"
+
+
+def test_relayed_frames_are_bounded(client: TestClient, db, monkeypatch):
+    """Test a frame of more moves than there are ticks between keyframes closes the channel"""
+    monkeypatch.setattr(input_relay, "keyframe_ticks", 5)
+    headers = signup_headers(client)
+    session_id = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    token = headers["Authorization"].removeprefix("Bearer ")
+
+    with client.websocket_connect(f"/api/sessions/{session_id}/inputs") as player:
+        player.send_json({"token": token, "seed": 41})
+        assert player.receive_json() == {"type": "ready"}
+        player.send_text("." * 5)
+        player.send_text("." * 6)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            player.receive_json()
+        assert closed.value.code == 1009
+    assert client.get(f"/api/sessions/{session_id}").json()["score"] == 0
+
+
+def test_relay_buffer_is_bounded():
+    """Test a relay buffer drops what it holds once more moves arrive than it fits"""
+    buffer = RelayBuffer(capacity=4)
+    buffer.add(0, "..")
+    assert buffer.catch_up() is None
+    buffer.set_keyframe({"tick": 10})
+    buffer.add(8, "...U")  # the first two moves are in the keyframe
+    assert buffer.catch_up() == {"keyframe": {"tick": 10}, "moves": ".U"}
+    # More moves than fit before the next keyframe: nothing to catch up from
+    buffer.add(12, "...")
+    assert buffer.catch_up() is None
+
+
+def test_play_against_a_bot(client: TestClient, db, monkeypatch):
+    """Test the bot's moves replay to the game it reports, and that bots run out"""
+    monkeypatch.setattr(sessions_router, "bot_opponents", BotOpponents(max_games=1, batch_ms=0))
+    headers = signup_headers(client)
+    session_id = client.post("/api/sessions/", json={"mode": "walls"}, headers=headers).json()["id"]
+    token = headers["Authorization"].removeprefix("Bearer ")
+    
+    with client.websocket_connect(f"/api/sessions/{session_id}/bot") as bot:
+        bot.send_json({"token": token, "seed": 41})
+        assert bot.receive_json() == {"type": "ready"}
+        with client.websocket_connect(f"/api/sessions/{session_id}/bot") as second:
+            second.send_json({"token": token, "seed": 41})
+            with pytest.raises(WebSocketDisconnect) as closed:
+                second.receive_json()
+            assert closed.value.code == 1013
+        
+        moves = ""
+        for count in (1, 1, 100):
+            bot.send_text(str(count))
+            message = bot.receive_json()
+            assert message == {"type": "moves", "tick": len(moves), "moves": message["moves"]}
+            moves += message["moves"]
+        assert len(moves) == 102
+        assert simulate(41, moves, GameMode.WALLS).score >= 30
+        
+        bot.send_text("0")
+        with pytest.raises(WebSocketDisconnect) as closed:
+            bot.receive_json()
+        assert closed.value.code == 1003
+
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app.db_models import DBLeaderboardEntry, DBUser, DBUserBestScore
+from app.models import GameMode
+from app.routers import leaderboard as leaderboard_router
+from app.services.database import db_service
+from app.services.leaderboard_cache import leaderboard_cache
+from app.services.write_behind import DEAD_LETTER_FILE, ScoreWriteBehind, WriteBehindFull
+
+
+def spilled_files(spill_dir):
+    return [
+        os.path.join(root, name)
+        for root, _, names in os.walk(spill_dir)
+        for name in names
+        if name.endswith(".jsonl")
+    ]
+
+
+def test_submissions_are_visible_before_they_are_written(client: TestClient, db, async_session_factory, tmp_path):
+    """Test accepted scores rank immediately and reach the database on flush"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    assert client.get("/api/leaderboard/").json() == []
+    writer = ScoreWriteBehind(async_session_factory, spill_dir=str(tmp_path), batch_size=2)
+    
+    for score, mode in [(300, GameMode.WALLS), (700, GameMode.WALLS), (500, GameMode.PASS_THROUGH)]:
+        writer.submit(user.id, user.username, score, mode)
+    
+    assert [e["score"] for e in client.get("/api/leaderboard/").json()] == [700, 500, 300]
+    assert db.query(DBLeaderboardEntry).count() == 0
+    assert len(spilled_files(tmp_path)) == 1
+    
+    assert asyncio.run(writer.flush()) == 3
+    db.expire_all()
+    assert sorted(e.score for e in db.query(DBLeaderboardEntry)) == [300, 500, 700]
+    assert db.get(DBUser, user.id).high_score == 700
+    best = {row.mode: row.score for row in db.query(DBUserBestScore)}
+    assert best == {GameMode.WALLS: 700, GameMode.PASS_THROUGH: 500}
+    assert spilled_files(tmp_path) == []
+
+
+def test_spilled_submissions_are_replayed(db, async_session_factory, tmp_path):
+    """Test scores accepted by a crashed process are written on the next start"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    crashed = ScoreWriteBehind(async_session_factory, spill_dir=str(tmp_path))
+    accepted = [crashed.submit(user.id, user.username, score, GameMode.WALLS).id for score in (100, 200)]
+    # Simulate a write torn by the crash, and the crash releasing the lock
+    with open(spilled_files(tmp_path)[0], "a") as spill:
+        spill.write('{"user_id": "')
+    crashed._dir_lock.close()
+    
+    async def restart():
+        writer = ScoreWriteBehind(async_session_factory, spill_dir=str(tmp_path))
+        await writer.start()
+        await writer.stop()
+    
+    try:
+        asyncio.run(restart())
+    finally:
+        leaderboard_cache.clear()
+    
+    db.expire_all()
+    assert sorted(e.id for e in db.query(DBLeaderboardEntry)) == sorted(accepted)
+    assert db.get(DBUser, user.id).high_score == 200
+    assert spilled_files(tmp_path) == []
+
+
+def test_live_spill_directories_are_not_adopted(db, async_session_factory, tmp_path):
+    """Test a starting process leaves another running process's spill files alone"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    running = ScoreWriteBehind(async_session_factory, spill_dir=str(tmp_path))
+    running.submit(user.id, user.username, 100, GameMode.WALLS)
+    
+    async def start_another():
+        writer = ScoreWriteBehind(async_session_factory, spill_dir=str(tmp_path))
+        await writer.start()
+        await writer.stop()
+    
+    try:
+        asyncio.run(start_another())
+        assert db.query(DBLeaderboardEntry).count() == 0
+        assert len(spilled_files(tmp_path)) == 1
+        assert asyncio.run(running.flush()) == 1
+    finally:
+        leaderboard_cache.clear()
+
+
+def test_failed_batches_are_written_row_by_row(db, async_session_factory, tmp_path, monkeypatch):
+    """Test a row the database rejects is dead-lettered and the rest of its batch written"""
+    user = db_service.create_user(db, "testuser", "test@example.com", "password123")
+    writer = ScoreWriteBehind(async_session_factory, spill_dir=str(tmp_path))
+    write = writer._write
+    down = True
+
+    async def failing_write(batch):
+        if down:
+            raise OperationalError("INSERT", {}, Exception("connection lost"))
+        if any(entry.score == 666 for _, entry in batch):
+            raise IntegrityError("INSERT", {}, Exception("rejected"))
+        await write(batch)
+
+    monkeypatch.setattr(writer, "_write", failing_write)
+    try:
+        for score in (100, 666, 300):
+            writer.submit(user.id, user.username, score, GameMode.WALLS)
+        # The database is down: everything is kept for the next flush
+        with pytest.raises(OperationalError):
+            asyncio.run(writer.flush())
+        assert writer.pending == 3
+        down = False
+        assert asyncio.run(writer.flush()) == 2
+    finally:
+        leaderboard_cache.clear()
+
+    db.expire_all()
+    assert sorted(e.score for e in db.query(DBLeaderboardEntry)) == [100, 300]
+    assert writer.pending == 0
+    assert spilled_files(tmp_path) == [str(tmp_path / DEAD_LETTER_FILE)]
+    with open(tmp_path / DEAD_LETTER_FILE) as dead_letter:
+        [record] = [json.loads(line) for line in dead_letter]
+    assert (record["score"], record["user_id"], record["error"]) == (666, user.id, "rejected")
+
+
+def test_pending_submissions_are_capped(client: TestClient, db, tmp_path, monkeypatch):
+    """Test submissions beyond max_pending are refused with 503 until a flush"""
+    writer = ScoreWriteBehind(spill_dir=str(tmp_path), max_pending=2, enabled=True)
+    monkeypatch.setattr(leaderboard_router, "score_write_behind", writer)
+    response = client.post("/api/auth/signup", json={
+        "username": "testuser", "email": "test@example.com", "password": "password123"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    statuses = [
+        client.post("/api/leaderboard/", json={"score": score, "mode": "walls"}, headers=headers).status_code
+        for score in (100, 200, 300)
+    ]
+    assert statuses == [200, 200, 503]
+    with pytest.raises(WriteBehindFull):
+        writer.submit("user", "testuser", 400, GameMode.WALLS)
+    assert writer.pending == 2
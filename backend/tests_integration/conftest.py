@@ -11,9 +11,17 @@ import os
 import tempfile
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app as fastapi_app
-from app.database import Base, get_db
+from app.database import Base, get_db, get_async_db, get_async_database_url
+from app.services.leaderboard_cache import leaderboard_cache
+from app.services.leaderboard_events import leaderboard_events
+from app.services.live_sessions import live_sessions
+from app.services.session_broadcast import session_broadcaster
+from app.services.principal_cache import principal_cache
+from app.services.rank_index import rank_index
 import app.db_models  # noqa: F401
 
 
@@ -45,6 +53,16 @@ def SessionLocal(engine):
     return sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture(scope="module")
+def AsyncSessionLocal(engine, test_db_file):
+    """Create async session factory against the same database file"""
+    async_engine = create_async_engine(
+        get_async_database_url(f"sqlite:///{test_db_file}"),
+        poolclass=NullPool
+    )
+    return async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
 @pytest.fixture
 def db_session(SessionLocal):
     """Create a fresh database session for each test"""
@@ -56,7 +74,7 @@ def db_session(SessionLocal):
 
 
 @pytest.fixture
-def client(db_session):
+def client(db_session, AsyncSessionLocal):
     """Create a test client with database dependency override"""
     def override_get_db():
         try:
@@ -64,6 +82,17 @@ def client(db_session):
         finally:
             pass
     
+    async def override_get_async_db():
+        async with AsyncSessionLocal() as session:
+            yield session
+    
     fastapi_app.dependency_overrides[get_db] = override_get_db
+    fastapi_app.dependency_overrides[get_async_db] = override_get_async_db
     yield TestClient(fastapi_app)
     fastapi_app.dependency_overrides.clear()
+    principal_cache.clear()
+    leaderboard_cache.clear()
+    leaderboard_events.clear()
+    live_sessions.clear()
+    session_broadcaster.clear()
+    rank_index.clear()
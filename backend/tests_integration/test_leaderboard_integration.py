@@ -94,7 +94,8 @@ def test_score_submission_updates_high_score(client: TestClient, db_session):
     # Submit higher score
     client.post("/api/leaderboard/", json={"score": 1000, "mode": "walls"}, headers=headers)
     
-    # High score should be updated
+    # High score should be updated (the API writes through its own session)
+    db_session.expire_all()
     user = db_service.get_user_by_id(db_session, user_id)
     assert user.high_score == 1000
     
@@ -102,6 +103,7 @@ def test_score_submission_updates_high_score(client: TestClient, db_session):
     client.post("/api/leaderboard/", json={"score": 300, "mode": "walls"}, headers=headers)
     
     # High score should remain 1000
+    db_session.expire_all()
     user = db_service.get_user_by_id(db_session, user_id)
     assert user.high_score == 1000
 